@@ -0,0 +1,378 @@
+"""蒙特卡洛批量模拟：按不同配置和策略在进程池中模拟大量整场游戏，统计存活时间的分布
+
+用法：python batch_runner.py --trials 1000 --policy bot \
+          --set game_rules.damage.cube_collision 5 10 20 --set cube_movement.base_speed 3 4.5 --output balance.json
+
+每场游戏从第一局开始，直到游戏结束、胜利或达到 --max-time。模拟只使用 GameState、CubeSwarm 和胶囊/立方体
+精确碰撞测试，不创建场景图（所有立方体每步推进，不使用分块加载和 LOD）。
+
+每个任务把一批游戏放在同一个 CubeSwarm 中同步推进（立方体之间互不影响，每场游戏占连续的一段行），
+立方体推进和碰撞检测每步对整批只做一次数组运算，逐场的 Python 开销只剩游戏规则本身。
+一批游戏共用立方体的随机数流，结果由这一批的种子列表决定（相同的 --seed 和 --batch 可以复现）。
+"""
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from collision import capsule_box_overlap, swept_capsule_box_toi
+from cube_swarm import CubeSwarm, layout_positions
+from game_state import GameState
+from settings import load_settings
+from sim_input import KEYS, default_script
+
+CONFIG_PATH = Path(__file__).parent / "config.yaml"
+
+# 存活时间直方图的区间宽度（秒）
+HISTOGRAM_BIN = 10.0
+
+# 扣血的事件 → 统计时的来源（二段跳消耗生命值）
+DAMAGE_SOURCES = {
+    'hit': 'cube',
+    'boundary_damage': 'boundary',
+    'boundary_double_damage': 'boundary',
+    'left_too_soon': 'boundary',
+    'double_jump': 'double_jump',
+}
+
+
+class IdlePolicy:
+    """原地不动"""
+
+    def __init__(self, rng, cfg):
+        self.keys = dict.fromkeys(KEYS, False)
+
+    def __call__(self, state, cubes, tick):
+        return self.keys
+
+
+class ScriptPolicy:
+    """循环执行默认输入脚本（sim_input.default_script），起始位置随机"""
+
+    def __init__(self, rng, cfg):
+        self.script = default_script()
+        self.offset = rng.randrange(self.script.period)
+
+    def __call__(self, state, cubes, tick):
+        return self.script.keys_at(tick + self.offset)
+
+
+class RandomPolicy:
+    """随机按键：每段随机按下一组键并保持一段随机的时间"""
+
+    def __init__(self, rng, cfg, press_probability=0.35, hold_ticks=(3, 60)):
+        self.rng = rng
+        self.press_probability = press_probability
+        self.hold_ticks = hold_ticks
+        self.until = 0
+        self.keys = None
+
+    def __call__(self, state, cubes, tick):
+        if tick >= self.until:
+            self.keys = {key: self.rng.random() < self.press_probability for key in KEYS}
+            self.until = tick + self.rng.randint(*self.hold_ticks)
+        return self.keys
+
+
+class BotPolicy:
+    """简单的躲避机器人：一直前进，靠近边界时转向地图中心，附近有立方体时转向远离它的方向，很近时起跳"""
+
+    def __init__(self, rng, cfg, flee_radius=8.0, jump_radius=3.0, margin=0.15, turn_tolerance=15.0):
+        (x_min, x_max), (y_min, y_max) = cfg.game_rules.boundaries.x, cfg.game_rules.boundaries.y
+        self.center = ((x_min + x_max) / 2, (y_min + y_max) / 2)
+        # 离边界不到范围的 margin 比例时返回中心
+        self.inner = (x_min + (x_max - x_min) * margin, x_max - (x_max - x_min) * margin,
+                      y_min + (y_max - y_min) * margin, y_max - (y_max - y_min) * margin)
+        self.flee_radius = flee_radius
+        self.jump_radius = jump_radius
+        self.turn_tolerance = turn_tolerance
+
+    def __call__(self, state, cubes, tick):
+        # cubes: 本场游戏所有立方体的当前位置
+        x, y, _ = state.position
+        keys = dict.fromkeys(KEYS, False)
+        keys["forward"] = True
+
+        x_lo, x_hi, y_lo, y_hi = self.inner
+        direction = None
+        if not (x_lo <= x <= x_hi and y_lo <= y <= y_hi):
+            direction = (self.center[0] - x, self.center[1] - y)
+        elif len(cubes):
+            offsets = cubes[:, :2] - (x, y)
+            distances = np.einsum('ij,ij->i', offsets, offsets)
+            nearest = int(np.argmin(distances))
+            distance = math.sqrt(distances[nearest])
+            if distance < self.flee_radius:
+                direction = (-offsets[nearest, 0], -offsets[nearest, 1])
+            keys["up"] = distance < self.jump_radius
+
+        if direction is not None:
+            # 前进方向是 (-sin h, cos h)，转向目标方向
+            target = math.degrees(math.atan2(-direction[0], direction[1]))
+            diff = (target - state.heading + 180) % 360 - 180
+            keys["turn_left"] = diff > self.turn_tolerance
+            keys["turn_right"] = diff < -self.turn_tolerance
+        return keys
+
+
+POLICIES = {
+    'idle': IdlePolicy,
+    'script': ScriptPolicy,
+    'random': RandomPolicy,
+    'bot': BotPolicy,
+}
+
+
+def play_batch(cfg, policies, seed, max_time):
+    """同步模拟一批整场游戏（每帧的顺序与 SandboxGame 相同，每帧一个物理步），返回每场的结果"""
+    games = len(policies)
+    grid = layout_positions(cfg.reference_cubes.layout)
+    cubes = np.column_stack([grid, np.full(len(grid), cfg.reference_cubes.appearance.height)])
+    per_game = len(cubes)
+    swarm = CubeSwarm(cfg.cube_movement, seed=seed)
+    swarm.add_cubes(np.tile(cubes, (games, 1)))
+
+    # 碰撞检测参数与 ProximityCollisionBackend 相同
+    radius = cfg.player.width / 2
+    half_height = cfg.player.height / 2
+    cube_half = cfg.reference_cubes.appearance.scale
+    reach = radius + cube_half * np.sqrt(3)
+    continuous = cfg.collision.continuous
+
+    states = []
+    damage = []  # 每场各来源的扣血次数
+    for _ in range(games):
+        state = GameState(cfg)
+        counter = Counter()
+        state.subscribe(_damage_counter(counter))
+        states.append(state)
+        damage.append(counter)
+
+    results = [None] * games
+    live = list(range(games))
+    dt = 1.0 / cfg.simulation.tick_rate
+    ticks = int(round(max_time / dt))
+    now = 0.0
+    for tick in range(1, ticks + 1):
+        now = tick * dt
+        positions = swarm.positions
+        for i in live:
+            state = states[i]
+            state.apply_input(now, policies[i](state, positions[i * per_game:(i + 1) * per_game], tick))
+            state.begin_frame(now)
+        swarm.step(dt, now)
+        for i in live:
+            states[i].physics_step(dt)
+
+        # 整批一起检测：先按 reach 粗筛每场自己的立方体，再对候选做精确测试
+        players = np.array([states[i].position for i in live])
+        limit = reach
+        if continuous:
+            # 连续检测时粗筛范围加上本步内角色和立方体的最大位移
+            prev_players = np.array([states[i].prev_position for i in live])
+            cube_motion = np.abs(swarm.positions[:, :2] - swarm.prev_positions[:, :2]).max()
+            limit = reach + cube_motion + np.abs(players[:, :2] - prev_players[:, :2]).max(axis=1)[:, None]
+        blocks = swarm.positions.reshape(games, per_game, 3)  # 视图：第 i 场的立方体在 blocks[i]
+        if len(live) < games:
+            blocks = blocks[live]
+        offsets = np.abs(blocks[..., :2] - players[:, None, :2])
+        game, cube = np.nonzero((offsets[..., 0] <= limit) & (offsets[..., 1] <= limit))
+        if len(game) and continuous:
+            candidates = np.array(live)[game] * per_game + cube
+            toi = swept_capsule_box_toi(
+                prev_players[game].T, players[game].T, half_height, radius,
+                swarm.prev_positions[candidates], swarm.positions[candidates],
+                swarm.prev_headings[candidates], swarm.headings[candidates],
+                cube_half, max_step=radius, iterations=cfg.collision.toi_iterations
+            )
+            first = np.full(len(live), np.inf)
+            np.minimum.at(first, game, toi)
+            for k in np.flatnonzero(np.isfinite(first)).tolist():
+                states[live[k]].hit_cube(now - (1.0 - first[k]) * dt)
+        elif len(game):
+            candidates = np.array(live)[game] * per_game + cube
+            overlap = capsule_box_overlap(
+                players[game].T, half_height, radius,
+                swarm.positions[candidates], swarm.headings[candidates], cube_half
+            )
+            for k in np.unique(game[overlap]).tolist():
+                states[live[k]].hit_cube()
+
+        finished = False
+        for i in live:
+            states[i].end_frame()
+            if not states[i].game_running:
+                results[i] = _result(states[i], now, damage[i])
+                finished = True
+        if finished:
+            # 结束的游戏不再推进它的立方体
+            live = [i for i in live if results[i] is None]
+            if not live:
+                break
+            swarm.set_active((np.array(live)[:, None] * per_game + np.arange(per_game)).ravel())
+
+    for i in live:
+        results[i] = _result(states[i], now, damage[i])
+    return results
+
+
+def _damage_counter(counter):
+    # 订阅 GameState 事件，按来源统计扣血次数
+    def on_event(event):
+        source = DAMAGE_SOURCES.get(event.kind)
+        if source:
+            counter[source] += 1
+    return on_event
+
+
+def _result(state, now, damage):
+    if state.game_running:
+        outcome = 'timeout'
+    elif state.health <= 0:
+        outcome = 'game_over'
+    else:
+        outcome = 'victory'
+    return {
+        'outcome': outcome,
+        'round': state.current_game,
+        'survival_seconds': now,                  # 从开始到结束的总时间（包括已通过的局）
+        'round_seconds': now - state.start_time,  # 最后一局的存活时间
+        'health': state.health,
+        'damage_events': dict(damage),
+    }
+
+
+def run_batch(overrides, policy, seeds, max_time):
+    # 在工作进程中运行一批试验（每批只加载一次配置，立方体的随机种子取这一批的第一个种子）
+    cfg = load_settings(CONFIG_PATH, overrides)
+    policy_cls = POLICIES[policy]
+    results = play_batch(cfg, [policy_cls(random.Random(seed), cfg) for seed in seeds], seeds[0], max_time)
+    for seed, result in zip(seeds, results):
+        result['seed'] = seed
+    return results
+
+
+def parse_sweep(items):
+    # --set 路径 值1 值2 ... → 所有组合的覆盖配置列表（值按 YAML 解析）
+    axes = []
+    for path, *values in items or ():
+        if not values:
+            raise SystemExit(f"--set {path}: no values given")
+        axes.append([(path, yaml.safe_load(value)) for value in values])
+    sweep = []
+    for combination in itertools.product(*axes):
+        overrides = {}
+        for path, value in combination:
+            *parents, key = path.split('.')
+            node = overrides
+            for parent in parents:
+                node = node.setdefault(parent, {})
+            node[key] = value
+        sweep.append((dict(combination), overrides))
+    return sweep
+
+
+def summarize(trials, max_time):
+    survival = np.array([trial['survival_seconds'] for trial in trials])
+    percentiles = dict(zip(('p10', 'p25', 'p50', 'p75', 'p90'),
+                           np.percentile(survival, [10, 25, 50, 75, 90]).tolist()))
+    edges = np.arange(0.0, max_time + HISTOGRAM_BIN, HISTOGRAM_BIN)
+    counts, edges = np.histogram(survival, bins=edges)
+    damage = Counter()
+    for trial in trials:
+        damage.update(trial['damage_events'])
+    return {
+        'trials': len(trials),
+        'outcomes': dict(Counter(trial['outcome'] for trial in trials)),
+        'rounds_reached': {str(k): v for k, v in sorted(Counter(trial['round'] for trial in trials).items())},
+        'survival_seconds': {
+            'mean': float(survival.mean()),
+            'std': float(survival.std()),
+            'min': float(survival.min()),
+            'max': float(survival.max()),
+            **percentiles,
+        },
+        'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()},
+        'damage_events_per_trial': {kind: count / len(trials) for kind, count in sorted(damage.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trials', type=int, default=200, help='每个配置模拟的场数')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='bot', help='玩家策略')
+    parser.add_argument('--set', nargs='+', action='append', metavar=('PATH', 'VALUE'),
+                        help='扫描的配置项及取值（可多次指定，取所有组合）')
+    parser.add_argument('--max-time', type=float, help='每场最长模拟时间（秒，默认为所有局的时间之和）')
+    parser.add_argument('--seed', type=int, default=0, help='第一场的随机种子（第 i 场使用 seed + i）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='工作进程数（0 表示在本进程内运行）')
+    parser.add_argument('--batch', type=int, default=64, help='每个任务同步模拟的场数')
+    parser.add_argument('--raw', action='store_true', help='在结果中包含每一场的记录')
+    parser.add_argument('--output', help='JSON 结果输出路径（默认输出到标准输出）')
+    args = parser.parse_args(argv)
+
+    sweep = parse_sweep(args.set)
+    max_time = args.max_time
+    if max_time is None:
+        # 默认模拟到能够胜利为止（每局的存活时间之和，再加一秒余量）
+        max_time = sum(load_settings(CONFIG_PATH).game_rules.round_times) + 1.0
+    seeds = list(range(args.seed, args.seed + args.trials))
+    batches = [seeds[i:i + args.batch] for i in range(0, len(seeds), args.batch)]
+
+    start = time.perf_counter()
+    pool = None
+    if args.workers > 0:
+        # 先提交所有配置的任务，再按配置的顺序收集结果
+        pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'))
+        futures = [[pool.submit(run_batch, overrides, args.policy, batch, max_time) for batch in batches]
+                   for _, overrides in sweep]
+        outcomes = ([trial for future in config_futures for trial in future.result()]
+                    for config_futures in futures)
+    else:
+        outcomes = ([trial for batch in batches for trial in run_batch(overrides, args.policy, batch, max_time)]
+                    for _, overrides in sweep)
+
+    results = []
+    for (params, _), trials in zip(sweep, outcomes):
+        summary = summarize(trials, max_time)
+        result = {'params': params, **summary}
+        if args.raw:
+            result['raw'] = trials
+        results.append(result)
+        survival = summary['survival_seconds']
+        label = ', '.join(f'{k}={v}' for k, v in params.items()) or 'config.yaml'
+        print(f"{label}: survival p50 {survival['p50']:.1f}s (p10 {survival['p10']:.1f}s, "
+              f"p90 {survival['p90']:.1f}s), outcomes {summary['outcomes']}", file=sys.stderr)
+    if pool:
+        pool.shutdown()
+    elapsed = time.perf_counter() - start
+
+    total = len(sweep) * len(seeds)
+    print(f"{total} games in {elapsed:.1f}s ({total / elapsed * 60:.0f} games/min)", file=sys.stderr)
+    report = {
+        'policy': args.policy,
+        'seed': args.seed,
+        'max_time': max_time,
+        'elapsed_seconds': elapsed,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
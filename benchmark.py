@@ -0,0 +1,186 @@
+"""无窗口基准测试：按不同立方体数量构建场景，统计每步及各任务的耗时
+
+用法：python benchmark.py --counts 100 1000 10000 --ticks 600 --output bench.json
+
+另外单独测量不带场景层的 GameState 推进速度（--core-ticks 0 跳过），
+并用 -X importtime 统计主要模块在新解释器中的导入耗时（--import-repeat 0 跳过）。
+"""
+import argparse
+import dataclasses
+import json
+import multiprocessing
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from cube_swarm import layout_positions
+from game_state import GameState, TickInput
+from settings import load_settings
+from sim_input import default_script
+
+CONFIG_PATH = Path(__file__).parent / "config.yaml"
+
+# 需要统计的分段（任务名 + move_task 内部的分段）
+SECTIONS = ("tick", "MoveTask", "UpdateCubesTask", "physics", "collision", "broadphase", "narrowphase", "hud")
+
+# 统计导入耗时的模块（游戏入口和无窗口工具常用的模块）
+IMPORT_MODULES = ("main", "settings", "cube_swarm", "world", "collision")
+
+
+def spacing_for_count(layout, target):
+    # 二分查找间距，使布局生成的立方体数量最接近目标值
+    lo, hi = 0.05, float(max(layout.x[1] - layout.x[0], layout.y[1] - layout.y[0]))
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        count = len(layout_positions(dataclasses.replace(layout, spacing=mid)))
+        if count > target:
+            lo = mid
+        else:
+            hi = mid
+    candidates = (lo, hi)
+    counts = [len(layout_positions(dataclasses.replace(layout, spacing=s))) for s in candidates]
+    best = min(range(2), key=lambda i: abs(counts[i] - target))
+    return candidates[best], counts[best]
+
+
+def run_scene(target, spacing, ticks, warmup, seed, backend):
+    # 在独立进程中运行（ShowBase 每个进程只能创建一次）
+    from main import SandboxGame
+    from profiling import SectionTimer
+    from sim_input import default_script
+
+    random.seed(seed)
+    overrides = {
+        'reference_cubes': {'layout': {'spacing': spacing}},
+        'cube_movement': {'seed': seed},
+        'collision': {'backend': backend},
+        # 关闭立方体碰撞伤害，避免玩家死亡后模拟提前变得空闲
+        'game_rules': {'damage': {'cube_collision': 0}},
+    }
+
+    timer = SectionTimer()
+    build_start = time.perf_counter()
+    game = SandboxGame(headless=True, input_source=default_script(),
+                       config_overrides=overrides, timer=timer)
+    build_time = time.perf_counter() - build_start
+
+    game.run_headless(warmup)
+    timer.clear()
+    stats = game.run_headless(ticks)
+    summary = timer.summary()
+
+    return {
+        'target_cubes': target,
+        'cubes': game.cube_swarm.count,
+        'spacing': spacing,
+        'collision_backend': backend,
+        'ticks': ticks,
+        'build_seconds': build_time,
+        'steps_per_second': stats['steps_per_second'],
+        'sections': {name: summary[name] for name in SECTIONS if name in summary},
+    }
+
+
+def run_core(ticks):
+    # 不带场景层单独推进游戏规则核心（默认脚本输入，没有立方体碰撞），游戏结束后立即重开
+    cfg = load_settings(CONFIG_PATH)
+    state = GameState(cfg)
+    script = default_script()
+    inputs = [TickInput(script.keys_at(tick)) for tick in range(script.period)]
+    dt = 1.0 / cfg.simulation.tick_rate
+    start = time.perf_counter()
+    for tick in range(ticks):
+        state.step(dt, inputs[tick % len(inputs)])
+        if not state.game_running:
+            state.restart()
+    elapsed = time.perf_counter() - start
+    return ticks / elapsed if elapsed > 0 else float('inf')
+
+
+def import_time(module, repeat):
+    # 每次在新的解释器中导入，取 -X importtime 报告的累计耗时（毫秒）的中位数
+    samples = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        )
+        # 每行格式：import time: 自身耗时 | 累计耗时 | 模块名（微秒）
+        for line in result.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                samples.append(int(fields[1]) / 1000)
+    return float(np.median(samples))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).parent, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[100, 1000, 10000], help='目标立方体数量')
+    parser.add_argument('--ticks', type=int, default=600, help='每个场景计时的步数')
+    parser.add_argument('--warmup', type=int, default=60, help='计时前的预热步数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--backend', default='proximity', help='碰撞检测后端')
+    parser.add_argument('--core-ticks', type=int, default=100000, help='GameState 单独推进的步数（0 表示跳过）')
+    parser.add_argument('--import-repeat', type=int, default=5, help='导入耗时测量次数（0 表示跳过）')
+    parser.add_argument('--output', help='JSON 结果输出路径（默认输出到标准输出）')
+    args = parser.parse_args(argv)
+
+    layout = load_settings(CONFIG_PATH).reference_cubes.layout
+    results = []
+    for target in args.counts:
+        spacing, _ = spacing_for_count(layout, target)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            result = pool.submit(run_scene, target, spacing, args.ticks, args.warmup,
+                                 args.seed, args.backend).result()
+        results.append(result)
+        print(f"{result['cubes']:>7} cubes: {result['steps_per_second']:.0f} steps/s, "
+              f"tick p50 {result['sections']['tick']['p50_ms']:.3f} ms, "
+              f"p99 {result['sections']['tick']['p99_ms']:.3f} ms"
+              + (f", broadphase p50 {result['sections']['broadphase']['p50_ms']:.3f} ms"
+                 if 'broadphase' in result['sections'] else ''), file=sys.stderr)
+
+    core_steps_per_second = None
+    if args.core_ticks > 0:
+        core_steps_per_second = run_core(args.core_ticks)
+        print(f"GameState core: {core_steps_per_second:.0f} steps/s", file=sys.stderr)
+
+    import_ms = {}
+    if args.import_repeat > 0:
+        for module in IMPORT_MODULES:
+            import_ms[module] = import_time(module, args.import_repeat)
+            print(f"import {module}: {import_ms[module]:.1f} ms", file=sys.stderr)
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'seed': args.seed,
+        'results': results,
+        'core_steps_per_second': core_steps_per_second,
+        'import_ms': import_ms,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import numpy as np
+
+from profiling import NULL_TIMER
+
+
+def proximity_candidates(xs, ys, x, y, reach):
+    """XY 平面上与 [x±reach, y±reach] 范围重叠的点的下标（向量化粗筛）
+
+    先按 X 筛选，只对留下的少数点再比较 Y，每步只对所有点做一次减法和比较，不建立也不维护索引结构。
+    """
+    near = np.flatnonzero(np.abs(xs - x) <= reach)
+    return near[np.abs(ys[near] - y) <= reach]
+
+
+def capsule_box_overlap(center, half_height, radius, box_centers, box_headings, box_half):
+    """竖直胶囊体与绕 Z 轴旋转的立方体的精确相交测试（批量）"""
+    # 将胶囊中心变换到每个立方体的局部坐标系
+    dx = center[0] - box_centers[:, 0]
+    dy = center[1] - box_centers[:, 1]
+    h = np.radians(box_headings)
+    c = np.cos(h)
+    s = np.sin(h)
+    local_x = c * dx + s * dy
+    local_y = -s * dx + c * dy
+
+    # 水平方向到立方体的距离
+    qx = np.maximum(np.abs(local_x) - box_half, 0)
+    qy = np.maximum(np.abs(local_y) - box_half, 0)
+
+    # 竖直方向：胶囊的中轴线段与立方体高度区间的间隔
+    gap_z = np.maximum.reduce([
+        np.zeros_like(dx),
+        (center[2] - half_height) - (box_centers[:, 2] + box_half),
+        (box_centers[:, 2] - box_half) - (center[2] + half_height),
+    ])
+
+    return qx * qx + qy * qy + gap_z * gap_z <= radius * radius
+
+
+def swept_capsule_box_toi(start, end, half_height, radius, box_start, box_end,
+                          heading_start, heading_end, box_half, max_step, iterations=8):
+    """竖直胶囊体从 start 移动到 end、立方体同时从 box_start 移动到 box_end 时的首次接触时刻（批量）
+
+    朝向也在本步内线性变化。返回每个立方体的接触时刻（本步步长的比例 0~1），不接触时为 inf。
+    本步按相对位移分成若干段，每段不超过 max_step，逐段采样找到首次重叠，再在该段内二分求接触时刻。
+    max_step 取胶囊半径时，胶囊中轴线段经过立方体内部就一定会在某个采样点重叠，不会穿过去。
+    """
+    # 胶囊的起止位置可以是单个点，也可以是每个立方体各自对应的一列（形状 (3, n)）
+    n = len(box_start)
+    start = np.broadcast_to(np.asarray(start, dtype=np.float64).reshape(3, -1), (3, n))
+    motion = np.broadcast_to(np.asarray(end, dtype=np.float64).reshape(3, -1), (3, n)) - start
+    box_motion = box_end - box_start
+    turn = heading_end - heading_start
+
+    def overlap_at(t, index):
+        return capsule_box_overlap(
+            start[:, index] + motion[:, index] * t, half_height, radius,
+            box_start[index] + box_motion[index] * t[:, None],
+            heading_start[index] + turn[index] * t, box_half
+        )
+
+    # 相对位移（立方体转动时角点的位移按外接圆弧长估计）决定采样段数
+    relative = motion.T - box_motion
+    travel = np.sqrt(np.einsum('ij,ij->i', relative, relative)) + np.radians(np.abs(turn)) * box_half * np.sqrt(2)
+    steps = max(1, int(np.ceil(travel.max() / max_step))) if n else 1
+
+    first = np.full(n, -1)
+    for k in range(steps + 1):
+        waiting = np.flatnonzero(first < 0)
+        if not len(waiting):
+            break
+        hit = overlap_at(np.full(len(waiting), k / steps), waiting)
+        first[waiting[hit]] = k
+
+    toi = np.full(n, np.inf)
+    toi[first == 0] = 0.0
+    refine = np.flatnonzero(first > 0)
+    if len(refine):
+        lo = (first[refine] - 1) / steps
+        hi = first[refine] / steps
+        for _ in range(iterations):
+            mid = (lo + hi) / 2
+            hit = overlap_at(mid, refine)
+            hi = np.where(hit, mid, hi)
+            lo = np.where(hit, lo, mid)
+        toi[refine] = hi
+    return toi
+
+
+class TraverserCollisionBackend:
+    """使用 Panda3D CollisionTraverser 遍历整个场景（备用后端）"""
+
+    def __init__(self, traverser, queue, root, world):
+        self.traverser = traverser
+        self.queue = queue
+        self.root = root
+        self.world = world
+        self.broadphase_tests = 0
+        self.narrowphase_tests = 0
+        self.last_toi = 1.0  # 离散检测：接触时刻总是物理步末
+
+    def detect(self, position, rows=None, prev_position=None):
+        # 节点平时显示的是插值状态，检测前先同步到当前物理步的状态
+        self.world.sync_collision()
+        self.traverser.traverse(self.root)
+        # 遍历器会对场景中（已加载块内）的每个立方体碰撞节点进行测试
+        self.broadphase_tests = self.narrowphase_tests = self.world.cube_node_count
+        return self.queue.getNumEntries() > 0
+
+
+class ProximityCollisionBackend:
+    """向量化距离粗筛 + 胶囊/立方体精确测试，只对玩家附近的立方体做精确测试"""
+
+    def __init__(self, swarm, player_radius, player_half_height, cube_half,
+                 continuous=False, toi_iterations=8, timer=NULL_TIMER):
+        self.swarm = swarm
+        self.player_radius = player_radius
+        self.player_half_height = player_half_height
+        self.cube_half = cube_half
+        # 粗筛范围：胶囊半径 + 立方体外接球半径
+        self.reach = player_radius + cube_half * np.sqrt(3)
+        self.timer = timer  # 粗筛和精确测试分别计时（broadphase / narrowphase）
+        self.broadphase_tests = 0
+        self.narrowphase_tests = 0
+        self.last_hits = np.zeros(0, dtype=np.intp)
+        # 连续检测：从上一步的位置扫掠到当前位置，last_toi 为本步内首次接触的时刻（步长的比例）
+        self.continuous = continuous
+        self.toi_iterations = toi_iterations
+        self.last_toi = 1.0
+
+    def detect(self, position, rows=None, prev_position=None):
+        center = tuple(position)
+        sweep = self.continuous and prev_position is not None
+        # 只检测给定的行（LOD 本步推进的立方体），否则检测所有参与模拟的立方体
+        swarm = self.swarm
+        if rows is None:
+            rows = swarm.active
+
+        with self.timer.section('broadphase'):
+            positions = swarm.positions if rows is None else swarm.positions[rows]
+            reach = self.reach
+            if sweep and len(positions):
+                # 粗筛范围加上本步内角色和立方体的最大位移，本步内任何时刻的接触都在范围内
+                prev_positions = swarm.prev_positions if rows is None else swarm.prev_positions[rows]
+                reach += max(abs(center[0] - prev_position[0]), abs(center[1] - prev_position[1]))
+                reach += np.abs(positions[:, :2] - prev_positions[:, :2]).max()
+            candidates = proximity_candidates(positions[:, 0], positions[:, 1], center[0], center[1], reach)
+            if rows is not None:
+                candidates = rows[candidates]  # 换成立方体群中的行号
+        self.broadphase_tests = len(positions)
+        self.narrowphase_tests = len(candidates)
+        self.last_toi = 1.0
+
+        if len(candidates) == 0:
+            self.last_hits = candidates
+            return False
+
+        with self.timer.section('narrowphase'):
+            if sweep:
+                toi = swept_capsule_box_toi(
+                    prev_position, center, self.player_half_height, self.player_radius,
+                    swarm.prev_positions[candidates], swarm.positions[candidates],
+                    swarm.prev_headings[candidates], swarm.headings[candidates],
+                    self.cube_half, max_step=self.player_radius, iterations=self.toi_iterations
+                )
+                overlap = np.isfinite(toi)
+                if overlap.any():
+                    self.last_toi = float(toi[overlap].min())
+            else:
+                overlap = capsule_box_overlap(
+                    center, self.player_half_height, self.player_radius,
+                    swarm.positions[candidates], swarm.headings[candidates], self.cube_half
+                )
+        self.last_hits = candidates[overlap]
+        return len(self.last_hits) > 0
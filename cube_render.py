@@ -0,0 +1,133 @@
+import numpy as np
+from panda3d.core import (
+    GeomNode, GeomEnums, Texture, Shader, OmniBoundingVolume
+)
+
+# 顶点着色器：按 gl_InstanceID 从缓冲纹理中读取每个实例的变换和颜色
+INSTANCE_VERTEX_SHADER = """
+#version 150
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat3 p3d_NormalMatrix;
+uniform samplerBuffer instance_data;
+uniform float cube_scale;
+
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+
+out vec3 v_normal;
+out vec4 v_color;
+
+void main() {
+    // 每个实例占两个纹素：[x, y, z, heading(弧度)] 和 [r, g, b, a]
+    vec4 xform = texelFetch(instance_data, gl_InstanceID * 2);
+    v_color = texelFetch(instance_data, gl_InstanceID * 2 + 1);
+
+    // 透明度为负表示隐藏（超出视距），把顶点放到裁剪空间之外，整个实例被裁掉
+    if (v_color.a < 0.0) {
+        gl_Position = vec4(0.0, 0.0, 2.0, 1.0);
+        v_normal = vec3(0.0, 0.0, 1.0);
+        return;
+    }
+
+    float c = cos(xform.w);
+    float s = sin(xform.w);
+    mat2 rot = mat2(c, s, -s, c);
+
+    vec3 local = p3d_Vertex.xyz * cube_scale;
+    vec3 world = vec3(rot * local.xy, local.z) + xform.xyz;
+    gl_Position = p3d_ModelViewProjectionMatrix * vec4(world, 1.0);
+    v_normal = normalize(p3d_NormalMatrix * vec3(rot * p3d_Normal.xy, p3d_Normal.z));
+}
+"""
+
+# 片段着色器：环境光 + 定向光，与场景的固定管线光照保持一致
+INSTANCE_FRAGMENT_SHADER = """
+#version 150
+
+uniform struct {
+    vec4 ambient;
+} p3d_LightModel;
+
+uniform struct {
+    vec4 color;
+    vec4 position;
+} p3d_LightSource[2];
+
+in vec3 v_normal;
+in vec4 v_color;
+
+out vec4 p3d_FragColor;
+
+void main() {
+    vec3 n = normalize(v_normal);
+    vec3 light = p3d_LightModel.ambient.rgb;
+    for (int i = 0; i < 2; ++i) {
+        // 定向光的 position.xyz 为视空间中指向光源的方向（未使用的光源为零向量）
+        vec3 dir = p3d_LightSource[i].position.xyz;
+        if (dot(dir, dir) > 0.0) {
+            light += p3d_LightSource[i].color.rgb * max(dot(n, normalize(dir)), 0.0);
+        }
+    }
+    p3d_FragColor = vec4(v_color.rgb * light, v_color.a);
+}
+"""
+
+
+class InstancedCubeRenderer:
+    """共享一个立方体网格的实例化渲染器，每批立方体只需一次绘制调用"""
+
+    def __init__(self, parent, geom, colors, scale=1.0, batch_size=16384):
+        colors = np.asarray(colors, dtype=np.float32).reshape(-1, 4)
+        self.alpha = colors[:, 3].copy()  # 原始透明度（隐藏时写入负值）
+        self.count = len(colors)
+        self.batches = []  # [(起始下标, 结束下标, 缓冲纹理, NodePath)]
+
+        shader = Shader.make(Shader.SL_GLSL, INSTANCE_VERTEX_SHADER, INSTANCE_FRAGMENT_SHADER)
+        self.root = parent.attachNewNode('cube_instances')
+        self.root.setShader(shader)
+        self.root.setShaderInput('cube_scale', float(scale))
+        self.root.setTwoSided(True)
+
+        for start in range(0, self.count, batch_size):
+            end = min(start + batch_size, self.count)
+            n = end - start
+
+            # 每个实例两个 RGBA32F 纹素：变换 + 颜色
+            texture = Texture('cube_instance_data')
+            texture.setupBufferTexture(n * 2, Texture.TFloat, Texture.FRgba32, GeomEnums.UHDynamic)
+            data = self._buffer_view(texture, n)
+            data[:, 0, :] = 0
+            data[:, 1, :] = colors[start:end]
+
+            node = GeomNode('cube_batch')
+            node.addGeom(geom)
+            # 实例分布在整个场景中，网格自身的包围盒不能用于裁剪
+            node.setBounds(OmniBoundingVolume())
+            node.setFinal(True)
+
+            batch = self.root.attachNewNode(node)
+            batch.setShaderInput('instance_data', texture)
+            batch.setInstanceCount(n)
+            self.batches.append((start, end, texture, batch))
+
+    @staticmethod
+    def _buffer_view(texture, n):
+        return np.frombuffer(texture.modifyRamImage(), dtype=np.float32).reshape(n, 2, 4)
+
+    def update(self, positions, headings):
+        # 直接写入每批的缓冲纹理（一次内存拷贝，无需逐个节点设置变换）
+        for start, end, texture, _ in self.batches:
+            data = self._buffer_view(texture, end - start)
+            data[:, 0, :3] = positions[start:end]
+            data[:, 0, 3] = np.radians(headings[start:end])
+
+    def set_hidden(self, hidden):
+        # 隐藏或恢复部分实例（透明度取负值由顶点着色器裁掉，不需要重建批次）
+        alpha = np.where(hidden, -1.0, self.alpha)
+        for start, end, texture, _ in self.batches:
+            self._buffer_view(texture, end - start)[:, 1, 3] = alpha[start:end]
+
+    def destroy(self):
+        self.root.removeNode()
+        self.batches = []
@@ -0,0 +1,170 @@
+import numpy as np
+
+# 每个立方体的状态列：名称 -> (每行的形状, 类型)
+# 只用于显示的列使用 float32，参与模拟的列使用 float64（保证回放结果一致）
+CUBE_COLUMNS = {
+    'positions': ((3,), np.float64),          # 当前位置 [x, y, z]
+    'initial_positions': ((3,), np.float64),  # 巡逻中心（初始位置）
+    'headings': ((), np.float64),             # 自转角度（度数）
+    'velocities': ((2,), np.float64),         # 水平速度 [vx, vy]
+    'next_change': ((), np.float64),          # 下一次改变方向的时间
+    'last_update': ((), np.float64),          # 上一次推进到的模拟时间
+    'prev_positions': ((3,), np.float32),     # 上一个物理步的位置（渲染插值用）
+    'prev_headings': ((), np.float32),        # 上一个物理步的自转角度（渲染插值用）
+    'colors': ((4,), np.float32),             # 颜色 [r, g, b, a]
+}
+
+
+class CubeStore:
+    """立方体状态的列式存储：每列是一块连续数组，立方体用整数句柄增删
+
+    第 i 行在所有列中对应同一个立方体。删除时用末尾的行填补空位，
+    行号会变化（version 递增），需要长期引用某个立方体时保存句柄。
+    列数组由 allocator(shape, dtype) 分配（默认 np.zeros，并行推进时分配在共享内存中）。
+    """
+
+    def __init__(self, capacity=64, allocator=np.zeros):
+        self.count = 0
+        self.version = 0          # 删除导致行号变化时递增，缓存了行号的使用方据此刷新
+        self.storage_version = 0  # 列数组重新分配（扩容或更换分配方式）时递增
+        self.allocator = allocator
+        self._data = {name: allocator((capacity,) + shape, dtype)
+                      for name, (shape, dtype) in CUBE_COLUMNS.items()}
+        self._handles = np.zeros(capacity, dtype=np.int64)  # 行号 -> 句柄
+        self._rows = np.zeros(0, dtype=np.int64)            # 句柄 -> 行号（-1 表示已删除）
+        self._free = []                                     # 可复用的句柄
+
+    def __getattr__(self, name):
+        # 列访问返回前 count 行的视图（原地修改直接写回存储）
+        data = self.__dict__.get('_data')
+        if data is None or name not in data:
+            raise AttributeError(name)
+        return data[name][:self.count]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        # 按行（内存）顺序遍历句柄
+        return iter(self.handles.tolist())
+
+    def __contains__(self, handle):
+        return 0 <= handle < len(self._rows) and self._rows[handle] >= 0
+
+    @property
+    def handles(self):
+        return self._handles[:self.count]
+
+    @property
+    def free_handles(self):
+        # 可复用的句柄（最后一个最先复用）
+        return list(self._free)
+
+    @property
+    def storage(self):
+        # 各列的底层数组（包含尚未使用的容量）
+        return self._data
+
+    @property
+    def nbytes(self):
+        # 每个立方体实际占用的字节数 × 立方体数
+        per_row = sum(a.strides[0] for a in self._data.values()) + self._handles.itemsize + self._rows.itemsize
+        return per_row * self.count
+
+    def rows_of(self, handles):
+        rows = self._rows[np.asarray(handles, dtype=np.int64)]
+        if (rows < 0).any():
+            raise KeyError("stale cube handle")
+        return rows
+
+    def _reserve(self, capacity):
+        # 容量按倍数增长，批量添加的均摊开销是常数
+        if capacity <= len(self._handles):
+            return
+        capacity = max(capacity, 2 * len(self._handles))
+        self._move_columns(capacity)
+        handles = np.zeros(capacity, dtype=np.int64)
+        handles[:self.count] = self._handles[:self.count]
+        self._handles = handles
+
+    def set_allocator(self, allocator):
+        # 把所有列复制到由新的分配函数分配的数组中
+        self.allocator = allocator
+        self._move_columns(len(self._handles))
+
+    def _move_columns(self, capacity):
+        for name, array in self._data.items():
+            moved = self.allocator((capacity,) + array.shape[1:], array.dtype)
+            moved[:self.count] = array[:self.count]
+            self._data[name] = moved
+        self.storage_version += 1
+
+    def add(self, n, **values):
+        """追加 n 个立方体（未给出的列填 0），返回它们的句柄"""
+        start = self.count
+        self._reserve(start + n)
+        self.count += n
+        for name, value in values.items():
+            self._data[name][start:self.count] = value
+
+        # 优先复用已删除的句柄，不够时分配新句柄
+        reused = [self._free.pop() for _ in range(min(n, len(self._free)))]
+        fresh = np.arange(len(self._rows), len(self._rows) + n - len(reused), dtype=np.int64)
+        if len(fresh):
+            self._rows = np.concatenate([self._rows, np.full(len(fresh), -1, dtype=np.int64)])
+        handles = np.concatenate([np.asarray(reused, dtype=np.int64), fresh])
+        self._handles[start:self.count] = handles
+        self._rows[handles] = np.arange(start, self.count)
+        return handles
+
+    def remove(self, handles):
+        """删除立方体：末尾的行移到空位上，保持所有列连续"""
+        rows = np.unique(self.rows_of(handles))
+        if not len(rows):
+            return
+        new_count = self.count - len(rows)
+
+        # 空位是前 new_count 行中被删除的行，用末尾未被删除的行依次填补
+        holes = rows[rows < new_count]
+        tail = np.arange(new_count, self.count)
+        movers = tail[~np.isin(tail, rows)]
+        for array in self._data.values():
+            array[holes] = array[movers]
+
+        removed = self._handles[rows]
+        self._handles[holes] = self._handles[movers]
+        self._rows[self._handles[holes]] = holes
+        self._rows[removed] = -1
+        self._free.extend(removed.tolist())
+
+        self.count = new_count
+        self.version += 1
+
+    def restore(self, handles, columns, free=()):
+        """用保存的状态替换全部立方体：handles 为各行的句柄，columns 为列名到数组的映射（缺少的列填 0），
+        free 为保存时的 free_handles。返回行和句柄的对应关系是否变化"""
+        handles = np.asarray(handles, dtype=np.int64)
+        free = np.asarray(free, dtype=np.int64)
+        n = len(handles)
+        changed = n != self.count or not np.array_equal(handles, self.handles)
+        self._reserve(n)
+        self.count = n
+        for name, array in self._data.items():
+            array[:n] = columns.get(name, 0)
+        if changed:
+            self._handles[:n] = handles
+            self.version += 1
+        # 句柄总数 = 使用中的句柄 + 可复用的句柄
+        self._rows = np.full(n + len(free), -1, dtype=np.int64)
+        self._rows[handles] = np.arange(n)
+        self._free = free.tolist()
+        return changed
+
+    @staticmethod
+    def sync_nodes(nodes, positions, headings):
+        # 一次性取出所有变换，再逐个写回场景图（避免每个立方体多次 getPos/Point3 分配）
+        if not nodes:
+            return
+        transforms = np.column_stack([positions, headings]).tolist()
+        for node, (x, y, z, h) in zip(nodes, transforms):
+            node.setPosHpr(x, y, z, h, 0, 0)
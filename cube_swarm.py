@@ -0,0 +1,252 @@
+import math
+
+import numpy as np
+
+from cube_store import CubeStore
+from scheduler import TimerWheel
+
+
+def layout_positions(layout):
+    """按布局配置生成参考立方体的网格坐标（跳过出生点安全区），返回 (N, 2) 数组"""
+    x_min, x_max = layout.x
+    y_min, y_max = layout.y
+    spacing = layout.spacing
+
+    # 间距可以是小数（密集关卡），加一个很小的容差避免浮点误差丢掉最后一列
+    xs = x_min + spacing * np.arange(int(np.floor((x_max - x_min) / spacing + 1e-9)) + 1)
+    ys = y_min + spacing * np.arange(int(np.floor((y_max - y_min) / spacing + 1e-9)) + 1)
+    gx, gy = np.meshgrid(xs, ys, indexing='ij')
+    grid = np.column_stack([gx.ravel(), gy.ravel()])
+
+    in_safe_zone = (np.abs(grid[:, 0]) < layout.safe_zone) & (np.abs(grid[:, 1]) < layout.safe_zone)
+    return grid[~in_safe_zone]
+
+
+def integrate(columns, rows, noise, dt, current_time):
+    """逐行推进一段立方体：保存上一步状态、匀速移动、叠加随机自转（单进程和并行推进共用）
+
+    columns 为列名到数组的映射，rows 为行号数组或切片，noise 为这些行本步的自转角度。
+    每行的计算互不依赖，所以按任意方式分段推进的结果都与整体推进完全相同。
+    """
+    positions, headings = columns['positions'], columns['headings']
+    columns['prev_positions'][rows] = positions[rows]
+    columns['prev_headings'][rows] = headings[rows]
+    positions[rows, :2] += columns['velocities'][rows] * dt
+    headings[rows] += noise
+    columns['last_update'][rows] = current_time
+
+
+class CubeSwarm(CubeStore):
+    """立方体群的结构数组（SoA）模拟器，一次批量推进所有立方体（状态列见 CUBE_COLUMNS）"""
+
+    def __init__(self, movement_cfg, seed=None):
+        CubeStore.__init__(self)
+        self.configure(movement_cfg)
+
+        self.rng = np.random.default_rng(seed)
+
+        # 参与模拟的行（None 表示全部；分块加载时只模拟已加载块内的立方体）
+        self.active = None
+        # 上一次低频推进（advance）的行，下一步不再推进时停止插值
+        self.advanced_rows = None
+
+        # 换向时间按句柄放进时间轮，每步只检查到期的立方体
+        self.direction_timers = TimerWheel()
+        self.timers_stale = False  # LOD 补齐时不使用时间轮，切回逐步推进时重建
+
+        # 并行推进后端（parallel_swarm.ParallelStepper），None 表示在本进程内推进
+        self.stepper = None
+
+    def configure(self, movement_cfg):
+        # 运动参数（只在初始化或配置重载时读取一次配置）
+        self.base_speed = float(movement_cfg.base_speed)
+        self.return_speed = self.base_speed * 1.5  # 超出巡逻范围时返回的速度
+        self.patrol_radius = float(movement_cfg.patrol_radius)
+        self.min_interval = float(movement_cfg.direction_change.min_interval)
+        self.max_interval = float(movement_cfg.direction_change.max_interval)
+        self.rotation_min = float(movement_cfg.rotation_speed[0])
+        self.rotation_max = float(movement_cfg.rotation_speed[1])
+
+    def set_active(self, rows):
+        # rows 为升序行号；新加入模拟的行重新登记换向时间（冻结期间到期的条目已被丢弃）
+        previous = self.active
+        self.active = None if rows is None else np.asarray(rows, dtype=np.intp)
+        if previous is None:
+            return
+        resumed = np.arange(self.count) if self.active is None else self.active
+        resumed = resumed[~self._contains_rows(previous, resumed)]
+        self.direction_timers.schedule(self.handles[resumed], self.next_change[resumed])
+
+    @staticmethod
+    def _contains_rows(sorted_rows, rows):
+        # rows 中的每个行号是否在升序数组 sorted_rows 中（二分查找，不扫描 sorted_rows）
+        if not len(sorted_rows):
+            return np.zeros(len(rows), dtype=bool)
+        pos = np.minimum(np.searchsorted(sorted_rows, rows), len(sorted_rows) - 1)
+        return sorted_rows[pos] == rows
+
+    def add_cubes(self, positions, colors=(0.5, 0.5, 0.5, 1)):
+        """添加立方体（初始方向随机），返回它们的句柄"""
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        n = len(positions)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        directions = np.radians(self.rng.uniform(0, 360, n))
+        velocities = np.column_stack([np.cos(directions), np.sin(directions)]) * self.base_speed
+        next_change = self.rng.uniform(0, 2.0, n)
+        handles = self.add(
+            n,
+            positions=positions,
+            initial_positions=positions,
+            prev_positions=positions,
+            velocities=velocities,
+            next_change=next_change,
+            colors=colors,
+        )
+        self.direction_timers.schedule(handles, next_change)
+        return handles
+
+    def place(self, handles, positions, velocities, next_change, current_time, schedule=True):
+        """把已有的立方体移到新的位置重新开始巡逻（不增删行，行号和句柄不变）
+
+        显示时不从旧位置插值过来；schedule 为 False 时不登记换向时间（停放不用的立方体）。
+        """
+        rows = self.rows_of(handles)
+        self.positions[rows] = positions
+        self.prev_positions[rows] = positions
+        self.initial_positions[rows] = positions
+        self.velocities[rows] = velocities
+        self.next_change[rows] = next_change
+        self.last_update[rows] = current_time
+        if schedule:
+            self.direction_timers.schedule(handles, self.next_change[rows])
+
+    def remove(self, handles):
+        # 删除会移动行号，参与模拟的行按句柄换算到新的行号
+        active_handles = None if self.active is None else self.handles[self.active]
+        CubeStore.remove(self, handles)
+        if active_handles is not None:
+            self.active = np.sort(self._rows[active_handles][self._rows[active_handles] >= 0])
+        self.advanced_rows = None
+
+    def restore(self, handles, columns, free=()):
+        # 换向时间按恢复后的列重新登记；行号变化时参与模拟的行先清空，由分块管理重新设置
+        changed = CubeStore.restore(self, handles, columns, free)
+        if changed and self.active is not None:
+            self.active = np.zeros(0, dtype=np.intp)
+        self.advanced_rows = None
+        self.timers_stale = True
+        return changed
+
+    def step(self, dt, current_time):
+        # 只推进参与模拟的行（其余立方体保持冻结的状态）
+        n = self.count if self.active is None else len(self.active)
+        if n == 0:
+            return
+        self.advanced_rows = None
+
+        # 只为到达换向时间的立方体重新选择方向（从时间轮取出，不逐个检查所有立方体）
+        due = self._due_rows(current_time)
+        if len(due):
+            self._change_direction(due, current_time)
+
+        # 随机数始终在本进程内按固定顺序生成，并行推进的结果与单进程相同
+        noise = self.rng.uniform(self.rotation_min, self.rotation_max, n)
+        if self.stepper is not None:
+            self.stepper.step(self.active, noise, dt, current_time)
+        else:
+            rows = slice(0, self.count) if self.active is None else self.active
+            integrate(self.storage, rows, noise, dt, current_time)
+
+    def advance(self, rows, dt, current_time):
+        # 把指定的行从各自上次更新的时间推进到 current_time（LOD 低频更新时使用）
+        stale = self.advanced_rows
+        if stale is not None:
+            self.prev_positions[stale] = self.positions[stale]
+            self.prev_headings[stale] = self.headings[stale]
+        self.prev_positions[rows] = self.positions[rows]
+        self.prev_headings[rows] = self.headings[rows]
+        self.advanced_rows = rows
+
+        # 补齐时直接比较各行的换向时间，时间轮中到期的条目只需丢弃
+        self.direction_timers.pop_due(current_time)
+        self.timers_stale = True
+        if len(rows) == 0:
+            return
+
+        # 解析补齐：中途到达换向时间的立方体先以旧速度走到换向时刻，换向后再继续走
+        start = self.last_update[rows].copy()
+        while True:
+            change_at = self.next_change[rows]
+            due_mask = change_at <= current_time
+            if not due_mask.any():
+                break
+            due = rows[due_mask]
+            change_at = np.maximum(change_at[due_mask], start[due_mask])
+            self.positions[due, :2] += self.velocities[due] * (change_at - start[due_mask])[:, None]
+            start[due_mask] = change_at
+            self._change_direction(due, change_at)
+        self.positions[rows, :2] += self.velocities[rows] * (current_time - start)[:, None]
+
+        # 自转按经过的步数缩放（只影响外观）
+        steps = (current_time - self.last_update[rows]) / dt
+        self.headings[rows] += self.rng.uniform(self.rotation_min, self.rotation_max, len(rows)) * steps
+        self.last_update[rows] = current_time
+
+    def _due_rows(self, current_time):
+        # 返回本步到达换向时间的参与模拟的行（升序，与逐个比较换向时间的结果相同）
+        timers = self.direction_timers
+        if self.timers_stale:
+            timers.clear()
+            timers.schedule(self.handles, self.next_change)
+            self.timers_stale = False
+
+        handles, times = timers.pop_due(current_time)
+        rows = self._rows[handles]
+        valid = rows >= 0  # 丢弃已删除的立方体
+        # 换向后留下的旧条目（以及句柄被复用前的条目）与当前的换向时间对不上，丢弃
+        valid[valid] = self.next_change[rows[valid]] == times[valid]
+        rows = np.sort(rows[valid])
+        if len(rows) > 1:
+            rows = rows[np.concatenate([[True], rows[1:] != rows[:-1]])]
+        if self.active is not None:
+            rows = rows[self._contains_rows(self.active, rows)]
+        return rows
+
+    def _change_direction(self, idx, current_time):
+        # 计算当前位置到初始位置的向量
+        to_initial = self.initial_positions[idx, :2] - self.positions[idx, :2]
+        dist_to_initial = np.hypot(to_initial[:, 0], to_initial[:, 1])
+        returning = dist_to_initial > self.patrol_radius
+
+        # 超出巡逻范围的直接朝向初始位置并加速返回，其余的随机移动
+        random_directions = self.rng.uniform(0, 2 * math.pi, len(idx))
+        directions = np.where(
+            returning,
+            np.arctan2(to_initial[:, 1], to_initial[:, 0]),
+            random_directions
+        )
+        speeds = np.where(returning, self.return_speed, self.base_speed)
+
+        self.velocities[idx, 0] = np.cos(directions) * speeds
+        self.velocities[idx, 1] = np.sin(directions) * speeds
+
+        # 设置下一次改变方向的时间
+        self.next_change[idx] = current_time + self.rng.uniform(
+            self.min_interval, self.max_interval, len(idx)
+        )
+        self.direction_timers.schedule(self.handles[idx], self.next_change[idx])
+
+    def interpolated(self, alpha, rows=None):
+        # 上一步与当前步之间的显示状态（alpha 为 1 时直接返回当前状态）；rows 只取部分行
+        if rows is None:
+            positions, headings = self.positions, self.headings
+            prev_positions, prev_headings = self.prev_positions, self.prev_headings
+        else:
+            positions, headings = self.positions[rows], self.headings[rows]
+            prev_positions, prev_headings = self.prev_positions[rows], self.prev_headings[rows]
+        if alpha >= 1.0:
+            return positions, headings
+        return (prev_positions + (positions - prev_positions) * alpha,
+                prev_headings + (headings - prev_headings) * alpha)
@@ -0,0 +1,446 @@
+import math
+from dataclasses import dataclass
+
+from scheduler import EventScheduler
+from sim_input import KEYS
+
+# 角色旋转速度（度/秒）
+TURN_SPEED = 120.0
+
+# 调试快捷键（Q/E）每次改变的血量
+DEBUG_HEALTH_STEP = 10
+
+# 规则状态的全部字段（不包括配置、订阅者、定时器和按键），网络同步时按这些字段发送
+STATE_FIELDS = (
+    'time', 'start_time', 'survival_time', 'current_game', 'game_running',
+    'position', 'prev_position', 'velocity', 'heading', 'prev_heading',
+    'health', 'last_damage_time', 'last_move_time', 'last_regen_time',
+    'can_jump', 'last_jump_time', 'jump_key_released', 'is_first_jump', 'can_double_jump', 'is_double_jumping',
+    'is_invincible', 'invincible_end_time', 'is_landing_invincible', 'landing_invincible_start',
+    'warning_active', 'warning_start_time', 'boundary_violations', 'last_boundary_return_time',
+)
+
+# 规则状态中表示时刻的字段（帧时间），换到另一个时钟上恢复状态时整体平移
+TIME_FIELDS = (
+    'time', 'start_time', 'last_damage_time', 'last_move_time', 'last_regen_time', 'last_jump_time',
+    'invincible_end_time', 'landing_invincible_start', 'warning_start_time', 'last_boundary_return_time',
+)
+
+# 定时事件的 key 和对应的回调方法名（保存状态时只保存 key 和时间）
+TIMER_CALLBACKS = {
+    'invincible': 'end_invincible',
+    'jump_cooldown': 'end_jump_cooldown',
+    'landing_invincible': 'end_landing_invincible',
+    'regen': 'regen_health',
+}
+
+
+@dataclass(frozen=True, slots=True)
+class GameEvent:
+    """游戏状态的一次离散变化：发生时的帧时间、类型和附带的值"""
+    time: float
+    kind: str
+    value: object = None
+
+
+@dataclass(frozen=True, slots=True)
+class TickInput:
+    """一个 tick 的输入：按键状态、一次性动作，以及本步是否碰到立方体（碰撞检测在场景层）"""
+    keys: dict
+    actions: tuple = ()
+    hit: bool = False
+
+
+class GameState:
+    """游戏规则核心：角色运动、生命值、跳跃和二段跳、冷却、无敌、边界违规和局数
+
+    不依赖 Panda3D 和场景图，状态只用浮点数和列表保存，可以脱离窗口单独推进、测速和随机测试。
+    离散变化（生命值变化、起跳、落地、无敌结束、游戏结束、重开等）以 GameEvent 发给订阅者，
+    场景层据此更新 HUD 和特效；倒计时等逐帧显示直接读取状态。
+
+    时间由调用方给出（帧时间）。场景层每帧依次调用 apply_input、begin_frame、
+    若干次 physics_step（碰到立方体时调用 hit_cube）和 end_frame；
+    单独使用时 step(dt, inputs) 按这个顺序推进一个只含一步物理的完整 tick。
+    """
+
+    def __init__(self, cfg, now=0.0):
+        self.listeners = []
+        self.timers = EventScheduler()  # 定时事件（无敌结束、跳跃冷却结束、回血等）
+        self.time = now
+        self.keys = dict.fromkeys(KEYS, False)
+        self.configure(cfg)
+
+        self.heading = cfg.player.initial_heading
+        self.prev_heading = self.heading  # 上一个物理步的朝向（渲染插值用）
+
+        # 跳跃冷却
+        self.last_jump_time = 0
+        self.can_jump = True
+
+        # 受伤冷却和回血
+        self.last_damage_time = 0
+        self.last_move_time = 0
+        self.last_regen_time = 0
+
+        self.current_game = 1
+        self.game_running = True
+        self.survival_time = 0
+        self.reset_player()
+        self.start(now)
+
+    def configure(self, cfg):
+        # 整体替换配置（热重载），刷新从配置缓存下来的参数
+        self.cfg = cfg
+        self.max_health = cfg.player_status.max_health
+        self.floor = cfg.physics.ground_height + cfg.player.height / 2  # 落地时角色中心的高度
+
+    def subscribe(self, listener):
+        # listener(event) 在每个 GameEvent 发生时被调用
+        self.listeners.append(listener)
+
+    def emit(self, kind, value=None):
+        if self.listeners:
+            event = GameEvent(self.time, kind, value)
+            for listener in self.listeners:
+                listener(event)
+
+    def reset_player(self):
+        # 新的一局：生命值、位置、边界和跳跃状态回到初始值（朝向和冷却计时保留）
+        self.health = self.cfg.player_status.initial_health
+        self.position = list(self.cfg.player.initial_position)
+        self.prev_position = list(self.position)  # 上一个物理步的位置（渲染插值用）
+        self.velocity = [0.0, 0.0, 0.0]
+
+        # 边界警告和违规
+        self.warning_active = False
+        self.warning_start_time = 0
+        self.boundary_violations = []   # 警告期满的时间
+        self.last_boundary_return_time = None  # 上次回到边界内的时间（None 表示本局还没有离开过）
+
+        # 二段跳：第一次起跳后、跳跃键松开过且离地足够高时才能使用
+        self.jump_key_released = True
+        self.can_double_jump = False
+        self.is_first_jump = False
+        self.is_double_jumping = False   # 二段跳后到落地前下落变慢
+
+        # 二段跳落地后的无敌
+        self.is_landing_invincible = False
+        self.landing_invincible_start = 0
+        self.timers.cancel('landing_invincible')
+
+    def start(self, now):
+        # 从 now 开始计算存活时间和出生无敌时间
+        self.time = now
+        self.start_time = now
+        self.start_invincible()
+
+    def start_invincible(self):
+        self.is_invincible = True
+        self.invincible_end_time = self.time + self.cfg.game_rules.damage.invincible_time
+        self.timers.schedule(self.invincible_end_time, self.end_invincible, key='invincible')
+
+    # ---- 保存和恢复 ----
+
+    def pending_timers(self):
+        # 未到期的定时事件 [(时间, key)]，按执行顺序排列
+        return self.timers.pending()
+
+    def restore_timers(self, entries):
+        # 替换全部定时事件（entries 为 pending_timers 的结果）
+        self.timers.clear()
+        for time, key in entries:
+            self.timers.schedule(time, getattr(self, TIMER_CALLBACKS[key]), key=key)
+
+    def shift_time(self, offset):
+        # 把所有时刻字段和定时事件平移 offset 秒（在另一个时钟上继续一份保存的状态）
+        for name in TIME_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                setattr(self, name, value + offset)
+        self.boundary_violations = [t + offset for t in self.boundary_violations]
+        self.restore_timers([(time + offset, key) for time, key in self.pending_timers()])
+
+    # ---- 每帧的推进步骤 ----
+
+    def step(self, dt, inputs):
+        # 按固定步长推进一个完整的 tick（不需要场景层时使用）
+        self.apply_input(self.time + dt, inputs.keys, inputs.actions)
+        if not self.game_running:
+            return
+        self.begin_frame(self.time)
+        self.physics_step(dt)
+        if inputs.hit:
+            self.hit_cube()
+        self.end_frame()
+
+    def apply_input(self, now, keys, actions=()):
+        # 应用本 tick 采样到的按键状态和一次性动作（游戏结束后也处理，R 键可以重开）
+        self.time = now
+        for key, value in keys.items():
+            if self.keys[key] != value:
+                self.keys[key] = value
+                if key == "up" and not value:
+                    self.jump_key_released = True
+        for action in actions:
+            if action == "damage":
+                self.change_health(-DEBUG_HEALTH_STEP)
+            elif action == "heal":
+                self.change_health(DEBUG_HEALTH_STEP)
+            elif action == "restart":
+                self.restart()
+
+    def begin_frame(self, now):
+        # 帧开始（游戏进行中）：按是否移动安排或取消回血，处理到期的定时事件
+        self.time = now
+        keys = self.keys
+        has_movement = (keys["forward"] or keys["backward"] or
+                        keys["turn_left"] or keys["turn_right"] or
+                        math.hypot(*self.velocity) > 0.1)  # 检查是否还在移动
+        if has_movement:
+            self.last_move_time = now
+            self.timers.cancel('regen')
+        elif self.health < self.max_health and 'regen' not in self.timers:
+            # 静止且未满血时安排下一次回血
+            self.schedule_regen()
+        self.timers.run_due(now)
+
+    def physics_step(self, dt):
+        # 一个固定步长的角色物理步：转向和加速、跳跃、重力积分和落地
+        keys = self.keys
+        physics = self.cfg.physics
+        self.prev_position = self.position
+        self.prev_heading = self.heading
+
+        if keys["turn_left"]:
+            self.heading += TURN_SPEED * dt
+        if keys["turn_right"]:
+            self.heading -= TURN_SPEED * dt
+
+        # 只有前后移动，方向由角色朝向决定
+        heading_rad = self.heading * math.pi / 180.0
+        forward_x, forward_y = -math.sin(heading_rad), math.cos(heading_rad)
+        move_x = move_y = 0.0
+        if keys["forward"]:
+            move_x += forward_x
+            move_y += forward_y
+        if keys["backward"]:
+            move_x -= forward_x
+            move_y -= forward_y
+
+        vx, vy, vz = self.velocity
+        length = math.hypot(move_x, move_y)
+        if length > 0:
+            vx += move_x / length * physics.acceleration * dt
+            vy += move_y / length * physics.acceleration * dt
+            # 限制水平速度
+            horizontal_speed = math.hypot(vx, vy)
+            if horizontal_speed > physics.max_speed:
+                scale = physics.max_speed / horizontal_speed
+                vx *= scale
+                vy *= scale
+        else:
+            # 减速系数是每秒保留的速度比例，按步长换算
+            decay = physics.deceleration_per_second ** dt
+            vx *= decay
+            vy *= decay
+
+        x, y, z = self.position
+        height_from_ground = z - self.floor
+        if keys["up"] and not self.is_invincible and not self.is_landing_invincible:
+            double_jump = physics.double_jump
+            if z <= self.floor + 0.1:
+                # 在地面上时可以进行普通跳跃
+                if self.can_jump:
+                    vz = physics.jump_speed
+                    self.start_jump_cooldown()
+                    self.is_first_jump = True
+                    self.can_double_jump = True
+                    self.jump_key_released = False
+                    self.emit('jump')
+            elif (self.is_first_jump and self.can_double_jump and
+                  height_from_ground >= double_jump.min_height and
+                  self.jump_key_released and
+                  self.health > double_jump.health_cost):
+                # 达到指定高度所需的初速度：v = sqrt(2gh)
+                vz = math.sqrt(2 * abs(physics.gravity) * double_jump.height)
+                self.can_double_jump = False
+                self.jump_key_released = False
+                self.change_health(-double_jump.health_cost)
+                self.is_double_jumping = True
+                self.emit('double_jump')
+
+        gravity = physics.gravity
+        if self.is_double_jumping:
+            gravity *= physics.double_jump.fall_speed_scale
+        vz += gravity * dt
+        x += vx * dt
+        y += vy * dt
+        z += vz * dt
+
+        # 落地检测
+        if z <= self.floor:
+            z = self.floor
+            vz = 0.0
+            self.is_first_jump = False
+            self.can_double_jump = False
+            if self.is_double_jumping:
+                # 从二段跳落地：短暂无敌，跳跃冷却更长
+                self.is_landing_invincible = True
+                self.landing_invincible_start = self.time
+                self.timers.schedule(
+                    self.time + physics.double_jump.landing_invincible_time,
+                    self.end_landing_invincible, key='landing_invincible'
+                )
+                self.start_jump_cooldown()
+                self.is_double_jumping = False
+                self.emit('landing_invincible')
+
+        self.position = [x, y, z]
+        self.velocity = [vx, vy, vz]
+
+    def hit_cube(self, time=None):
+        # 角色碰到立方体：不在无敌和受伤冷却中时扣血（time 为接触时刻，连续碰撞检测时可能早于当前帧时间）
+        if not self.game_running or self.is_invincible or self.is_landing_invincible:
+            return
+        damage = self.cfg.game_rules.damage
+        hit_time = self.time if time is None else time
+        if hit_time - self.last_damage_time >= damage.damage_cooldown:
+            self.change_health(-damage.cube_collision)
+            self.last_damage_time = hit_time
+            self.emit('hit')
+
+    def end_frame(self):
+        # 帧结束：更新存活时间和局数，检查边界
+        if self.game_running:
+            self.survival_time = int(self.time - self.start_time)
+            # 热重载减少了局数时，超出的局按最后一局计算
+            round_times = self.cfg.game_rules.round_times
+            if self.survival_time >= round_times[min(self.current_game, len(round_times)) - 1]:
+                if self.current_game < len(round_times):
+                    self.current_game += 1
+                    self.restart()
+                else:
+                    self.victory()
+                return
+        self.check_boundaries()
+
+    # ---- 生命值和局数 ----
+
+    def change_health(self, amount):
+        self.health = max(0, min(self.max_health, self.health + amount))
+        self.emit('health', self.health)
+        if self.health <= 0 and self.game_running:
+            self.game_over()
+
+    def game_over(self):
+        self.game_running = False
+        self.survival_time = int(self.time - self.start_time)
+        self.emit('game_over', self.survival_time)
+
+    def victory(self):
+        self.game_running = False
+        self.emit('victory')
+
+    def restart(self):
+        # 游戏结束或胜利后重开时回到第一局，局间重开保留局数
+        if not self.game_running:
+            self.current_game = 1
+        self.reset_player()
+        self.change_health(0)
+        self.game_running = True
+        self.start(self.time)
+        self.emit('restart', self.current_game)
+
+    # ---- 定时事件 ----
+
+    def jump_cooldown(self):
+        # 根据是否是二段跳落地选择不同的冷却时间，返回 (冷却时间, 剩余时间)
+        double_jump = self.cfg.physics.double_jump
+        cooldown_time = (double_jump.landing_cooldown
+                         if self.is_double_jumping or
+                         (self.time - self.landing_invincible_start < double_jump.landing_invincible_time)
+                         else self.cfg.physics.jump_cooldown)
+        return cooldown_time, cooldown_time - (self.time - self.last_jump_time)
+
+    def start_jump_cooldown(self):
+        self.last_jump_time = self.time
+        self.can_jump = False
+        cooldown_time, _ = self.jump_cooldown()
+        self.timers.schedule(self.last_jump_time + cooldown_time, self.end_jump_cooldown, key='jump_cooldown')
+
+    def end_jump_cooldown(self):
+        # 冷却时间可能在冷却期间变长（起跳后进入二段跳），没到时间就推迟到新的结束时刻
+        # （按绝对的结束时刻比较，与定时器的到期判断一致，浮点误差不会让它在同一帧内反复推迟）
+        cooldown_time, _ = self.jump_cooldown()
+        end_time = self.last_jump_time + cooldown_time
+        if self.time < end_time:
+            self.timers.schedule(end_time, self.end_jump_cooldown, key='jump_cooldown')
+            return
+        self.can_jump = True
+        self.emit('jump_ready')
+
+    def end_landing_invincible(self):
+        self.is_landing_invincible = False
+        self.emit('landing_invincible_end')
+
+    def end_invincible(self):
+        self.is_invincible = False
+        self.emit('invincible_end')
+
+    def schedule_regen(self):
+        # 静止满 still_time 且距上次回血满 interval 时回血
+        regen = self.cfg.player_status.health_regen
+        self.timers.schedule(
+            max(self.last_move_time + regen.still_time, self.last_regen_time + regen.interval),
+            self.regen_health, key='regen'
+        )
+
+    def regen_health(self):
+        if self.health < self.max_health:
+            self.change_health(self.cfg.player_status.health_regen.amount)
+            self.last_regen_time = self.time
+        if self.health < self.max_health:
+            self.schedule_regen()
+
+    # ---- 边界 ----
+
+    def check_boundaries(self):
+        now = self.time
+        rules = self.cfg.game_rules
+        violation = rules.boundaries.violation
+        x, y, _ = self.position
+        x_min, x_max = rules.boundaries.x
+        y_min, y_max = rules.boundaries.y
+
+        if x < x_min or x > x_max or y < y_min or y > y_max:
+            if not self.warning_active:
+                self.warning_active = True
+                self.warning_start_time = now
+                # 在安全返回时间内再次离开边界，直接游戏结束
+                if self.last_boundary_return_time is not None:
+                    time_since_return = now - self.last_boundary_return_time
+                    if time_since_return < violation.safe_return_time:
+                        self.emit('left_too_soon', time_since_return)
+                        self.change_health(-self.max_health)
+                        return
+                self.emit('warning_start')
+            elif now - self.warning_start_time >= rules.damage.warning_time:
+                # 警告期满：记录违规时间并清理计数窗口外的记录
+                self.boundary_violations.append(now)
+                self.boundary_violations = [t for t in self.boundary_violations
+                                            if now - t <= violation.count_time]
+                if len(self.boundary_violations) >= violation.max_violations:
+                    # 窗口内违规次数达到上限，造成双倍伤害并清空记录
+                    self.change_health(-rules.damage.out_of_bounds * 2)
+                    self.boundary_violations = []
+                    self.emit('boundary_double_damage')
+                else:
+                    self.change_health(-rules.damage.out_of_bounds)
+                    self.emit('boundary_damage', len(self.boundary_violations))
+                self.warning_active = False
+                self.emit('warning_end')
+        elif self.warning_active:
+            # 回到边界内，记录返回时间
+            self.last_boundary_return_time = now
+            self.warning_active = False
+            self.emit('warning_end')
@@ -0,0 +1,140 @@
+from functools import lru_cache
+
+import numpy as np
+from panda3d.core import (
+    GeomVertexArrayFormat, GeomVertexFormat, GeomVertexData, InternalName,
+    Geom, GeomTriangles, GeomLines
+)
+
+# 长方体的8个顶点（单位尺寸，使用时按半边长缩放）
+BOX_POINTS = np.array([
+    (-1, -1, -1), (1, -1, -1), (1, 1, -1), (-1, 1, -1),  # 底部
+    (-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1)       # 顶部
+], dtype=np.float32)
+
+# 每个面的法线
+BOX_NORMALS = np.array([
+    (0, 0, -1),  # 底面
+    (0, 0, 1),   # 顶面
+    (-1, 0, 0),  # 左面
+    (1, 0, 0),   # 右面
+    (0, -1, 0),  # 前面
+    (0, 1, 0),   # 后面
+], dtype=np.float32)
+
+# 面的顶点索引
+BOX_FACES = np.array([
+    (0, 1, 2, 3),  # 底面
+    (4, 5, 6, 7),  # 顶面
+    (0, 4, 7, 3),  # 左面
+    (1, 5, 6, 2),  # 右面
+    (0, 1, 5, 4),  # 前面
+    (3, 2, 6, 7),  # 后面
+])
+
+# 四边形 (a, b, c, d) 拆成两个三角形 (a, b, c) 和 (a, c, d)
+QUAD_TRIANGLES = np.array([0, 1, 2, 0, 2, 3])
+
+
+@lru_cache(maxsize=None)
+def vertex_format(normals, colors):
+    """全部为 float32 的交错顶点格式，与 NumPy 数组的内存布局一一对应"""
+    array_format = GeomVertexArrayFormat()
+    array_format.addColumn(InternalName.getVertex(), 3, Geom.NT_float32, Geom.C_point)
+    if normals:
+        array_format.addColumn(InternalName.getNormal(), 3, Geom.NT_float32, Geom.C_normal)
+    if colors:
+        array_format.addColumn(InternalName.getColor(), 4, Geom.NT_float32, Geom.C_color)
+    return GeomVertexFormat.registerFormat(GeomVertexFormat(array_format))
+
+
+def make_geom(name, primitive_type, vertices, indices, normals=None, colors=None):
+    """由 NumPy 数组构建 Geom：顶点和索引各一次整块拷贝，不逐个调用 addData"""
+    vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+    n = len(vertices)
+    columns = [vertices]
+    if normals is not None:
+        columns.append(np.broadcast_to(np.asarray(normals, dtype=np.float32), (n, 3)))
+    if colors is not None:
+        columns.append(np.broadcast_to(np.asarray(colors, dtype=np.float32), (n, 4)))
+    interleaved = np.ascontiguousarray(np.hstack(columns), dtype=np.float32)
+
+    vdata = GeomVertexData(name, vertex_format(normals is not None, colors is not None), Geom.UHStatic)
+    vdata.setNumRows(n)
+    memoryview(vdata.modifyArray(0)).cast('B')[:] = interleaved.tobytes()
+
+    indices = np.ascontiguousarray(indices, dtype=np.uint32).ravel()
+    primitive = primitive_type(Geom.UHStatic)
+    primitive.setIndexType(Geom.NT_uint32)
+    index_data = primitive.modifyVertices()
+    index_data.uncleanSetNumRows(len(indices))
+    memoryview(index_data).cast('B')[:] = indices.tobytes()
+
+    geom = Geom(vdata)
+    geom.addPrimitive(primitive)
+    return geom
+
+
+@lru_cache(maxsize=None)
+def make_box_geom(half_extents=(1, 1, 1), color=(0.5, 0.5, 0.5, 1), name='box'):
+    """按参数缓存的长方体网格，相同参数的调用共享同一个 Geom（同一份顶点缓冲）"""
+    # 每个面独立的 4 个顶点，以便设置正确的法线
+    vertices = BOX_POINTS[BOX_FACES.ravel()] * np.asarray(half_extents, dtype=np.float32)
+    normals = np.repeat(BOX_NORMALS, 4, axis=0)
+    indices = (np.arange(6)[:, None] * 4 + QUAD_TRIANGLES).ravel()
+    return make_geom(name, GeomTriangles, vertices, indices, normals=normals, colors=color)
+
+
+@lru_cache(maxsize=None)
+def make_quad_geom(x_range, y_range, z, color, name='quad'):
+    """水平矩形（地面）"""
+    (x0, x1), (y0, y1) = x_range, y_range
+    vertices = [(x0, y0, z), (x1, y0, z), (x1, y1, z), (x0, y1, z)]
+    return make_geom(name, GeomTriangles, vertices, QUAD_TRIANGLES, colors=color)
+
+
+@lru_cache(maxsize=None)
+def make_grid_geom(x_range, y_range, spacing, z, color, name='grid'):
+    """水平网格线：每条线两个顶点，全部线段放在一个图元中"""
+    (x0, x1), (y0, y1) = x_range, y_range
+    xs = x0 + spacing * np.arange(int((x1 - x0) / spacing) + 1)
+    ys = y0 + spacing * np.arange(int((y1 - y0) / spacing) + 1)
+
+    # 平行于 Y 轴的线 (x, y0) - (x, y1)，然后是平行于 X 轴的线 (x0, y) - (x1, y)
+    along_y = np.stack([np.column_stack([xs, np.full_like(xs, y0)]),
+                        np.column_stack([xs, np.full_like(xs, y1)])], axis=1)
+    along_x = np.stack([np.column_stack([np.full_like(ys, x0), ys]),
+                        np.column_stack([np.full_like(ys, x1), ys])], axis=1)
+    points = np.concatenate([along_y, along_x]).reshape(-1, 2)
+    vertices = np.column_stack([points, np.full(len(points), z)])
+    return make_geom(name, GeomLines, vertices, np.arange(len(vertices)), colors=color)
+
+
+@lru_cache(maxsize=None)
+def make_ring_geom(inner_radius, outer_radius, segments, z, inner_color, outer_color, name='ring'):
+    """平面圆环（内圈到外圈颜色渐变）"""
+    angles = 2.0 * np.pi * np.arange(segments + 1) / segments
+    unit = np.column_stack([np.cos(angles), np.sin(angles)])
+
+    # 顶点按 内圈、外圈 交替排列
+    vertices = np.empty((segments + 1, 2, 3))
+    vertices[:, 0, :2] = unit * inner_radius
+    vertices[:, 1, :2] = unit * outer_radius
+    vertices[:, :, 2] = z
+    colors = np.empty((segments + 1, 2, 4))
+    colors[:, 0] = inner_color
+    colors[:, 1] = outer_color
+
+    # 每段由两个三角形组成
+    base = 2 * np.arange(segments)[:, None]
+    indices = base + np.array([0, 1, 3, 0, 3, 2])
+    return make_geom(name, GeomTriangles, vertices, indices, colors=colors.reshape(-1, 4))
+
+
+def flatten_static(parent, nodes, name='static_scene'):
+    """把不会移动的节点合并到一个节点下并压平（合并变换和状态相同的几何体，减少节点和绘制调用）"""
+    root = parent.attachNewNode(name)
+    for node in nodes:
+        node.reparentTo(root)
+    root.flattenStrong()
+    return root
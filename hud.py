@@ -0,0 +1,138 @@
+class NullText:
+    """无窗口模式下替代 OnscreenText 的空实现，只记录文本内容"""
+
+    def __init__(self, text='', fg=(1, 1, 1, 1), **kwargs):
+        self.text = text
+        self.fg = fg
+
+    def setText(self, text):
+        self.text = text
+
+    def getText(self):
+        return self.text
+
+    def setFg(self, fg):
+        self.fg = fg
+
+    def setPos(self, *pos):
+        pass
+
+    def setScale(self, *scale):
+        pass
+
+    def setAlign(self, align):
+        pass
+
+    def show(self):
+        pass
+
+    def hide(self):
+        pass
+
+    def destroy(self):
+        pass
+
+
+class NullWaitBar:
+    """无窗口模式下替代 DirectWaitBar 的空实现，支持 bar['value'] 形式的读写"""
+
+    def __init__(self, **kwargs):
+        self.options = dict(kwargs)
+
+    def __getitem__(self, key):
+        return self.options[key]
+
+    def __setitem__(self, key, value):
+        self.options[key] = value
+
+    def destroy(self):
+        pass
+
+
+class CachedText:
+    """记录上一次显示内容的文本控件包装：文本和颜色不变时不调用底层控件，避免重新生成字形几何"""
+
+    __slots__ = ('widget', 'text', 'fg')
+
+    def __init__(self, widget, text='', fg=(1, 1, 1, 1)):
+        self.widget = widget
+        self.text = text
+        self.fg = tuple(fg)
+
+    def setText(self, text):
+        if text != self.text:
+            self.text = text
+            self.widget.setText(text)
+
+    def getText(self):
+        return self.text
+
+    def setFg(self, fg):
+        fg = tuple(fg)
+        if fg != self.fg:
+            self.fg = fg
+            self.widget.setFg(fg)
+
+    def setPos(self, *pos):
+        self.widget.setPos(*pos)
+
+    def setScale(self, *scale):
+        self.widget.setScale(*scale)
+
+    def setAlign(self, align):
+        self.widget.setAlign(align)
+
+    def show(self):
+        self.widget.show()
+
+    def hide(self):
+        self.widget.hide()
+
+    def destroy(self):
+        self.widget.destroy()
+
+
+class TextPool:
+    """预先创建的一组临时文本（警告、结束提示等）：取用时设置内容并显示，归还时隐藏，不反复创建和销毁控件
+
+    取用和归还都是 O(1)；池用完时再创建新的控件，归还后一直留在池中。
+    """
+
+    def __init__(self, create, size):
+        self.create = create
+        self.free = [self._new() for _ in range(size)]
+
+    def _new(self):
+        text = self.create(text='', mayChange=True)
+        text.hide()
+        return text
+
+    def acquire(self, text, pos, scale, fg, align):
+        widget = self.free.pop() if self.free else self._new()
+        widget.setText(text)
+        widget.setPos(*pos)
+        widget.setScale(scale)
+        widget.setFg(fg)
+        widget.setAlign(align)
+        widget.show()
+        return widget
+
+    def release(self, widget):
+        widget.hide()
+        self.free.append(widget)
+
+
+class Throttle:
+    """按固定频率放行的节流器（rate <= 0 表示每次都放行）"""
+
+    __slots__ = ('interval', 'next_time')
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_time = float('-inf')
+
+    def ready(self, now):
+        if now < self.next_time:
+            return False
+        self.next_time = now + self.interval
+        return True
@@ -0,0 +1,58 @@
+import time
+
+from direct.task import Task
+
+
+class StagedLoader:
+    """分阶段加载：每帧只在时间预算内推进加载工作，剩余的留到下一帧
+
+    每个阶段是 (名称, 权重, 生成器函数)，生成器每完成一小块工作 yield 一次本阶段的完成比例（0~1），
+    总进度按各阶段的权重累计。全部完成后调用 on_finish。
+    """
+
+    def __init__(self, stages, frame_budget, on_progress=None, on_finish=None):
+        self.stages = list(stages)
+        self.total_weight = sum(weight for _, weight, _ in self.stages) or 1
+        self.frame_budget = frame_budget
+        self.on_progress = on_progress
+        self.on_finish = on_finish
+
+        self.index = 0           # 当前阶段
+        self.current = None      # 当前阶段的生成器
+        self.done_weight = 0.0   # 已完成阶段的权重之和
+        self.progress = 0.0
+        self.stage_name = ''
+        self.finished = False
+
+    def run(self, budget=None):
+        # 推进加载直到用完时间预算（None 表示一直到全部完成），返回是否已全部完成
+        deadline = None if budget is None else time.perf_counter() + budget
+        while self.index < len(self.stages):
+            name, weight, stage = self.stages[self.index]
+            if self.current is None:
+                self.current = iter(stage())
+                self.stage_name = name
+            for fraction in self.current:
+                self.progress = (self.done_weight + weight * fraction) / self.total_weight
+                if deadline is not None and time.perf_counter() >= deadline:
+                    self._report()
+                    return False
+            self.done_weight += weight
+            self.index += 1
+            self.current = None
+            self.progress = self.done_weight / self.total_weight
+
+        self._report()
+        if not self.finished:
+            self.finished = True
+            if self.on_finish:
+                self.on_finish()
+        return True
+
+    def _report(self):
+        if self.on_progress:
+            self.on_progress(self.stage_name, self.progress)
+
+    def task(self, task):
+        # 作为每帧任务运行，加载完成后自动移除
+        return Task.done if self.run(self.frame_budget) else Task.cont
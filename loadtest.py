@@ -0,0 +1,239 @@
+"""压力测试：在本机模拟大量玩家连接专用服务器，统计每个会话的 tick 延迟和服务器的 CPU 占用
+
+用法：python loadtest.py --players 200 --duration 30 --spawn-server --output load.json
+
+每个模拟玩家循环执行默认输入脚本（起始位置随机），收到每步的状态消息后按需发送按键变化，游戏结束后立即重开。
+预热结束和测试结束时各向服务器查询一次统计，CPU 占用按两次之间服务器进程的 CPU 时间计算；
+tick 延迟是服务器一侧每步从计划时刻到状态发出的时间，客户端一侧另外统计状态消息的到达间隔和输入的往返时间。
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from netcode import decode, encode
+from settings import load_settings
+from sim_input import default_script
+
+CONFIG_PATH = Path(__file__).parent / "config.yaml"
+
+
+def percentiles_ms(samples):
+    if not samples:
+        return None
+    values = np.array(samples) * 1000.0
+    p50, p99 = np.percentile(values, [50, 99]).tolist()
+    return {'p50': p50, 'p99': p99, 'max': float(values.max())}
+
+
+class FakePlayer:
+    """一个模拟玩家：一个连接、一个服务器会话"""
+
+    def __init__(self, index, rng):
+        self.index = index
+        self.script = default_script()
+        self.offset = rng.randrange(self.script.period)
+        self.session = None
+        self.error = None
+        self.messages = 0
+        self.restarts = 0
+        self.intervals = []  # 状态消息的到达间隔（秒）
+        self.round_trips = []  # 输入发出到服务器确认（状态消息的 ack）的时间（秒）
+
+    async def run(self, host, port, warmup_end, deadline, stop):
+        # 统计 [warmup_end, deadline) 内的样本，连接保持到 stop 被设置（结束统计查询完成后）
+        loop = asyncio.get_running_loop()
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as exc:
+            self.error = str(exc)
+            return
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        writer.write(encode({'type': 'join'}))
+        welcome = decode(await reader.readline())
+        if welcome['type'] != 'welcome':
+            self.error = welcome.get('message')
+            writer.close()
+            return
+        self.session = welcome['session']
+
+        running = welcome['fields']['game_running']
+        sent_keys = None
+        seq = 0
+        pending = {}  # 输入序号 -> 发出时间
+        last_arrival = None
+        restart_sent = False
+        try:
+            while not stop.is_set():
+                line = await reader.readline()
+                if not line:
+                    self.error = 'disconnected'
+                    break
+                message = decode(line)
+                if message['type'] != 'state':
+                    continue
+                now = loop.time()
+                measuring = warmup_end <= now < deadline
+                self.messages += 1
+                if last_arrival is not None and measuring:
+                    self.intervals.append(now - last_arrival)
+                last_arrival = now
+                for acked in [s for s in pending if s <= message['ack']]:
+                    sent_at = pending.pop(acked)
+                    if measuring:
+                        self.round_trips.append(now - sent_at)
+
+                running = message['fields'].get('game_running', running)
+                if running:
+                    restart_sent = False
+                keys = self.script.keys_at(message['tick'] + self.offset)
+                actions = []
+                if not running and not restart_sent:
+                    actions.append('restart')
+                    restart_sent = True
+                    self.restarts += 1
+                if keys != sent_keys or actions:
+                    seq += 1
+                    pending[seq] = now
+                    writer.write(encode({'type': 'input', 'seq': seq, 'keys': keys, 'actions': actions}))
+                    sent_keys = keys
+        except ConnectionError as exc:
+            self.error = str(exc)
+        writer.close()
+
+    def result(self):
+        return {
+            'player': self.index,
+            'session': self.session,
+            'error': self.error,
+            'messages': self.messages,
+            'restarts': self.restarts,
+            'message_interval_ms': percentiles_ms(self.intervals),
+            'input_round_trip_ms': percentiles_ms(self.round_trips),
+        }
+
+
+async def query_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({'type': 'stats'}))
+    stats = decode(await reader.readline())
+    writer.close()
+    return stats
+
+
+async def run_load(host, port, players, duration, warmup, connect_interval, seed):
+    # 逐个建立连接（间隔 connect_interval 秒），所有玩家到齐并预热后开始统计
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    fakes = [FakePlayer(i, rng) for i in range(players)]
+    ramp = players * connect_interval
+    warmup_end = loop.time() + ramp + warmup
+    deadline = warmup_end + duration
+    stop = asyncio.Event()
+    tasks = []
+    for fake in fakes:
+        tasks.append(asyncio.create_task(fake.run(host, port, warmup_end, deadline, stop)))
+        await asyncio.sleep(connect_interval)
+
+    await asyncio.sleep(max(warmup_end - loop.time(), 0))
+    start = await query_stats(host, port)
+    await asyncio.sleep(max(deadline - loop.time(), 0))
+    end = await query_stats(host, port)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return fakes, start, end
+
+
+def summarize(fakes, start, end):
+    wall = end['wall_seconds'] - start['wall_seconds']
+    cpu = end['cpu_seconds'] - start['cpu_seconds']
+    per_session = end['per_session']
+    sessions = [per_session.get(str(fake.session)) for fake in fakes]
+    sessions = [session for session in sessions if session]
+    p50s = [session['latency_ms']['p50'] for session in sessions]
+    p99s = [session['latency_ms']['p99'] for session in sessions]
+    intervals = [interval for fake in fakes for interval in fake.intervals]
+    round_trips = [rtt for fake in fakes for rtt in fake.round_trips]
+    return {
+        'players': len(fakes),
+        'connected': sum(fake.session is not None for fake in fakes),
+        'errors': sum(fake.error is not None for fake in fakes),
+        'server_sessions': end['sessions'],
+        'tick_rate': end['tick_rate'],
+        'server_cpu_percent': cpu / wall * 100 if wall > 0 else 0.0,
+        'tick_latency_ms': {
+            'session_p50_median': float(np.median(p50s)) if p50s else None,
+            'session_p99_median': float(np.median(p99s)) if p99s else None,
+            'session_p99_max': max(p99s) if p99s else None,
+        },
+        'dropped_ticks': sum(session['dropped_ticks'] for session in sessions),
+        'message_interval_ms': percentiles_ms(intervals),
+        'input_round_trip_ms': percentiles_ms(round_trips),
+    }
+
+
+def spawn_server(port, tick_rate):
+    # 启动 server.py 子进程并等待它开始监听
+    command = [sys.executable, str(Path(__file__).parent / 'server.py'), '--port', str(port)]
+    if tick_rate:
+        command += ['--tick-rate', str(tick_rate)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('Serving on'):
+        process.kill()
+        raise SystemExit(f"server failed to start: {line.strip()}")
+    return process
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=50, help='模拟玩家数（每个玩家一个会话）')
+    parser.add_argument('--duration', type=float, default=20.0, help='统计时长（秒）')
+    parser.add_argument('--warmup', type=float, default=2.0, help='所有玩家连接后、开始统计前的预热时间（秒）')
+    parser.add_argument('--connect-interval', type=float, default=0.01, help='相邻两个玩家建立连接的间隔（秒）')
+    parser.add_argument('--host', help='服务器地址（默认使用配置）')
+    parser.add_argument('--port', type=int, help='服务器端口（默认使用配置）')
+    parser.add_argument('--spawn-server', action='store_true', help='在子进程中启动服务器，测试结束后关闭')
+    parser.add_argument('--tick-rate', type=float, help='启动的服务器的会话步频（默认使用配置）')
+    parser.add_argument('--seed', type=int, default=0, help='模拟玩家脚本起始位置的随机种子')
+    parser.add_argument('--raw', action='store_true', help='在结果中包含每个玩家的统计')
+    parser.add_argument('--output', help='JSON 结果输出路径（默认输出到标准输出）')
+    args = parser.parse_args(argv)
+
+    cfg = load_settings(CONFIG_PATH)
+    host = args.host or cfg.server.host
+    port = cfg.server.port if args.port is None else args.port
+    server = spawn_server(port, args.tick_rate) if args.spawn_server else None
+    try:
+        fakes, start, end = asyncio.run(run_load(host, port, args.players, args.duration, args.warmup,
+                                                 args.connect_interval, args.seed))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    summary = summarize(fakes, start, end)
+    latency = summary['tick_latency_ms']
+    print(f"{summary['connected']}/{summary['players']} players, {summary['tick_rate']:g} ticks/s: "
+          f"server CPU {summary['server_cpu_percent']:.0f}%, tick latency p50 {latency['session_p50_median']:.2f}ms "
+          f"(worst session p99 {latency['session_p99_max']:.2f}ms), dropped ticks {summary['dropped_ticks']}",
+          file=sys.stderr)
+    report = {'duration': args.duration, **summary}
+    if args.raw:
+        report['per_player'] = [dict(fake.result(), server=end['per_session'].get(str(fake.session)))
+                                for fake in fakes]
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class CubeLod:
+    """按与玩家的距离分级更新立方体：近处的每步更新，远处的轮流低频更新
+
+    每个物理步只重新计算 1/far_interval 的立方体到玩家的距离，
+    所以每个立方体最多 far_interval 步就会重新分级一次。
+    """
+
+    def __init__(self, swarm, lod_cfg):
+        self.swarm = swarm
+        self.configure(lod_cfg)
+        self.rows = None            # 当前参与分级的行（CubeSwarm.active 或全部）
+        self.all_rows = np.zeros(0, dtype=np.intp)
+        self.near_flags = np.zeros(0, dtype=bool)
+        self.phase = 0
+        self.near_count = 0         # 近处（每步更新）的立方体数
+        self.dormant_count = 0      # 远处（低频更新）的立方体数
+        self.updated_count = 0      # 上一步实际推进的立方体数
+
+    def configure(self, lod_cfg):
+        self.near_distance_sq = float(lod_cfg.near_distance) ** 2
+        self.interval = lod_cfg.far_interval
+        self.phase = 0
+
+    def _candidate_rows(self):
+        if self.swarm.active is not None:
+            return self.swarm.active
+        # 不分块时所有立方体都参与分级（缓存行号数组，立方体数量变化时重建）
+        if len(self.all_rows) != self.swarm.count:
+            self.all_rows = np.arange(self.swarm.count)
+        return self.all_rows
+
+    def select(self, x, y):
+        # 返回本步需要推进的行：近处的全部 + 轮到重新分级的远处立方体
+        rows = self._candidate_rows()
+        if rows is not self.rows:
+            # 参与模拟的立方体变化（加载或卸载了块）时先全部视为近处，之后逐步重新分级
+            self.rows = rows
+            self.near_flags = np.ones(len(rows), dtype=bool)
+            self.phase = 0
+
+        turn = slice(self.phase, None, self.interval)
+        self.phase = (self.phase + 1) % self.interval
+
+        offset = self.swarm.positions[rows[turn], :2] - (x, y)
+        self.near_flags[turn] = np.einsum('ij,ij->i', offset, offset) < self.near_distance_sq
+
+        flags = self.near_flags.copy()
+        flags[turn] = True
+        selected = rows[flags]
+
+        self.near_count = int(np.count_nonzero(self.near_flags))
+        self.dormant_count = len(rows) - self.near_count
+        self.updated_count = len(selected)
+        return selected
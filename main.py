@@ -1,42 +1,126 @@
 from direct.showbase.ShowBase import ShowBase
-from direct.actor.Actor import Actor
 from panda3d.core import (
-    Point3, WindowProperties, 
-    GeomVertexFormat, GeomVertexData,
-    Geom, GeomTriangles, GeomVertexWriter, GeomNode, GeomLines,
-    GeomTristrips,
+    Point3, WindowProperties, ClockObject, loadPrcFileData,
+    GeomNode,
     TextNode, AmbientLight, DirectionalLight,
     NodePath, CollisionNode, CollisionBox, CollisionCapsule, BitMask32,
     CollisionTraverser, CollisionHandlerQueue
 )
-from direct.gui.OnscreenText import OnscreenText
 from direct.task import Task
 import math
 from math import radians
-from omegaconf import OmegaConf
+import numpy as np
 from pathlib import Path
+import argparse
+import atexit
+import dataclasses
+import hashlib
 import random
-from direct.gui.DirectWaitBar import DirectWaitBar
+import struct
+import time
+import zlib
+from cube_swarm import CubeSwarm, layout_positions
+from geometry import make_box_geom, make_ring_geom
+from world import ChunkedWorld
+from lod import CubeLod
+from collision import TraverserCollisionBackend, ProximityCollisionBackend
+from hud import NullText, NullWaitBar, CachedText, TextPool, Throttle
+from sim_input import default_script
+from profiling import NULL_TIMER, FrameProfiler
+from settings import MAX_SEED, load_settings, SettingsReloader
+from replay import InputRecorder, ReplayLog
+from netcode import RemoteSession, apply_fields, world_crc
+from snapshot import Checkpointer, Snapshot, SnapshotError
+from waves import CubePool, WaveDirector
+from timestep import FixedStepClock
+from loader import StagedLoader
+from scheduler import EventScheduler
+from game_state import GameEvent, GameState
+
+# 相机平滑系数按此帧率下的每帧比例定义，实际使用时按帧间隔换算
+CAMERA_SMOOTH_RATE = 60
 
 class SandboxGame(ShowBase):
-    def __init__(self):
+    def __init__(self, headless=False, input_source=None, config_overrides=None, timer=None,
+                 seed=None, record_path=None, replay=None, remote=None, snapshot=None):
+        self.startup_start = time.perf_counter()
+        self.startup_times = {}  # 启动耗时（秒）：first_frame 首帧完成，interactive 加载完成可以操作
+        
+        # 无窗口模式：不创建窗口和音频，HUD 使用空实现
+        self.headless = headless
+        self.input_source = input_source  # 脚本化输入源（替代键盘事件）
+        self.replay = replay              # 录像回放（替代所有输入和时钟）
+        self.remote = remote              # 瘦客户端：连接的服务器会话（游戏规则在服务器上运行）
+        self.initial_snapshot = snapshot  # 加载完成后从这个快照开始（替代新开一局）
+        self.input_recorder = None
+        if headless:
+            loadPrcFileData('', 'window-type none\naudio-library-name null')
+        
         ShowBase.__init__(self)
         
-        # 加载配置
+        # 加载配置并编译为只读的类型化配置树（可以覆盖部分配置，基准测试等场景使用）
         config_path = Path(__file__).parent / "config.yaml"
-        self.cfg = OmegaConf.load(config_path)
+        self.cfg = load_settings(config_path, config_overrides)
+        if remote:
+            # 瘦客户端在本地推进服务器上的整个立方体场，不按地形块冻结立方体（服务器不生成波次）
+            self.cfg = dataclasses.replace(self.cfg, world=dataclasses.replace(self.cfg.world, chunked=False),
+                                           waves=dataclasses.replace(self.cfg.waves, enabled=False))
+        
+        # 分段计时器：默认不计时（任务不包装，零开销），配置启用时使用逐帧统计
+        if timer is None and self.cfg.profiling.enabled:
+            timer = FrameProfiler(window=self.cfg.profiling.window)
+        self.timer = timer or NULL_TIMER
         
         # 设置天空颜色为蓝色
         self.setBackgroundColor(0.4, 0.6, 1.0)
         
-        # 初始化立方体状态字典（只需要一次）
-        self.cube_states = {}
+        if replay:
+            # 回放时由录像逐 tick 设置帧时间和帧间隔
+            globalClock.setMode(ClockObject.MSlave)
+            globalClock.setFrameTime(replay.start_time)
+            if replay.settings_crc != self.settings_crc():
+                print("Warning: replay was recorded with different settings")
+        elif remote:
+            # 帧时间跟随服务器时间（由输入任务每帧设置），计时器和 HUD 的倒计时与服务器一致
+            globalClock.setMode(ClockObject.MSlave)
+            globalClock.setFrameTime(remote.server_time)
+            if remote.welcome['world_crc'] != world_crc(self.cfg):
+                print("Warning: server uses different cube settings, cubes will not match")
+        elif headless:
+            # 固定步长时钟：每次 taskMgr.step() 推进 1/tick_rate 秒
+            globalClock.setMode(ClockObject.MNonRealTime)
+            globalClock.setFrameRate(self.cfg.headless.tick_rate)
+        if headless:
+            # 没有窗口就没有相机，使用空节点承载相机跟随计算
+            self.camera = self.render.attachNewNode('camera')
+        
+        # 随机种子：回放时使用录像中的种子，否则依次使用参数、配置或随机生成
+        if replay:
+            seed = replay.seed
+        elif remote:
+            seed = remote.welcome['seed']
+        elif seed is None:
+            seed = self.cfg.cube_movement.seed
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(32)
+        self.seed = seed
+        random.seed(seed)
+        
+        if record_path:
+            self.input_recorder = InputRecorder(record_path, seed, globalClock.getFrameTime(), self.settings_crc())
+        
+        # 初始化立方体群模拟（只需要一次）
+        self.cube_swarm = CubeSwarm(self.cfg.cube_movement, seed=self.seed)
+        self.set_swarm_workers(self.cfg.simulation.workers)
+        self.world = None  # 分块管理的地形和立方体节点（在 create_terrain 中创建）
+        self.cube_lod = CubeLod(self.cube_swarm, self.cfg.lod)
         
         # 设置窗口属性
-        props = WindowProperties()
-        props.setTitle(self.cfg.window.title)
-        props.setSize(self.cfg.window.width, self.cfg.window.height)
-        self.win.requestProperties(props)
+        if not headless:
+            props = WindowProperties()
+            props.setTitle(self.cfg.window.title)
+            props.setSize(self.cfg.window.width, self.cfg.window.height)
+            self.win.requestProperties(props)
         
         # 添加光照
         # 环境光
@@ -52,24 +136,29 @@ class SandboxGame(ShowBase):
         self.dlnp.setHpr(*self.cfg.lighting.directional.direction)
         self.render.setLight(self.dlnp)
         
-        # 角色属性
+        # 角色尺寸（显示和碰撞体使用）
         self.player_height = self.cfg.player.height
         self.player_width = self.cfg.player.width
         self.player_depth = self.cfg.player.depth
-        self.player_heading = self.cfg.player.initial_heading
-        
-        # 移动和物理相关属性
-        self.position = Point3(*self.cfg.player.initial_position)
-        self.velocity = Point3(0, 0, 0)
-        self.acceleration = self.cfg.physics.acceleration
-        self.max_speed = self.cfg.physics.max_speed
-        self.deceleration = self.cfg.physics.deceleration
-        self.min_speed = self.cfg.physics.min_speed
         
-        # 重力相关属性
-        self.gravity = self.cfg.physics.gravity
-        self.ground_height = self.cfg.physics.ground_height
-        self.jump_speed = self.cfg.physics.jump_speed
+        # 游戏规则核心：角色运动、生命值、跳跃、冷却、无敌、边界和局数（不依赖场景图）
+        # 场景层订阅它的事件流更新 HUD 和特效，逐帧的倒计时显示直接读取它的状态
+        self.state = GameState(self.cfg, globalClock.getFrameTime())
+        if self.input_recorder:
+            # 状态建好后才注册（初始化中途失败时不再在退出时计算校验值而掩盖原来的错误）
+            atexit.register(self.finish_recording)
+        if remote:
+            apply_fields(self.state, remote.welcome['fields'])
+        self.render_position = Point3(*self.state.position)  # 插值后显示的位置
+        self.render_heading = self.state.heading             # 插值后显示的朝向
+        
+        # 固定步长物理时钟（与显示帧率解耦）
+        self.sim_clock = FixedStepClock(remote.welcome['tick_rate'] if remote else self.cfg.simulation.tick_rate,
+                                        self.cfg.simulation.max_steps_per_frame)
+        self.sim_time_offset = 0.0  # 本帧物理时钟时间到帧时间（GameState 的时间）的换算量
+        
+        # HUD 的定时效果（受伤变红后恢复颜色），每帧只处理到期的事件
+        self.display_events = EventScheduler()
         
         # 相机控制属性
         self.camera_distance = self.cfg.camera.distance
@@ -89,302 +178,228 @@ class SandboxGame(ShowBase):
         # 创建场景元素
         self.create_terrain()              # 创建地形
         self.player = self.create_player() # 创建角色
-        self.player.setPos(self.position)  # 设置角色初始位置
+        self.player.setPos(self.render_position)  # 设置角色初始位置
         
         # 设置控制
         self.setup_mouse()
         self.setup_keyboard()
         
-        # 添加位置文本显示
+        # 添加位置文本显示（调试面板按配置的频率刷新）
         self.pos_text = self.add_position_display()
+        self.debug_panel_throttle = Throttle(self.cfg.hud.debug_refresh_rate)
         
         # 初始化相机
         self.update_camera()
         
-        # 设置碰撞系统
-        self.cTrav = CollisionTraverser()
+        # 设置碰撞系统（不使用 self.cTrav，避免 ShowBase 每帧自动再遍历一次场景）
+        self.cube_traverser = CollisionTraverser()
         self.collision_queue = CollisionHandlerQueue()  # 使用队列处理器
         
         # 为角色添加碰撞检测
         self.setup_player_collision()
         
-        # 添加立方体运动任务
-        self.taskMgr.add(self.update_cubes_task, "UpdateCubesTask")
+        # 选择立方体碰撞检测后端
+        self.collision_backend = self.create_collision_backend()
         
-        # 添加跳跃冷却相关属性
-        self.last_jump_time = 0  # 上次跳跃时间
-        self.can_jump = True     # 是否可以跳跃
+        # 添加立方体运动任务
+        self.add_task(self.update_cubes_task, "UpdateCubesTask", sort=4)
         
         # 添加跳跃冷却显示文本
         self.jump_cooldown_text = self.add_jump_cooldown_display()
         
-        # 初始化玩家状态
-        self.health = self.cfg.player_status.initial_health
-        self.max_health = self.cfg.player_status.max_health
-        
         # 创建血条
         self.setup_health_bar()
         
-        # 添加游戏状态
-        self.game_running = True
-        self.start_time = 0
-        self.survival_time = 0
-        
         # 添加得分显示
         self.score_text = self.add_score_display()
         
-        # 开始计时
-        self.start_time = globalClock.getRealTime()
-        
-        self.last_damage_time = 0
-        self.damage_cooldown = self.cfg.game_rules.damage.damage_cooldown  # 从配置文件读取冷却时间
-        
-        # 添加无敌时间相关属性
-        self.is_invincible = True
-        self.invincible_end_time = 0
+        # 添加无敌时间显示
         self.invincible_text = self.add_invincible_display()
         
-        # 开始无敌时间
-        self.start_invincible_time()
+        # 临时文本（边界警告、结束和波次提示）从预先创建的文本池中取用
+        self.text_pool = TextPool(self.create_text, self.cfg.hud.text_pool)
         
-        # 添加边界警告相关属性
-        self.warning_active = False
-        self.warning_start_time = 0
+        # 边界警告和返回时间显示
         self.warning_text = None
-        
-        # 添加边界违规相关属性
-        self.boundary_violations = []  # 存储违规时间的列表
-        self.last_boundary_return_time = 0  # 上次从边界返回的时间
         self.boundary_return_text = self.add_boundary_return_display()
         
-        # 添加回血相关属性
-        self.last_move_time = 0     # 上次移动时间
-        self.last_regen_time = 0    # 上次回血时间
-        
-        # 修改二段跳相关属性
-        self.can_double_jump = False    # 初始不能二段跳，需要第一次跳跃后才能
-        self.is_first_jump = False     # 是否在第一次跳跃的过程中
-        
-        # 修改地面高度的计算，考虑角色高度
-        self.ground_height = self.cfg.physics.ground_height
-        self.character_height = self.player_height / 2  # 角色中心点到脚底的距离
-        
         # 添加二段跳状态显示
         self.double_jump_text = self.add_double_jump_display()
         
-        # 添加跳跃键释放检查
-        self.jump_key_released = True  # 跳跃键是否已释放
-        self.can_double_jump = False
-        self.is_first_jump = False
-        
-        # 添加下落速度控制
-        self.normal_gravity = self.cfg.physics.gravity  # 保存原始重力值
-        self.current_gravity = self.normal_gravity      # 当前使用的重力值
-        self.is_double_jumping = False                  # 是否在二段跳状态
-        
-        # 添加二段跳落地相关属性
-        self.landing_invincible_start = 0  # 落地无敌开始时间
-        self.is_landing_invincible = False  # 是否处于落地无敌状态
-        
         # 添加无敌状态光环
         self.create_invincible_halo()
         
-        # 添加游戏局数相关属性
-        self.current_game = 1
+        # 游戏结束、胜利文本和局数显示
+        self.game_over_text = None
         self.victory_text = None
+        self.wave_text = None
         self.round_text = None
-        
-        # 添加局数显示
         self.setup_round_display()
         
-    def create_terrain(self):
-        # 创建地面
-        format = GeomVertexFormat.getV3n3c4()
-        vdata = GeomVertexData('square', format, Geom.UHStatic)
-        
-        vertex = GeomVertexWriter(vdata, 'vertex')
-        color = GeomVertexWriter(vdata, 'color')
-        
-        # 从配置获取地形范围
-        x_min, x_max = self.cfg.terrain.size.x
-        y_min, y_max = self.cfg.terrain.size.y
-        
-        # 添加地面顶点
-        vertex.addData3(x_min, y_min, -1)
-        vertex.addData3(x_max, y_min, -1)
-        vertex.addData3(x_max, y_max, -1)
-        vertex.addData3(x_min, y_max, -1)
-        
-        # 添加地面颜色
-        for i in range(4):
-            color.addData4(*self.cfg.terrain.color)
-        
-        tris = GeomTriangles(Geom.UHStatic)
-        tris.addVertices(0, 1, 2)
-        tris.addVertices(0, 2, 3)
+        # 订阅游戏状态的事件流
+        self.game_event_handlers = {
+            'health': self.update_health_bar,
+            'hit': self.show_hit,
+            'double_jump': self.show_double_jump_used,
+            'jump_ready': self.show_jump_ready,
+            'invincible_end': self.end_invincible_display,
+            'landing_invincible_end': self.end_landing_invincible_display,
+            'game_over': self.game_over,
+            'victory': self.show_victory,
+            'restart': self.on_restart,
+            'warning_start': self.show_warning,
+            'warning_end': self.reset_warning,
+            'left_too_soon': self.log_boundary_event,
+            'boundary_damage': self.log_boundary_event,
+            'boundary_double_damage': self.log_boundary_event,
+        }
+        self.state.subscribe(self.on_game_event)
         
-        geom = Geom(vdata)
-        geom.addPrimitive(tris)
+        # 任务耗时统计面板和导出
+        self.setup_profiler()
         
-        node = GeomNode('terrain')
-        node.addGeom(geom)
+        # 配置热重载
+        self.setup_hot_reload(config_path, config_overrides)
         
-        self.terrain = self.render.attachNewNode(node)
+        # 快速保存/恢复和定期检查点
+        self.setup_snapshots()
         
-        # 添加网格线
-        self.create_grid()
+        # 加载地形块和立方体节点（窗口模式下分帧加载）
+        self.start_loading()
         
-        # 重新启用参考立方体
+    def create_terrain(self):
+        # 初始化参考立方体的状态（所有立方体的状态都保存在 cube_swarm 的数组中）
         self.create_reference_cubes()
         
-    def create_grid(self):
-        # 创建网格线的顶点数据
-        format = GeomVertexFormat.getV3c4()
-        vdata = GeomVertexData('grid', format, Geom.UHStatic)
-        
-        vertex = GeomVertexWriter(vdata, 'vertex')
-        color = GeomVertexWriter(vdata, 'color')
-        
-        # 从配置获取地形范围
-        x_min, x_max = self.cfg.terrain.size.x
-        y_min, y_max = self.cfg.terrain.size.y
-        grid_size = self.cfg.terrain.grid_size
-        
-        # 计算网格线数量
-        num_lines_x = int((x_max - x_min) / grid_size) + 1
-        num_lines_y = int((y_max - y_min) / grid_size) + 1
-        
-        # 创建水平和垂直的网格线
-        for i in range(num_lines_x):
-            x = x_min + i * grid_size
-            # 水平线
-            vertex.addData3(x, y_min, -0.9)
-            vertex.addData3(x, y_max, -0.9)
-            # 添加颜色
-            for _ in range(2):
-                color.addData4(1, 1, 1, 0.2)
-        
-        for i in range(num_lines_y):
-            y = y_min + i * grid_size
-            # 垂直线
-            vertex.addData3(x_min, y, -0.9)
-            vertex.addData3(x_max, y, -0.9)
-            # 添加颜色
-            for _ in range(2):
-                color.addData4(1, 1, 1, 0.2)
-        
-        # 创建线段
-        lines = GeomLines(Geom.UHStatic)
-        for i in range(num_lines_x + num_lines_y):
-            lines.addVertices(i * 2, i * 2 + 1)
-        
-        geom = Geom(vdata)
-        geom.addPrimitive(lines)
-        
-        node = GeomNode('grid')
-        node.addGeom(geom)
-        
-        grid = self.render.attachNewNode(node)
-        grid.setTransparency(True)
+        # 波次立方体池：启动时和参考立方体一起加入立方体群并创建节点，游戏中取用和归还不增删行
+        self.cube_pool = self.waves = None
+        if self.cfg.waves.enabled:
+            self.cube_pool = CubePool(self.cube_swarm, self.cfg.waves.pool_size, self.cfg.waves.color)
+            # 波次使用单独的随机数流，不改变立方体群的随机数序列
+            self.waves = WaveDirector(self.cfg, self.cube_pool, seed=[self.seed, 1])
+        
+        # 无窗口模式下不需要任何几何体
+        instanced = self.cfg.reference_cubes.rendering.instanced and not self.headless
+        with_geometry = not instanced and not self.headless
+        # 只有需要绘制单独的几何体或使用遍历器碰撞时才需要每个立方体的节点
+        need_nodes = with_geometry or self.cfg.collision.backend == 'traverser'
+        
+        # 地面、网格线和立方体节点按块创建（不分块时整个地形是一个块）
+        self.world = ChunkedWorld(
+            self.render, self.cfg, self.cube_swarm, self.create_cube,
+            instanced=instanced, with_geometry=with_geometry, need_nodes=need_nodes,
+            resident=self.cube_pool.handles if self.cube_pool else ()
+        )
+        
+    def start_loading(self):
+        # 窗口模式下地形块和立方体节点分帧创建，窗口立即显示加载进度，加载完成后游戏才开始
+        # 无窗口、录制和回放时在启动时一次加载完（保证第 0 个 tick 的状态一致）
+        x, y, _ = self.state.position
+        stages = [('world', 1.0, lambda: self.world.load_steps(x, y))]
+        if not self.headless:
+            # 提前把几何体和纹理上传到显卡，避免开始游戏后的第一帧卡顿
+            stages.append(('prepare', 0.05, self.prepare_scene_steps))
+        progressive = (self.cfg.loading.progressive and not self.headless
+                       and not self.replay and not self.input_recorder)
+        if not self.headless:
+            self.taskMgr.add(self.record_first_frame, 'FirstFrame', sort=60)  # 在渲染任务（igLoop）之后
+        
+        self.loading = progressive
+        self.scene_loader = StagedLoader(stages, self.cfg.loading.frame_budget,
+                                   on_progress=self.update_loading_bar if progressive else None,
+                                   on_finish=self.finish_loading)
+        if not progressive:
+            self.scene_loader.run()
+            return
+        
+        self.loading_text = self.create_text(
+            text='Loading...',
+            pos=(0, 0.1),
+            scale=0.07,
+            fg=(1, 1, 1, 1),
+            align=TextNode.ACenter,
+            mayChange=True
+        )
+        self.loading_bar = self.create_wait_bar(
+            text="",
+            value=0,
+            range=100,
+            pos=(0, 0, 0),
+            scale=(0.6, 1, 0.4)
+        )
+        # 加载期间不绘制三维场景（只绘制进度条），每帧的时间都用于加载
+        self.render.hide()
+        self.taskMgr.add(self.scene_loader.task, 'LoadTask', sort=0)
+
+    def prepare_scene_steps(self):
+        self.render.prepareScene(self.win.getGsg())
+        yield 1.0
+
+    def update_loading_bar(self, stage, progress):
+        self.loading_bar['value'] = progress * 100
+        self.loading_text.setText(f'Loading {stage}... {progress * 100:.0f}%')
+
+    def record_first_frame(self, task):
+        self.startup_times['first_frame'] = time.perf_counter() - self.startup_start
+        self.log_startup()
+        return Task.done
+
+    def finish_loading(self):
+        self.startup_times['interactive'] = time.perf_counter() - self.startup_start
+        if self.loading:
+            # 存活时间和出生无敌时间从加载完成时开始计算
+            self.loading = False
+            self.loading_text.destroy()
+            self.loading_bar.destroy()
+            self.render.show()
+            if not self.remote and not self.initial_snapshot:
+                self.state.start(globalClock.getFrameTime())
+        if self.initial_snapshot:
+            self.load_snapshot(self.initial_snapshot)
+        self.log_startup()
+
+    def log_startup(self):
+        # 首帧和加载完成的时间都记录到后输出一次
+        times = self.startup_times
+        if self.headless or 'first_frame' not in times or 'interactive' not in times:
+            return
+        print(f"Startup: first frame {times['first_frame']:.3f}s, "
+              f"interactive {times['interactive']:.3f}s "
+              f"({self.cube_swarm.count} cubes, {len(self.world.chunks)} chunks loaded)")
         
     def create_reference_cubes(self):
         # 从配置中获取布局参数
         cfg = self.cfg.reference_cubes
         x_min, x_max = cfg.layout.x
         y_min, y_max = cfg.layout.y
-        spacing = cfg.layout.spacing
-        safe_zone = cfg.layout.safe_zone
-        
-        # 创建参考立方体，避开出生点
-        for x in range(x_min, x_max + 1, spacing):
-            for y in range(y_min, y_max + 1, spacing):
-                # 跳过出生点附近的区域
-                if abs(x) < safe_zone and abs(y) < safe_zone:
-                    continue
-                    
-                cube = self.create_cube()
-                if cube:
-                    # 设置位置和大小
-                    cube.setPos(x, y, cfg.appearance.height)
-                    cube.setScale(cfg.appearance.scale)
-                    
-                    # 设置颜色
-                    if cfg.appearance.color_variation:
-                        # 根据位置设置不同的颜色
-                        r = (x - x_min) / (x_max - x_min)
-                        b = (y - y_min) / (y_max - y_min)
-                        cube.setColor(r, 0.5, b, 1)
-                    
-                    cube.reparentTo(self.render)
-                    
-                    # 初始化立方体状态
-                    self.cube_states[cube] = {
-                        'initial_pos': Point3(x, y, cfg.appearance.height),
-                        'velocity': Point3(0, 0, 0),
-                        'next_direction_change': random.uniform(0, 2.0),
-                        'move_direction': random.uniform(0, 360),
-                        'patrol_radius': self.cfg.cube_movement.patrol_radius
-                    }
-        
-    def create_cube(self):
-        # 创建立方体的视觉节点
-        format = GeomVertexFormat.getV3n3c4()
-        vdata = GeomVertexData('cube', format, Geom.UHStatic)
-        
-        vertex = GeomVertexWriter(vdata, 'vertex')
-        normal = GeomVertexWriter(vdata, 'normal')
-        color = GeomVertexWriter(vdata, 'color')
-        
-        # 定义立方体的8个顶点
-        points = [
-            (-1, -1, -1), (1, -1, -1), (1, 1, -1), (-1, 1, -1),  # 底部
-            (-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1)       # 顶部
-        ]
-        
-        # 定义每个面的法线
-        normals = [
-            (0, 0, -1),  # 底面
-            (0, 0, 1),   # 顶面
-            (-1, 0, 0),  # 左面
-            (1, 0, 0),   # 右面
-            (0, -1, 0),  # 前面
-            (0, 1, 0),   # 后面
-        ]
-        
-        # 定义面的顶点索引
-        faces = [
-            (0, 1, 2, 3),  # 底面
-            (4, 5, 6, 7),  # 顶面
-            (0, 4, 7, 3),  # 左面
-            (1, 5, 6, 2),  # 右面
-            (0, 1, 5, 4),  # 前面
-            (3, 2, 6, 7),  # 后面
-        ]
-        
-        # 添加所有顶点（每个面独立的顶点，以便设置正确的法线）
-        for face_i, face in enumerate(faces):
-            for vertex_i in face:
-                vertex.addData3(*points[vertex_i])
-                normal.addData3(*normals[face_i])
-                color.addData4(0.5, 0.5, 0.5, 1)  # 灰色
-        
-        # 创建三角形
-        tris = GeomTriangles(Geom.UHStatic)
-        for i in range(6):  # 6个面
-            base = i * 4    # 每个面4个顶点
-            # 每个面由两个三角形组成
-            tris.addVertices(base, base + 1, base + 2)
-            tris.addVertices(base, base + 2, base + 3)
-        
-        geom = Geom(vdata)
-        geom.addPrimitive(tris)
-        
-        node = GeomNode('cube')
-        node.addGeom(geom)
-        
-        # 创建立方体的节点路径
-        cube = self.render.attachNewNode(node)
-        cube.setTwoSided(True)
+        
+        # 创建参考立方体，避开出生点（整体用数组计算，启动时间不随立方体数量线性增加 Python 循环）
+        grid = layout_positions(cfg.layout)
+        positions = np.column_stack([grid, np.full(len(grid), cfg.appearance.height)])
+        if cfg.appearance.color_variation:
+            # 根据位置设置不同的颜色
+            colors = np.empty((len(grid), 4))
+            colors[:, 0] = (grid[:, 0] - x_min) / (x_max - x_min)
+            colors[:, 1] = 0.5
+            colors[:, 2] = (grid[:, 1] - y_min) / (y_max - y_min)
+            colors[:, 3] = 1
+        else:
+            colors = (0.5, 0.5, 0.5, 1)  # 网格默认的灰色
+        
+        # 批量初始化立方体状态（颜色也保存在状态列中，地形块创建节点时使用）
+        self.cube_swarm.add_cubes(positions, colors)
+        
+    def create_cube(self, with_geometry=True):
+        if with_geometry:
+            # 所有立方体共享同一个网格（只构建一次顶点数据）
+            node = GeomNode('cube')
+            node.addGeom(make_box_geom())
+            
+            # 创建立方体的节点路径
+            cube = self.render.attachNewNode(node)
+            cube.setTwoSided(True)
+        else:
+            cube = self.render.attachNewNode('cube')
         
         # 添加碰撞体
         collision_node = CollisionNode('cube_collision')
@@ -401,6 +416,10 @@ class SandboxGame(ShowBase):
         return cube
         
     def setup_mouse(self):
+        # 无窗口模式下没有鼠标
+        if self.headless:
+            return
+        
         # 隐藏鼠标光标
         props = WindowProperties()
         props.setCursorHidden(True)
@@ -410,11 +429,11 @@ class SandboxGame(ShowBase):
         self.last_mouse_x = 0
         
         # 添加鼠标任务
-        self.taskMgr.add(self.mouse_task, "MouseTask")
+        self.add_task(self.mouse_task, "MouseTask", sort=1)
         
     def setup_keyboard(self):
-        # 设置键盘控制
-        self.keyMap = {
+        # 设置键盘控制：键盘事件只更新实时按键状态，由输入任务每个 tick 统一采样后交给 GameState（便于录制和回放）
+        self.live_keys = {
             "forward": False,  # W - 前进
             "backward": False, # S - 后退
             "turn_left": False,  # A - 左转
@@ -422,6 +441,10 @@ class SandboxGame(ShowBase):
             "up": False,      # 空格 - 跳跃
             "down": False     # Shift - 下蹲
         }
+        self.pending_actions = []
+        self.pending_mouse_dx = 0.0
+        self.sent_keys = None  # 瘦客户端上次发给服务器的按键状态
+        self.tick = 0
         
         # 绑定键盘事件
         self.accept("w", self.update_key, ["forward", True])
@@ -433,39 +456,110 @@ class SandboxGame(ShowBase):
         self.accept("d", self.update_key, ["turn_right", True])
         self.accept("d-up", self.update_key, ["turn_right", False])
         self.accept("space", self.update_key, ["up", True])
-        self.accept("space-up", self.handle_jump_key_release)  # 添加释放事件处理
+        self.accept("space-up", self.update_key, ["up", False])  # 释放时由输入任务标记跳跃键已释放
         self.accept("lshift", self.update_key, ["down", True])
         self.accept("lshift-up", self.update_key, ["down", False])
         
+        # 添加输入采样任务（在键盘事件之后、移动任务之前运行）
+        self.add_task(self.input_task, "InputTask", sort=2)
+        
         # 添加移动任务
-        self.taskMgr.add(self.move_task, "MoveTask")
+        self.add_task(self.move_task, "MoveTask", sort=3)
         
         # 添加 ESC 键退出功能
         self.accept("escape", self.quit_game)
         
         # 添加测试用的血量控制键
-        self.accept("q", self.update_health, [-10])  # Q键减少血量
-        self.accept("e", self.update_health, [10])   # E键恢复血量
+        self.accept("q", self.pending_actions.append, ["damage"])  # Q键减少血量
+        self.accept("e", self.pending_actions.append, ["heal"])    # E键恢复血量
         
         # 添加重启游戏快捷键
-        self.accept('r', self.restart_game)
+        self.accept('r', self.pending_actions.append, ["restart"])
         
     def update_key(self, key, value):
-        self.keyMap[key] = value
+        self.live_keys[key] = value
+        
+    def input_task(self, task):
+        # 每个 tick 采样一次输入：回放录像 > 脚本化输入 > 键盘和鼠标
+        if self.remote:
+            return self.remote_input_task(task)
+        if self.replay:
+            if self.tick >= self.replay.count:
+                self.finish_replay()
+                return Task.done
+            frame_time, dt = self.replay.clock_at(self.tick)
+            globalClock.setFrameTime(frame_time)
+            globalClock.setDt(dt)
+            keys, actions, mouse_dx = self.replay.input_at(self.tick)
+        else:
+            keys = self.input_source.keys_at(self.tick) if self.input_source else self.live_keys
+            actions, mouse_dx = self.pending_actions[:], self.pending_mouse_dx
+        self.pending_actions.clear()
+        self.pending_mouse_dx = 0.0
+        
+        if self.input_recorder:
+            self.input_recorder.record(keys, actions, mouse_dx,
+                                 globalClock.getFrameTime(), globalClock.getDt())
+        
+        # 按键和动作（Q/E 调试扣血回血、R 重开）由 GameState 处理
+        self.state.apply_input(globalClock.getFrameTime(), keys, actions)
+        self.apply_mouse(mouse_dx)
+        
+        self.tick += 1
+        return Task.cont
+        
+    def remote_input_task(self, task):
+        # 瘦客户端：先应用服务器的状态消息，帧时间设为服务器时间的估计，再把按键变化和动作发给服务器
+        remote = self.remote
+        self.apply_server_messages()
+        if remote.closed:
+            print("Disconnected from server")
+            self.userExit()
+            return Task.done
+        frame_time = remote.clock()
+        globalClock.setDt(max(frame_time - globalClock.getFrameTime(), 0.0))
+        globalClock.setFrameTime(frame_time)
+        
+        keys = self.input_source.keys_at(self.tick) if self.input_source else self.live_keys
+        if keys != self.sent_keys or self.pending_actions:
+            remote.send_input(keys, self.pending_actions)
+            self.sent_keys = dict(keys)
+        self.pending_actions.clear()
+        self.apply_mouse(self.pending_mouse_dx)
+        self.pending_mouse_dx = 0.0
+        
+        self.tick += 1
+        return Task.cont
+
+    def apply_server_messages(self):
+        # 每条状态消息对应服务器的一步：按服务器的步数和时刻推进本地立方体，更新规则状态，再转发事件给 HUD
+        clock = self.sim_clock
+        for message in self.remote.poll():
+            if message['type'] != 'state':
+                continue
+            while clock.steps < message['tick']:
+                clock.tick()
+                self.cube_swarm.step(clock.step, clock.steps * clock.step)
+            apply_fields(self.state, message['fields'])
+            for event in message['events']:
+                self.on_game_event(GameEvent(*event))
+        # 渲染插值：最近一条状态消息到达后经过的时间
+        clock.accumulator = min(time.perf_counter() - self.remote.received_at, clock.step)
+
+    def apply_mouse(self, dx):
+        # 更新目标相机角度（相对于角色）
+        self.target_camera_heading += -dx * self.mouse_sensitivity
+        
+        # 限制相机水平旋转范围
+        self.target_camera_heading = max(min(self.target_camera_heading, 
+                                           90), 
+                                           -90)
         
     def mouse_task(self, task):
         if self.mouseWatcherNode.hasMouse():
-            # 获取鼠标移动
+            # 获取鼠标移动，累计到本 tick 由输入任务统一应用
             current_x = self.mouseWatcherNode.getMouseX()
-            dx = current_x - self.last_mouse_x
-            
-            # 更新目标相机角度（相对于角色）
-            self.target_camera_heading += -dx * self.mouse_sensitivity
-            
-            # 限制相机水平旋转范围
-            self.target_camera_heading = max(min(self.target_camera_heading, 
-                                               90), 
-                                               -90)
+            self.pending_mouse_dx += current_x - self.last_mouse_x
             
             # 重置鼠标到屏幕中心
             props = self.win.getProperties()
@@ -475,267 +569,127 @@ class SandboxGame(ShowBase):
         return Task.cont
         
     def move_task(self, task):
-        if not self.game_running:
+        state = self.state
+        if self.loading:
             return Task.cont
         
-        current_time = globalClock.getRealTime()
+        current_time = globalClock.getFrameTime()
         dt = globalClock.getDt()
+        if not state.game_running:
+            # 游戏结束和胜利画面：立方体照常按固定步长运动，显示效果的定时事件照常处理，角色和游戏规则停止
+            # （瘦客户端的立方体按服务器的状态消息推进）
+            self.display_events.run_due(current_time)
+            with self.timer.section('physics'):
+                for _ in range(0 if self.remote else self.sim_clock.advance(dt)):
+                    self.sim_clock.tick()
+                    self.step_cubes(self.sim_clock.step)
+            return Task.cont
         
-        # 检查是否有移动输入
-        has_movement = (self.keyMap["forward"] or self.keyMap["backward"] or 
-                       self.keyMap["turn_left"] or self.keyMap["turn_right"] or
-                       abs(self.velocity.length()) > 0.1)  # 检查是否还在移动
-        
-        if has_movement:
-            self.last_move_time = current_time
-        else:
-            # 检查是否可以回血
-            still_duration = current_time - self.last_move_time
-            if (still_duration >= self.cfg.player_status.health_regen.still_time and 
-                current_time - self.last_regen_time >= self.cfg.player_status.health_regen.interval):
-                # 回血
-                if self.health < self.max_health:
-                    self.update_health(self.cfg.player_status.health_regen.amount)
-                    self.last_regen_time = current_time
-        
-        dt = globalClock.getDt()
-        current_time = task.time
-        
-        # 处理角色旋转
-        turn_speed = 120.0  # 角色旋转速度（度/秒）
-        if self.keyMap["turn_left"]:
-            self.player_heading += turn_speed * dt
-            self.target_camera_heading = 0
-        if self.keyMap["turn_right"]:
-            self.player_heading -= turn_speed * dt
-            self.target_camera_heading = 0
-        
-        # 平滑插值相机角度到目标角度
-        angle_diff = self.target_camera_heading - self.camera_heading
-        self.camera_heading += angle_diff * (1 - self.camera_smooth)
-        
-        # 更新角色朝向
-        self.player.setH(self.player_heading)
-        
-        # 使用角色朝向计算移动方向
-        heading_rad = self.player_heading * math.pi / 180.0
-        forward = Point3(-math.sin(heading_rad), math.cos(heading_rad), 0)  # 修改正负号
-        
-        # 计算移动方向（只有前后移动）
-        move_direction = Point3(0, 0, 0)
-        if self.keyMap["forward"]: move_direction += forward
-        if self.keyMap["backward"]: move_direction -= forward
-        
-        # 处理水平移动
-        has_input = move_direction.length() > 0
-        if has_input:
-            move_direction.normalize()
-            horizontal_acceleration = move_direction * self.acceleration * dt
-            self.velocity.setX(self.velocity.getX() + horizontal_acceleration.getX())
-            self.velocity.setY(self.velocity.getY() + horizontal_acceleration.getY())
-            
-            # 限制水平速度
-            horizontal_speed = math.sqrt(self.velocity.getX()**2 + self.velocity.getY()**2)
-            if horizontal_speed > self.max_speed:
-                scale = self.max_speed / horizontal_speed
-                self.velocity.setX(self.velocity.getX() * scale)
-                self.velocity.setY(self.velocity.getY() * scale)
-        else:
-            self.velocity.setX(self.velocity.getX() * self.deceleration)
-            self.velocity.setY(self.velocity.getY() * self.deceleration)
+        # 安排回血并处理到期的定时事件（游戏规则的定时事件在 GameState 中；瘦客户端的规则在服务器上运行）
+        if not self.remote:
+            state.begin_frame(current_time)
+        self.display_events.run_due(current_time)
         
         # 计算离地高度
-        height_from_ground = self.position.getZ() - (self.ground_height + self.character_height)
+        height_from_ground = state.position[2] - state.floor
         
         # 更新二段跳状态显示
-        if (self.is_first_jump and self.can_double_jump and 
-            height_from_ground >= self.cfg.physics.double_jump.min_height):
-            self.double_jump_text.setText(f'Double Jump Ready! (Cost: {self.cfg.physics.double_jump.health_cost} HP)')
+        double_jump = self.cfg.physics.double_jump
+        if (state.is_first_jump and state.can_double_jump and 
+            height_from_ground >= double_jump.min_height):
+            self.double_jump_text.setText(f'Double Jump Ready! (Cost: {double_jump.health_cost} HP)')
             self.double_jump_text.setFg((0, 1, 0, 1))  # 绿色表示可用
         else:
-            if self.is_first_jump and not self.can_double_jump:
+            if state.is_first_jump and not state.can_double_jump:
                 self.double_jump_text.setText('Double Jump Used!')
                 self.double_jump_text.setFg((1, 0, 0, 1))  # 红色表示已使用
             else:
                 self.double_jump_text.setText('Double Jump Not Ready')
                 self.double_jump_text.setFg((0.7, 0.7, 0.7, 1))  # 灰色表示不可用
         
-        # 处理落地无敌状态和显示
-        if self.is_landing_invincible:
-            remaining = self.cfg.physics.double_jump.landing_invincible_time - (current_time - self.landing_invincible_start)
-            if remaining > 0:
-                # 显示落地无敌状态
-                self.invincible_text.setText(f'Landing Invincible: {remaining:.1f}s')
-                self.invincible_text.setFg((0, 1, 0, 1))  # 绿色
-            else:
-                self.is_landing_invincible = False
-                self.invincible_text.setText('')
-        
-        # 修改跳跃冷却检查和显示
-        if not self.can_jump:
-            # 根据是否是二段跳落地选择不同的冷却时间
-            cooldown_time = (self.cfg.physics.double_jump.landing_cooldown 
-                            if self.is_double_jumping or 
-                            (current_time - self.landing_invincible_start < self.cfg.physics.double_jump.landing_invincible_time)
-                            else self.cfg.physics.jump_cooldown)
-            
-            remaining = cooldown_time - (current_time - self.last_jump_time)
-            if remaining <= 0:
-                self.can_jump = True
-                self.jump_cooldown_text.setText('Jump Ready')
-                self.jump_cooldown_text.setFg((1, 1, 1, 1))
-            else:
-                self.jump_cooldown_text.setText(f'Jump Cooldown: {remaining:.1f}s')
-                # 使用不同颜色区分普通冷却和二段跳冷却
-                self.jump_cooldown_text.setFg((1, 0, 0, 1) if cooldown_time > self.cfg.physics.jump_cooldown 
-                                            else (1, 0.5, 0, 1))
-        
-        # 处理跳跃
-        if self.keyMap["up"]:
-            current_time = globalClock.getRealTime()
-            
-            # 如果在无敌状态下，不允许跳跃
-            if not self.is_invincible and not self.is_landing_invincible:
-                # 在地面上时可以进行普通跳跃
-                if self.position.getZ() <= self.ground_height + self.character_height + 0.1:
-                    if self.can_jump:  # 检查是否可以跳跃
-                        self.velocity.setZ(self.jump_speed)
-                        self.last_jump_time = current_time
-                        self.can_jump = False  # 进入冷却
-                        self.is_first_jump = True
-                        self.can_double_jump = True
-                        self.jump_key_released = False
-                
-                # 在空中且达到最小高度时才能二段跳
-                elif (self.is_first_jump and self.can_double_jump and 
-                      height_from_ground >= self.cfg.physics.double_jump.min_height and
-                      self.jump_key_released):
-                    # 检查血量是否足够
-                    if self.health > self.cfg.physics.double_jump.health_cost:
-                        # 计算达到指定高度所需的初速度
-                        # 使用运动学公式：v = sqrt(2gh)，其中g是重力加速度，h是目标高度
-                        target_height = self.cfg.physics.double_jump.height
-                        jump_speed = math.sqrt(2 * abs(self.gravity) * target_height)
-                        
-                        self.velocity.setZ(jump_speed)  # 使用计算出的速度
-                        self.can_double_jump = False
-                        self.jump_key_released = False
-                        # 扣除血量
-                        self.update_health(-self.cfg.physics.double_jump.health_cost)
-                        # 显示二段跳已使用状态
-                        self.double_jump_text.setText('Double Jump Used!')
-                        self.double_jump_text.setFg((1, 0, 0, 1))
-                        
-                        self.is_double_jumping = True  # 标记进入二段跳状态
-                        # 调整重力
-                        self.current_gravity = self.normal_gravity * self.cfg.physics.double_jump.fall_speed_scale
-        
-        # 应用当前重力（而不是直接使用 self.gravity）
-        self.velocity.setZ(self.velocity.getZ() + self.current_gravity * dt)
-        
-        # 更新位置
-        self.position += self.velocity * dt
-        
-        # 落地检测
-        if self.position.getZ() <= self.ground_height + self.character_height:
-            self.position.setZ(self.ground_height + self.character_height)
-            self.velocity.setZ(0)
-            self.is_first_jump = False
-            self.can_double_jump = False
-            
-            # 如果是从二段跳落地
-            if self.is_double_jumping:
-                current_time = globalClock.getRealTime()
-                # 设置落地无敌
-                self.is_landing_invincible = True
-                self.landing_invincible_start = current_time
-                # 设置更长的跳跃冷却
-                self.last_jump_time = current_time
-                self.can_jump = False
-                # 重置重力
-                self.current_gravity = self.normal_gravity
-                self.is_double_jumping = False
-        
-        # 处理落地无敌状态
-        if self.is_landing_invincible:
-            if current_time - self.landing_invincible_start >= self.cfg.physics.double_jump.landing_invincible_time:
-                self.is_landing_invincible = False
-        
-        # 更新角色位置
-        self.player.setPos(self.position)
-        
-        # 进行碰撞检测
-        self.cTrav.traverse(self.render)
-        
-        # 检查碰撞队列
-        if self.collision_queue.getNumEntries() > 0:
-            self.handle_cube_collision(None)
+        # 显示落地无敌状态（结束由定时事件处理）
+        if state.is_landing_invincible:
+            remaining = double_jump.landing_invincible_time - (current_time - state.landing_invincible_start)
+            self.invincible_text.setText(f'Landing Invincible: {remaining:.1f}s')
+            self.invincible_text.setFg((0, 1, 0, 1))  # 绿色
+        
+        # 显示跳跃冷却（冷却结束由定时事件处理）
+        if not state.can_jump:
+            cooldown_time, remaining = state.jump_cooldown()
+            self.jump_cooldown_text.setText(f'Jump Cooldown: {remaining:.1f}s')
+            # 使用不同颜色区分普通冷却和二段跳冷却
+            self.jump_cooldown_text.setFg((1, 0, 0, 1) if cooldown_time > self.cfg.physics.jump_cooldown 
+                                        else (1, 0.5, 0, 1))
+        
+        # 以固定步长推进物理（角色和立方体），步数只取决于经过的时间，与显示帧率无关
+        # （瘦客户端的物理在服务器上，本地只按收到的状态消息推进立方体）
+        with self.timer.section('physics'):
+            steps = 0 if self.remote else self.sim_clock.advance(dt)
+            # 本帧最后一步的末尾对应帧时间减去留给下一帧的累加时间，据此把每一步的物理时钟时间换算成帧时间
+            self.sim_time_offset = (current_time - self.sim_clock.accumulator
+                                    - (self.sim_clock.time + steps * self.sim_clock.step))
+            for _ in range(steps):
+                # 本帧内游戏结束后，剩下的步只推进立方体
+                if state.game_running:
+                    self.physics_step(self.sim_clock.step)
+                else:
+                    self.sim_clock.tick()
+                    self.step_cubes(self.sim_clock.step)
         
-        # 如果发生碰撞，position需要更新为实际位置
-        self.position = self.player.getPos()
+        # 平滑插值相机角度到目标角度（平滑系数按 60 FPS 的每帧比例定义，按实际帧间隔换算）
+        angle_diff = self.target_camera_heading - self.camera_heading
+        self.camera_heading += angle_diff * (1 - self.camera_smooth ** (dt * CAMERA_SMOOTH_RATE))
         
-        # 更新相机位置
+        # 在上一步和当前步的物理状态之间插值显示角色，再更新相机位置
+        self.update_player_render(self.sim_clock.alpha)
         self.update_camera()
         
-        # 更新显示信息
-        x = round(self.position.getX(), 2)
-        y = round(self.position.getY(), 2)
-        z = round(self.position.getZ(), 2)
-        speed = round(self.velocity.length(), 2)
-        
-        # 获取相机信息
-        cam_pos = self.camera.getPos()
-        cam_hpr = self.camera.getHpr()
-        
-        # 更新显示文本
-        self.pos_text.setText(
-            f'Player Position: ({x}, {y}, {z})\n'
-            f'Player Heading: {round(self.player_heading, 2)}°\n'
-            f'Player Speed: {speed}\n'
-            f'Player Velocity: ({round(self.velocity.getX(), 2)}, '
-            f'{round(self.velocity.getY(), 2)}, '
-            f'{round(self.velocity.getZ(), 2)})\n'
-            f'Camera Position: ({round(cam_pos.getX(), 2)}, '
-            f'{round(cam_pos.getY(), 2)}, '
-            f'{round(cam_pos.getZ(), 2)})\n'
-            f'Camera HPR: ({round(cam_hpr.getX(), 2)}, '
-            f'{round(cam_hpr.getY(), 2)}, '
-            f'{round(cam_hpr.getZ(), 2)})'
-        )
+        # 更新调试面板（按刷新频率节流，不到刷新时间时连字符串都不格式化）
+        with self.timer.section('hud'):
+            if self.debug_panel_throttle.ready(globalClock.getFrameTime()):
+                x, y, z = (round(v, 2) for v in state.position)
+                vx, vy, vz = (round(v, 2) for v in state.velocity)
+                speed = round(math.hypot(*state.velocity), 2)
+        
+                # 获取相机信息
+                cam_pos = self.camera.getPos()
+                cam_hpr = self.camera.getHpr()
+        
+                # 更新显示文本
+                self.pos_text.setText(
+                    f'Player Position: ({x}, {y}, {z})\n'
+                    f'Player Heading: {round(state.heading, 2)}°\n'
+                    f'Player Speed: {speed}\n'
+                    f'Player Velocity: ({vx}, {vy}, {vz})\n'
+                    f'Camera Position: ({round(cam_pos.getX(), 2)}, '
+                    f'{round(cam_pos.getY(), 2)}, '
+                    f'{round(cam_pos.getZ(), 2)})\n'
+                    f'Camera HPR: ({round(cam_hpr.getX(), 2)}, '
+                    f'{round(cam_hpr.getY(), 2)}, '
+                    f'{round(cam_hpr.getZ(), 2)})\n'
+                    f'Collision Tests: {self.collision_backend.broadphase_tests} broad / '
+                    f'{self.collision_backend.narrowphase_tests} narrow\n'
+                    f'Chunks Loaded: {len(self.world.chunks)}\n'
+                    f'Cubes: {self.cube_lod.near_count} near / {self.cube_lod.dormant_count} dormant / '
+                    f'{self.world.hidden_count} hidden'
+                    + (f'\nWave Cubes: {self.cube_pool.in_use}/{len(self.cube_pool)}' if self.cube_pool else '')
+                )
         
-        # 更新得分显示（存活时间）
-        if self.game_running:
-            survival_time = int(globalClock.getRealTime() - self.start_time)
-            self.score_text.setText(f'Survival Time: {survival_time}s')
-            
-            # 检查特定时间点
-            if self.current_game == 1 and survival_time >= 40:
-                self.current_game = 2
-                self.restart_game()
-                return Task.cont  # 重启后立即返回
-            elif self.current_game == 2 and survival_time >= 50:
-                self.current_game = 3
-                self.restart_game()
-                return Task.cont  # 重启后立即返回
-            elif self.current_game == 3 and survival_time >= 60:
-                self.show_victory()
-                return Task.cont  # 显示胜利后立即返回
-        
-        # 更新无敌状态
-        current_time = globalClock.getRealTime()
-        if self.is_invincible:
-            remaining = self.invincible_end_time - current_time
-            if remaining > 0:
-                self.invincible_text.setText(f'Invincible: {remaining:.1f}s')
-                # 让角色闪烁以显示无敌状态
-                self.player.setAlphaScale(0.5 + 0.5 * math.sin(current_time * 10))
-            else:
-                self.is_invincible = False
-                self.invincible_text.setText('')
-                self.player.setAlphaScale(1.0)  # 恢复正常显示
-        elif current_time - self.last_damage_time < self.damage_cooldown:
+        # 更新得分显示（存活时间），再由 GameState 推进局数和检查边界
+        if state.game_running:
+            self.score_text.setText(f'Survival Time: {int(current_time - state.start_time)}s')
+        if not self.remote:
+            state.end_frame()
+        
+        # 更新无敌状态显示（无敌结束由定时事件处理）
+        if state.is_invincible:
+            remaining = state.invincible_end_time - current_time
+            self.invincible_text.setText(f'Invincible: {remaining:.1f}s')
+            # 让角色闪烁以显示无敌状态
+            self.player.setAlphaScale(0.5 + 0.5 * math.sin(current_time * 10))
+        elif current_time - state.last_damage_time < self.cfg.game_rules.damage.damage_cooldown:
             # 显示伤害冷却时间
-            remaining = self.damage_cooldown - (current_time - self.last_damage_time)
+            remaining = self.cfg.game_rules.damage.damage_cooldown - (current_time - state.last_damage_time)
             self.invincible_text.setText(f'Damage Cooldown: {remaining:.1f}s')
             # 让角色轻微闪烁表示在冷却中
             self.player.setAlphaScale(0.7 + 0.3 * math.sin(current_time * 5))
@@ -743,17 +697,290 @@ class SandboxGame(ShowBase):
             self.invincible_text.setText('')
             self.player.setAlphaScale(1.0)
         
-        # 检查是否超出边界
-        self.check_boundaries()
+        # 更新边界返回时间显示
+        self.update_boundary_display(current_time)
         
         # 更新无敌状态效果
         self.update_invincible_state()
         
         return Task.cont
 
+    def step_cubes(self, dt):
+        # 把立方体推进到物理时钟的当前步，返回本步更新过的行（不启用 LOD 时为 None，表示全部）
+        # 启用 LOD 时近处的立方体每步更新，远处的轮流低频更新
+        if self.cfg.lod.enabled:
+            rows = self.cube_lod.select(self.state.position[0], self.state.position[1])
+            self.cube_swarm.advance(rows, dt, self.sim_clock.time)
+            return rows
+        self.cube_swarm.step(dt, self.sim_clock.time)
+        return None
+
+    def physics_step(self, dt):
+        # 一个固定步长的物理步：立方体运动、角色运动（GameState）和碰撞检测
+        self.sim_clock.tick()
+        state = self.state
+        
+        # 按局内时间生成和回收波次立方体（只改写池中立方体的状态，不增删行）
+        if self.waves:
+            for wave, count in self.waves.update(state, self.sim_clock.time):
+                self.announce_wave(wave, count)
+        
+        # 立方体和角色在同一步内推进，碰撞检测看到的是同一时刻的状态；只有本步更新过的立方体参与碰撞检测
+        collision_rows = self.step_cubes(dt)
+        
+        state.physics_step(dt)
+        # 转向时相机回到角色正后方
+        if state.keys["turn_left"] or state.keys["turn_right"]:
+            self.target_camera_heading = 0
+        
+        # 碰撞体跟随物理位置（遍历器后端按节点位置检测），显示位置随后由渲染插值覆盖
+        self.player.setPos(*state.position)
+        
+        # 进行碰撞检测
+        with self.timer.section('collision'):
+            hit = self.collision_backend.detect(state.position, collision_rows, state.prev_position)
+        if hit:
+            self.handle_cube_collision(None, self.collision_backend.last_toi, dt, self.sim_clock.time)
+
+    def update_player_render(self, alpha):
+        # 角色节点显示上一步与当前步之间的插值状态（只影响显示，不改变物理状态）
+        state = self.state
+        self.render_position = Point3(*(a + (b - a) * alpha
+                                        for a, b in zip(state.prev_position, state.position)))
+        self.render_heading = state.prev_heading + (state.heading - state.prev_heading) * alpha
+        self.player.setPos(self.render_position)
+        self.player.setH(self.render_heading)
+
+    def add_task(self, func, name, sort=0):
+        # 注册任务；启用计时器时自动包装以记录每个任务的耗时
+        return self.taskMgr.add(self.timer.wrap(func, name), name, sort=sort)
+
+    def setup_profiler(self):
+        if not isinstance(self.timer, FrameProfiler):
+            return
+        
+        # 包装 ShowBase 自带的渲染任务，并在每帧所有任务之后汇总本帧耗时
+        for task in self.taskMgr.getTasksNamed('igLoop'):
+            self.timer.instrument_task(task, 'Render')
+        self.taskMgr.add(self.timer.end_frame, 'ProfilerEndFrame', sort=100)
+        
+        # 屏幕耗时面板（默认隐藏，按键切换）
+        self.profiler_text = self.create_text(
+            text='',
+            pos=(1.3, 0.8),      # 右上角得分显示的下方
+            scale=0.04,
+            fg=(1, 1, 0, 1),
+            align=TextNode.ARight,
+            mayChange=True
+        )
+        self.profiler_overlay_visible = False
+        self.accept(self.cfg.profiling.overlay_key, self.toggle_profiler_overlay)
+        self.taskMgr.doMethodLater(self.cfg.profiling.overlay_interval,
+                                   self.update_profiler_overlay, 'ProfilerOverlay')
+        
+        # 退出时导出耗时记录
+        if self.cfg.profiling.trace_path:
+            atexit.register(self.timer.dump, self.cfg.profiling.trace_path)
+
+    def setup_hot_reload(self, config_path, config_overrides):
+        if not self.cfg.hot_reload.enabled:
+            return
+        self.settings_reloader = SettingsReloader(config_path, config_overrides)
+        self.taskMgr.doMethodLater(self.cfg.hot_reload.interval, self.reload_settings_task, 'SettingsReload')
+
+    def reload_settings_task(self, task):
+        settings = self.settings_reloader.poll()
+        if settings is not None:
+            self.apply_settings(settings)
+            print("Config reloaded")
+        return Task.again
+
+    def apply_settings(self, settings):
+        # 整体替换配置对象，再刷新从配置缓存下来的运行时参数
+        self.cfg = settings
+        self.state.configure(settings)
+        
+        self.debug_panel_throttle = Throttle(settings.hud.debug_refresh_rate)
+        if not self.remote:
+            self.sim_clock.configure(settings.simulation.tick_rate, settings.simulation.max_steps_per_frame)
+        
+        self.camera_distance = settings.camera.distance
+        self.camera_height = settings.camera.height
+        self.camera_pitch = settings.camera.pitch
+        self.mouse_sensitivity = settings.camera.mouse_sensitivity
+        
+        self.cube_swarm.configure(settings.cube_movement)
+        self.set_swarm_workers(settings.simulation.workers)
+        self.cube_lod.configure(settings.lod)
+        if self.waves:
+            self.waves.configure(settings)
+        if isinstance(self.collision_backend, ProximityCollisionBackend):
+            # 降低步频时可以同时打开连续碰撞检测（后端类型不热重载）
+            self.collision_backend.continuous = settings.collision.continuous
+            self.collision_backend.toi_iterations = settings.collision.toi_iterations
+
+    def setup_snapshots(self):
+        # 瘦客户端的状态在服务器上，不保存也不恢复
+        self.checkpointer = None
+        if self.remote:
+            return
+        cfg = self.cfg.snapshot
+        self.accept(cfg.quicksave_key, self.quicksave)
+        self.accept(cfg.quickload_key, self.quickload)
+        if cfg.checkpoint_interval > 0:
+            self.checkpointer = Checkpointer(cfg.directory, cfg.keyframe_interval)
+            print(f"Writing checkpoints to {self.checkpointer.directory}")
+            self.taskMgr.doMethodLater(cfg.checkpoint_interval, self.checkpoint_task, 'Checkpoint')
+
+    def capture_snapshot(self):
+        return Snapshot.capture(self.state, self.cube_swarm, self.sim_clock, self.settings_crc())
+
+    def checkpoint_task(self, task):
+        if not self.loading:
+            self.checkpointer.save(self.capture_snapshot())
+        return Task.again
+
+    def quicksave(self):
+        path = Path(self.cfg.snapshot.directory) / 'quicksave.mdsn'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.capture_snapshot().write(path)
+        print(f"Saved snapshot to {path}")
+
+    def quickload(self):
+        # 录制和回放只记录输入，中途替换状态会让录像无法重现
+        if self.loading or self.replay or self.input_recorder:
+            print("Quickload is not available while loading, recording or replaying")
+            return
+        path = Path(self.cfg.snapshot.directory) / 'quicksave.mdsn'
+        try:
+            snapshot = Snapshot.open(path)
+        except (OSError, SnapshotError) as e:
+            print(f"Quickload failed: {e}")
+            return
+        self.load_snapshot(snapshot)
+        print(f"Loaded snapshot from {path}")
+
+    def load_snapshot(self, snapshot):
+        # 从快照继续：规则状态的时刻平移到当前帧时间，立方体和物理时钟直接恢复，再按恢复的状态重建 HUD
+        if snapshot.settings_crc != self.settings_crc():
+            print("Warning: snapshot was saved with different settings")
+        now = globalClock.getFrameTime()
+        state = self.state
+        snapshot.restore(state, self.cube_swarm, self.sim_clock, now=now)
+        if self.waves:
+            self.waves.resync(state)
+        self.display_events.clear()
+        self.hide_wave_announcement()
+        self.reset_player_color()
+        self.world.update(state.position[0], state.position[1])
+        
+        self.on_restart(GameEvent(now, 'restart', state.current_game))
+        self.render_heading = state.heading
+        self.update_health_bar()
+        if state.can_jump:
+            self.show_jump_ready(None)
+        if state.warning_active:
+            self.show_warning(None)
+        if not state.game_running:
+            if state.health > 0:
+                self.show_victory(None)
+            else:
+                self.game_over(GameEvent(now, 'game_over', state.survival_time))
+
+    def set_swarm_workers(self, workers):
+        # 按配置启动或停止立方体并行推进的工作进程（0 表示只在主进程内推进）
+        stepper = self.cube_swarm.stepper
+        if (stepper.workers if stepper else 0) == workers:
+            return
+        if stepper:
+            stepper.close()
+            self.cube_swarm.stepper = None
+        if workers:
+            # 并行推进（multiprocessing、共享内存）只在启用时导入
+            from parallel_swarm import ParallelStepper
+            self.cube_swarm.stepper = ParallelStepper(self.cube_swarm, workers)
+            atexit.register(self.cube_swarm.stepper.close)
+
+    def toggle_profiler_overlay(self):
+        self.profiler_overlay_visible = not self.profiler_overlay_visible
+        if not self.profiler_overlay_visible:
+            self.profiler_text.setText('')
+
+    def update_profiler_overlay(self, task):
+        if self.profiler_overlay_visible:
+            self.profiler_text.setText(self.timer.format_overlay())
+        return Task.again
+
+    def create_text(self, **kwargs):
+        # 无窗口模式下 HUD 文本使用空实现；所有文本都只在内容或颜色变化时才更新
+        if self.headless:
+            widget = NullText(**kwargs)
+        else:
+            # GUI 控件只在窗口模式下导入
+            from direct.gui.OnscreenText import OnscreenText
+            widget = OnscreenText(**kwargs)
+        return CachedText(widget, kwargs.get('text', ''), kwargs.get('fg', (1, 1, 1, 1)))
+
+    def create_wait_bar(self, **kwargs):
+        if self.headless:
+            return NullWaitBar(**kwargs)
+        from direct.gui.DirectWaitBar import DirectWaitBar
+        return DirectWaitBar(**kwargs)
+
+    def run_headless(self, ticks):
+        # 以固定步长尽可能快地推进模拟，返回吞吐量统计
+        start = time.perf_counter()
+        for _ in range(ticks):
+            with self.timer.section('tick'):
+                self.taskMgr.step()
+        elapsed = time.perf_counter() - start
+        return {
+            'ticks': ticks,
+            'dt': globalClock.getDt(),
+            'elapsed': elapsed,
+            'steps_per_second': ticks / elapsed if elapsed > 0 else float('inf'),
+        }
+
+    def settings_crc(self):
+        # 配置校验值，用于检查回放时的配置是否与录制时一致
+        return zlib.crc32(repr(self.cfg).encode())
+
+    def state_checksum(self):
+        # 模拟结束状态的校验值：玩家物理状态、生命、局数和所有立方体的状态
+        state = self.state
+        digest = hashlib.sha256()
+        digest.update(struct.pack(
+            '<7dd?i', *state.position, *state.velocity,
+            state.heading, state.health, state.game_running, state.current_game
+        ))
+        swarm = self.cube_swarm
+        for column in (swarm.positions, swarm.headings, swarm.velocities, swarm.next_change):
+            digest.update(column.tobytes())
+        return digest.digest()
+
+    def finish_recording(self):
+        if self.input_recorder and not self.input_recorder.closed:
+            self.input_recorder.close(self.state_checksum())
+            print(f"Recorded {self.input_recorder.ticks} ticks to {self.input_recorder.path}")
+
+    def finish_replay(self):
+        # 回放结束：校验结束状态是否与录制时一致
+        self.replay_matched = self.state_checksum() == self.replay.checksum
+        print(f"Replay finished after {self.replay.count} ticks: "
+              f"{'checksum OK' if self.replay_matched else 'CHECKSUM MISMATCH'}")
+        if not self.headless:
+            self.userExit()
+        return self.replay_matched
+
+    def run_replay(self):
+        # 无窗口全速回放整个录像并校验结束状态
+        stats = self.run_headless(self.replay.count)
+        stats['matched'] = self.finish_replay()
+        return stats
+
     def add_position_display(self):
         # 创建屏幕文本，调整位置和大小
-        pos_text = OnscreenText(
+        pos_text = self.create_text(
             text='Initializing...',
             pos=(-1.3, 0.9),     # 左上角位置
             scale=0.05,          # 稍微调小字体
@@ -763,63 +990,10 @@ class SandboxGame(ShowBase):
         return pos_text
 
     def create_player(self):
-        # 创建纵向长方体
-        format = GeomVertexFormat.getV3n3c4()
-        vdata = GeomVertexData('player', format, Geom.UHStatic)
-        
-        vertex = GeomVertexWriter(vdata, 'vertex')
-        normal = GeomVertexWriter(vdata, 'normal')
-        color = GeomVertexWriter(vdata, 'color')
-        
-        # 定义长方体的8个顶点
-        h = self.player_height / 2
-        w = self.player_width / 2
-        d = self.player_depth / 2
-        points = [
-            (-w, -d, -h), (w, -d, -h), (w, d, -h), (-w, d, -h),  # 底部
-            (-w, -d, h), (w, -d, h), (w, d, h), (-w, d, h)       # 顶部
-        ]
-        
-        # 定义每个面的法线
-        normals = [
-            (0, 0, -1),  # 底面
-            (0, 0, 1),   # 顶面
-            (-1, 0, 0),  # 左面
-            (1, 0, 0),   # 右面
-            (0, -1, 0),  # 前面
-            (0, 1, 0),   # 后面
-        ]
-        
-        # 定义面的顶点索引
-        faces = [
-            (0, 1, 2, 3),  # 底面
-            (4, 5, 6, 7),  # 顶面
-            (0, 4, 7, 3),  # 左面
-            (1, 5, 6, 2),  # 右面
-            (0, 1, 5, 4),  # 前面
-            (3, 2, 6, 7),  # 后面
-        ]
-        
-        # 添加所有顶点（每个顶点重复添加，以便设置不同的法线）
-        for face_i, face in enumerate(faces):
-            for vertex_i in face:
-                vertex.addData3(*points[vertex_i])
-                normal.addData3(*normals[face_i])
-                color.addData4(0.2, 0.5, 0.8, 1)  # 蓝色
-        
-        # 创建三角形
-        tris = GeomTriangles(Geom.UHStatic)
-        for i in range(6):  # 6个面
-            base = i * 4    # 每个面4个顶点
-            # 每个面由两个三角形组成
-            tris.addVertices(base, base + 1, base + 2)
-            tris.addVertices(base, base + 2, base + 3)
-        
-        geom = Geom(vdata)
-        geom.addPrimitive(tris)
-        
+        # 创建纵向长方体（蓝色）
+        half_extents = (self.player_width / 2, self.player_depth / 2, self.player_height / 2)
         node = GeomNode('player')
-        node.addGeom(geom)
+        node.addGeom(make_box_geom(half_extents, (0.2, 0.5, 0.8, 1), name='player'))
         
         # 创建并返回节点
         player = self.render.attachNewNode(node)
@@ -834,59 +1008,10 @@ class SandboxGame(ShowBase):
         return player
 
     def create_direction_indicator(self):
-        # 创建一个小方块作为方向指示器
-        format = GeomVertexFormat.getV3n3c4()
-        vdata = GeomVertexData('direction_indicator', format, Geom.UHStatic)
-        
-        vertex = GeomVertexWriter(vdata, 'vertex')
-        normal = GeomVertexWriter(vdata, 'normal')
-        color = GeomVertexWriter(vdata, 'color')
-        
-        # 定义小方块的尺寸
+        # 创建一个小方块作为方向指示器（红色，使其更显眼）
         size = 0.3  # 小方块的大小
-        points = [
-            (-size, -size, -size), (size, -size, -size), (size, size, -size), (-size, size, -size),  # 底部
-            (-size, -size, size), (size, -size, size), (size, size, size), (-size, size, size)       # 顶部
-        ]
-        
-        # 使用与create_cube相同的法线和面定义
-        normals = [
-            (0, 0, -1),  # 底面
-            (0, 0, 1),   # 顶面
-            (-1, 0, 0),  # 左面
-            (1, 0, 0),   # 右面
-            (0, -1, 0),  # 前面
-            (0, 1, 0),   # 后面
-        ]
-        
-        faces = [
-            (0, 1, 2, 3),  # 底面
-            (4, 5, 6, 7),  # 顶面
-            (0, 4, 7, 3),  # 左面
-            (1, 5, 6, 2),  # 右面
-            (0, 1, 5, 4),  # 前面
-            (3, 2, 6, 7),  # 后面
-        ]
-        
-        # 添加所有顶点
-        for face_i, face in enumerate(faces):
-            for vertex_i in face:
-                vertex.addData3(*points[vertex_i])
-                normal.addData3(*normals[face_i])
-                color.addData4(1, 0, 0, 1)  # 红色，使其更显眼
-        
-        # 创建三角形
-        tris = GeomTriangles(Geom.UHStatic)
-        for i in range(6):
-            base = i * 4
-            tris.addVertices(base, base + 1, base + 2)
-            tris.addVertices(base, base + 2, base + 3)
-        
-        geom = Geom(vdata)
-        geom.addPrimitive(tris)
-        
         node = GeomNode('direction_indicator')
-        node.addGeom(geom)
+        node.addGeom(make_box_geom((size, size, size), (1, 0, 0, 1), name='direction_indicator'))
         
         indicator = NodePath(node)
         indicator.setTwoSided(True)
@@ -894,8 +1019,8 @@ class SandboxGame(ShowBase):
         return indicator
 
     def update_camera(self):
-        # 计算相机的目标位置（在角色正后方固定距离）
-        total_heading_rad = (self.player_heading + self.camera_heading + 180) * math.pi / 180.0
+        # 计算相机的目标位置（在角色正后方固定距离，跟随插值后的显示位置）
+        total_heading_rad = (self.render_heading + self.camera_heading + 180) * math.pi / 180.0
         pitch_rad = self.camera_pitch * math.pi / 180.0
         
         # 计算相机在水平面上的偏移
@@ -907,9 +1032,9 @@ class SandboxGame(ShowBase):
         vertical_distance = math.cos(pitch_rad) * self.camera_distance
         
         # 计算最终的目标位置
-        target_x = self.position.getX() + offset_x
-        target_y = self.position.getY() + offset_y
-        target_z = self.position.getZ() + self.camera_height + height_offset
+        target_x = self.render_position.getX() + offset_x
+        target_y = self.render_position.getY() + offset_y
+        target_z = self.render_position.getZ() + self.camera_height + height_offset
         
         # 设置相机位置
         self.camera.setPos(target_x, target_y, target_z)
@@ -917,9 +1042,9 @@ class SandboxGame(ShowBase):
         # 让相机看向角色的上半身位置
         look_height = self.player_height * 0.75
         self.camera.lookAt(
-            self.position.getX(),
-            self.position.getY(),
-            self.position.getZ() + look_height
+            self.render_position.getX(),
+            self.render_position.getY(),
+            self.render_position.getZ() + look_height
         )
         
         # 固定相机的上方向
@@ -943,186 +1068,141 @@ class SandboxGame(ShowBase):
         self.player_collision = self.player.attachNewNode(collision_node)
         
         # 添加到碰撞系统，使用队列处理器
-        self.cTrav.addCollider(self.player_collision, self.collision_queue)
+        self.cube_traverser.addCollider(self.player_collision, self.collision_queue)
         
         # 添加碰撞事件处理
         self.accept('into-player', self.handle_cube_collision)
 
-    def handle_cube_collision(self, entry):
-        if self.game_running:
-            current_time = globalClock.getRealTime()
-            # 检查是否在无敌时间内（包括落地无敌）
-            if not self.is_invincible and not self.is_landing_invincible:
-                # 检查是否在伤害冷却时间内
-                if current_time - self.last_damage_time >= self.damage_cooldown:
-                    self.update_health(-self.cfg.game_rules.damage.cube_collision)
-                    self.last_damage_time = current_time
-                    # 受伤时闪烁效果
-                    self.player.setColor(1, 0, 0, 1)  # 变红
-                    taskMgr.doMethodLater(0.1, self.reset_player_color, 'ResetPlayerColor')
-                    if self.health <= 0:
-                        self.game_over()
-
-    def reset_player_color(self, task):
+    def create_collision_backend(self):
+        backend = self.cfg.collision.backend
+        if backend == 'traverser':
+            # Panda3D 遍历器：每帧遍历整个场景图
+            return TraverserCollisionBackend(
+                self.cube_traverser, self.collision_queue, self.render, self.world
+            )
+        if backend == 'proximity':
+            # 向量化距离粗筛：只对玩家附近的立方体做精确测试
+            return ProximityCollisionBackend(
+                self.cube_swarm,
+                player_radius=self.player_width / 2,
+                player_half_height=self.player_height / 2,
+                cube_half=self.cfg.reference_cubes.appearance.scale,
+                continuous=self.cfg.collision.continuous,
+                toi_iterations=self.cfg.collision.toi_iterations,
+                timer=self.timer
+            )
+        raise ValueError(f"Unknown collision backend: {backend}")
+
+    def handle_cube_collision(self, entry, toi=1.0, dt=0.0, sim_time=None):
+        # toi：本物理步内首次接触的时刻（步长的比例）；sim_time：这一步末尾的物理时钟时间
+        # 一帧推进多步时按这一步自己的时间计算接触时刻，而不是按帧末的时间（遍历器的碰撞事件没有步时间，按帧时间）
+        step_end = self.state.time if sim_time is None else sim_time + self.sim_time_offset
+        self.state.hit_cube(step_end - (1.0 - toi) * dt)
+
+    def on_game_event(self, event):
+        # GameState 的事件流：按事件类型更新 HUD 和特效
+        handler = self.game_event_handlers.get(event.kind)
+        if handler:
+            handler(event)
+
+    def show_hit(self, event):
+        # 受伤时闪烁效果
+        self.player.setColor(1, 0, 0, 1)  # 变红
+        self.display_events.schedule(event.time + 0.1, self.reset_player_color, key='reset_color')
+
+    def reset_player_color(self):
         self.player.setColor(0.2, 0.5, 0.8, 1)  # 恢复原来的蓝色
-        return Task.done
 
-    def game_over(self):
-        self.game_running = False
-        
-        # 计算最终得分（存活时间）
-        self.survival_time = int(globalClock.getRealTime() - self.start_time)
-        
+    def show_double_jump_used(self, event):
+        self.double_jump_text.setText('Double Jump Used!')
+        self.double_jump_text.setFg((1, 0, 0, 1))
+
+    def show_jump_ready(self, event):
+        self.jump_cooldown_text.setText('Jump Ready')
+        self.jump_cooldown_text.setFg((1, 1, 1, 1))
+
+    def end_landing_invincible_display(self, event):
+        self.invincible_text.setText('')
+
+    def end_invincible_display(self, event):
+        self.invincible_text.setText('')
+        self.player.setAlphaScale(1.0)  # 恢复正常显示
+
+    def log_boundary_event(self, event):
+        # 边界违规的调试信息
+        if event.kind == 'left_too_soon':
+            print(f"Game Over! Left boundary too soon (after {event.value:.1f}s)")
+        elif event.kind == 'boundary_double_damage':
+            print("Double damage applied! Violations reset.")
+        else:
+            print(f"Normal damage applied. Violations: {event.value}")
+
+    def game_over(self, event):
         # 如果已经存在游戏结束文本，先移除它
-        if hasattr(self, 'game_over_text') and self.game_over_text:
-            self.game_over_text.destroy()
+        if self.game_over_text:
+            self.text_pool.release(self.game_over_text)
         
-        # 创建新的游戏结束文本
-        self.game_over_text = OnscreenText(
-            text=f'Game Over!\nSurvival Time: {self.survival_time} seconds\n\nPress R to restart',
+        # 创建新的游戏结束文本（显示最终得分：存活时间）
+        self.game_over_text = self.text_pool.acquire(
+            text=f'Game Over!\nSurvival Time: {event.value} seconds\n\nPress R to restart',
             pos=tuple(self.cfg.game_rules.game_over.text_position),
             scale=self.cfg.game_rules.game_over.text_scale,
             fg=(1, 0, 0, 1),
-            align=TextNode.ACenter,
-            mayChange=True
+            align=TextNode.ACenter
         )
 
-    def restart_game(self):
-        # 移除游戏结束文本
-        if hasattr(self, 'game_over_text') and self.game_over_text:
-            self.game_over_text.destroy()
-            delattr(self, 'game_over_text')  # 完全移除属性
-            # 如果是游戏结束重启，重置局数
-            self.current_game = 1
-            
-        # 移除胜利文本
-        if hasattr(self, 'victory_text') and self.victory_text:
-            self.victory_text.destroy()
-            delattr(self, 'victory_text')  # 完全移除属性
-            # 如果是胜利后重启，重置局数
-            self.current_game = 1
-        
+    def on_restart(self, event):
+        # 新的一局或结束后重开：移除结束文本，重置角色显示和 HUD
+        if self.game_over_text:
+            self.text_pool.release(self.game_over_text)
+            self.game_over_text = None
+        if self.victory_text:
+            self.text_pool.release(self.victory_text)
+            self.victory_text = None
+        self.hide_wave_announcement()
+
         # 更新局数显示
-        self.round_text.setText(f'Round: {self.current_game}')
+        self.round_text.setText(f'Round: {event.value}')
         
-        # 重置玩家状态
-        self.health = self.cfg.player_status.initial_health
-        self.update_health(0)  # 更新血条显示
-        
-        # 重置位置
-        self.position = Point3(*self.cfg.player.initial_position)
-        self.velocity = Point3(0, 0, 0)
-        self.player.setPos(self.position)
-        
-        # 重置游戏状态
-        self.game_running = True
-        self.start_time = globalClock.getRealTime()
-        
-        # 重新开始无敌时间
-        self.start_invincible_time()
+        # 角色直接显示在出生点（不从旧位置插值过去）
+        self.render_position = Point3(*self.state.position)
+        self.player.setPos(self.render_position)
         self.player.setAlphaScale(1.0)  # 确保透明度重置
         
-        # 重置所有边界相关状态
-        self.boundary_violations = []
-        self.last_boundary_return_time = 0
-        self.warning_active = False
-        self.warning_start_time = 0
-        if hasattr(self, 'warning_text') and self.warning_text:
-            self.warning_text.destroy()  # 同样使用 destroy
-            self.warning_text = None
-        
-        # 重置边界返回文本
+        # 移除边界警告，重置边界返回文本
+        self.reset_warning()
         self.boundary_return_text.setText('')
         self.boundary_return_text.setFg((1, 1, 1, 1))  # 重置颜色为白色
         
-        # 移除任何正在运行的警告任务
-        taskMgr.remove("BlinkWarning")
-        
         # 重置二段跳状态显示
         self.double_jump_text.setText('Double Jump Not Ready')
         self.double_jump_text.setFg((0.7, 0.7, 0.7, 1))
         
-        # 重置跳跃相关状态
-        self.jump_key_released = True
-        self.can_double_jump = False
-        self.is_first_jump = False
-        
-        # 重置重力相关状态
-        self.current_gravity = self.normal_gravity
-        self.is_double_jumping = False
-        
-        # 重置落地无敌状态
-        self.is_landing_invincible = False
-        self.landing_invincible_start = 0
-        
         # 重置光环效果
         self.invincible_halo.setH(0)
         self.invincible_halo.setScale(1)
         self.invincible_halo.setColorScale(1, 0.8, 0, 0.5)
 
     def update_cubes_task(self, task):
-        if not self.game_running:
+        # 游戏结束和胜利画面上立方体也继续运动，照常同步显示
+        if self.loading:
             return Task.cont
         
-        dt = globalClock.getDt()
-        current_time = task.time
-        
-        for cube, state in self.cube_states.items():
-            # 更新方向
-            if current_time >= state['next_direction_change']:
-                # 计算当前位置到初始位置的距离
-                current_pos = cube.getPos()
-                to_initial = state['initial_pos'] - current_pos
-                dist_to_initial = to_initial.length()
-                
-                if dist_to_initial > state['patrol_radius']:
-                    # 如果超出巡逻范围，直接朝向初始位置移动
-                    angle_to_initial = math.atan2(to_initial.getY(), to_initial.getX())
-                    state['move_direction'] = math.degrees(angle_to_initial)
-                    # 当需要返回时增加速度
-                    move_speed = self.cfg.cube_movement.base_speed * 1.5
-                else:
-                    # 在范围内随机移动
-                    state['move_direction'] = random.uniform(0, 360)
-                    move_speed = self.cfg.cube_movement.base_speed
-                
-                # 设置下一次改变方向的时间
-                state['next_direction_change'] = current_time + random.uniform(
-                    self.cfg.cube_movement.direction_change.min_interval,
-                    self.cfg.cube_movement.direction_change.max_interval
-                )
-            else:
-                move_speed = self.cfg.cube_movement.base_speed
-            
-            # 计算移动方向
-            direction_rad = math.radians(state['move_direction'])
-            
-            # 更新速度
-            state['velocity'].setX(math.cos(direction_rad) * move_speed)
-            state['velocity'].setY(math.sin(direction_rad) * move_speed)
-            
-            # 更新位置
-            pos = cube.getPos()
-            new_pos = pos + state['velocity'] * dt
-            
-            # 保持高度不变
-            new_pos.setZ(1)
-            
-            # 更新立方体位置
-            cube.setPos(new_pos)
-            
-            # 添加旋转
-            rotation_speed = random.uniform(
-                self.cfg.cube_movement.rotation_speed[0],
-                self.cfg.cube_movement.rotation_speed[1]
-            )
-            cube.setH(cube.getH() + rotation_speed)
+        # 玩家进入新的块时加载附近的块、卸载过远的块
+        x, y, _ = self.state.position
+        self.world.update(x, y)
+        
+        # 立方体由物理步推进，这里只把插值后的显示状态写回已加载块的节点或实例缓冲
+        if self.cfg.lod.enabled:
+            self.world.sync(self.sim_clock.alpha, (x, y), self.cfg.lod.view_distance)
+        else:
+            self.world.sync(self.sim_clock.alpha)
         
         return Task.cont
 
     def add_jump_cooldown_display(self):
         # 创建跳跃冷却显示文本
-        cooldown_text = OnscreenText(
+        cooldown_text = self.create_text(
             text='Jump Ready',
             pos=(-1.3, 0.5),     # 位置在左侧中部
             scale=0.05,
@@ -1134,7 +1214,7 @@ class SandboxGame(ShowBase):
 
     def add_score_display(self):
         # 创建得分显示文本
-        score_text = OnscreenText(
+        score_text = self.create_text(
             text='Survival Time: 0s',
             pos=tuple(self.cfg.game_rules.score.position),
             scale=self.cfg.game_rules.score.scale,
@@ -1146,7 +1226,7 @@ class SandboxGame(ShowBase):
 
     def add_invincible_display(self):
         # 创建无敌时间显示文本
-        invincible_text = OnscreenText(
+        invincible_text = self.create_text(
             text='',
             pos=(-0.25, 0.8),  # 位置在血条下方
             scale=0.05,
@@ -1156,18 +1236,13 @@ class SandboxGame(ShowBase):
         )
         return invincible_text
 
-    def start_invincible_time(self):
-        self.is_invincible = True
-        current_time = globalClock.getRealTime()
-        self.invincible_end_time = current_time + self.cfg.game_rules.damage.invincible_time
-
     def quit_game(self):
         # 退出游戏
         self.userExit()
 
     def setup_health_bar(self):
         # 创建血条标签
-        self.health_text = OnscreenText(
+        self.health_text = self.create_text(
             text='Health',
             pos=(self.cfg.player_status.health_bar.position[0],
                  self.cfg.player_status.health_bar.position[1] + 0.05),
@@ -1178,10 +1253,10 @@ class SandboxGame(ShowBase):
         )
         
         # 创建血条
-        self.health_bar = DirectWaitBar(
+        self.health_bar = self.create_wait_bar(
             text="",
-            value=self.health,
-            range=self.max_health,
+            value=self.state.health,
+            range=self.state.max_health,
             pos=(self.cfg.player_status.health_bar.position[0] + 
                  self.cfg.player_status.health_bar.width/2,
                  0,
@@ -1194,8 +1269,8 @@ class SandboxGame(ShowBase):
         )
         
         # 添加血量数值显示
-        self.health_value_text = OnscreenText(
-            text=f'{self.health}/{self.max_health}',
+        self.health_value_text = self.create_text(
+            text=f'{self.state.health}/{self.state.max_health}',
             pos=(self.cfg.player_status.health_bar.position[0] + 
                  self.cfg.player_status.health_bar.width + 0.05,
                  self.cfg.player_status.health_bar.position[1]),
@@ -1206,84 +1281,27 @@ class SandboxGame(ShowBase):
         )
         
         # 立即更新血条颜色
-        self.update_health(0)  # 调用update_health来设置正确的颜色
+        self.update_health_bar()
 
-    def update_health(self, amount):
-        """更新生命值"""
-        self.health = max(0, min(self.max_health, self.health + amount))
-        self.health_bar['value'] = self.health
-        self.health_value_text.setText(f'{int(self.health)}/{self.max_health}')
+    def update_health_bar(self, event=None):
+        """按当前生命值更新血条"""
+        health, max_health = self.state.health, self.state.max_health
+        self.health_bar['value'] = health
+        self.health_value_text.setText(f'{int(health)}/{max_health}')
         
         # 根据血量改变血条颜色
-        if self.health > self.max_health * 0.7:  # 血量 > 70%
+        if health > max_health * 0.7:  # 血量 > 70%
             self.health_bar['barColor'] = (0.2, 0.8, 0.2, 1.0)  # 绿色
-        elif self.health > self.max_health * 0.3:  # 血量 > 30%
+        elif health > max_health * 0.3:  # 血量 > 30%
             self.health_bar['barColor'] = (0.8, 0.8, 0.2, 1.0)  # 黄色
         else:  # 血量 <= 30%
             self.health_bar['barColor'] = (0.8, 0.2, 0.2, 1.0)  # 红色
-        
-        # 检查是否血量归零
-        if self.health <= 0 and self.game_running:
-            self.game_over()
-
-    def check_boundaries(self):
-        current_time = globalClock.getRealTime()
-        pos_x = self.position.getX()
-        pos_y = self.position.getY()
-        
-        # 检查是否超出边界
-        x_min, x_max = self.cfg.game_rules.boundaries.x
-        y_min, y_max = self.cfg.game_rules.boundaries.y
-        
-        if (pos_x < x_min or pos_x > x_max or 
-            pos_y < y_min or pos_y > y_max):
-            if not self.warning_active:
-                # 开始警告
-                self.warning_active = True
-                self.warning_start_time = current_time
-                
-                # 检查是否在安全返回时间内
-                if self.last_boundary_return_time > 0:
-                    time_since_return = current_time - self.last_boundary_return_time
-                    if time_since_return < self.cfg.game_rules.boundaries.violation.safe_return_time:
-                        # 如果在安全返回时间内再次离开边界，直接游戏结束
-                        print(f"Game Over! Left boundary too soon (after {time_since_return:.1f}s)")
-                        self.update_health(-self.max_health)  # 直接扣除所有血量
-                        return
-                
-                self.show_warning()
-            else:
-                # 检查警告时间是否结束
-                if current_time - self.warning_start_time >= self.cfg.game_rules.damage.warning_time:
-                    # 记录违规时间并清理过期记录
-                    self.boundary_violations.append(current_time)
-                    time_window = self.cfg.game_rules.boundaries.violation.count_time
-                    self.boundary_violations = [t for t in self.boundary_violations 
-                                             if current_time - t <= time_window]
-                    
-                    # 检查违规次数
-                    if len(self.boundary_violations) >= self.cfg.game_rules.boundaries.violation.max_violations:
-                        # 两次违规，造成双倍伤害
-                        self.update_health(-self.cfg.game_rules.damage.out_of_bounds * 2)
-                        # 清空违规记录
-                        self.boundary_violations = []
-                        print("Double damage applied! Violations reset.")  # 调试信息
-                    else:
-                        # 正常的边界伤害
-                        self.update_health(-self.cfg.game_rules.damage.out_of_bounds)
-                        print(f"Normal damage applied. Violations: {len(self.boundary_violations)}")  # 调试信息
-                    
-                    # 重置警告状态
-                    self.reset_warning()
-        else:
-            # 如果回到边界内，记录返回时间
-            if self.warning_active:
-                self.last_boundary_return_time = current_time
-                self.reset_warning()
-        
-        # 更新返回时间显示
-        if self.last_boundary_return_time > 0:
-            time_since_return = current_time - self.last_boundary_return_time
+
+    def update_boundary_display(self, current_time):
+        # 更新返回时间显示（边界违规的判定在 GameState 中）
+        last_return = self.state.last_boundary_return_time
+        if last_return is not None:
+            time_since_return = current_time - last_return
             safe_time = self.cfg.game_rules.boundaries.violation.safe_return_time
             if time_since_return < safe_time:
                 remaining = safe_time - time_since_return
@@ -1299,34 +1317,32 @@ class SandboxGame(ShowBase):
                 # 使用绿色表示安全期
                 self.boundary_return_text.setFg((0, 1, 0, 1))
 
-    def show_warning(self):
+    def show_warning(self, event):
         # 创建警告文本
-        self.warning_text = OnscreenText(
+        self.warning_text = self.text_pool.acquire(
             text="!",
             pos=(0, 0.2),  # 在屏幕中上方
             scale=self.cfg.game_rules.warning.text_scale,
             fg=tuple(self.cfg.game_rules.warning.text_color),
-            align=TextNode.ACenter,
-            mayChange=True
+            align=TextNode.ACenter
         )
         
         # 添加闪烁效果任务
-        taskMgr.add(self.blink_warning, "BlinkWarning")
+        self.add_task(self.blink_warning, "BlinkWarning")
 
-    def reset_warning(self):
-        self.warning_active = False
+    def reset_warning(self, event=None):
         if self.warning_text:
-            self.warning_text.destroy()
+            self.text_pool.release(self.warning_text)
             self.warning_text = None
         taskMgr.remove("BlinkWarning")
 
     def blink_warning(self, task):
-        if not self.warning_active or not self.warning_text:
+        if not self.state.warning_active or not self.warning_text:
             return Task.done
         
-        current_time = globalClock.getRealTime()
+        current_time = globalClock.getFrameTime()
         # 计算剩余警告时间
-        remaining = self.cfg.game_rules.damage.warning_time - (current_time - self.warning_start_time)
+        remaining = self.cfg.game_rules.damage.warning_time - (current_time - self.state.warning_start_time)
         
         if remaining <= 0:
             return Task.done
@@ -1343,7 +1359,7 @@ class SandboxGame(ShowBase):
 
     def add_boundary_return_display(self):
         # 创建边界返回时间显示文本
-        return_text = OnscreenText(
+        return_text = self.create_text(
             text='',
             pos=(-1.3, 0.3),     # 位置在左侧信息区域
             scale=0.05,
@@ -1355,7 +1371,7 @@ class SandboxGame(ShowBase):
 
     def add_double_jump_display(self):
         # 创建二段跳状态显示文本
-        double_jump_text = OnscreenText(
+        double_jump_text = self.create_text(
             text='',
             pos=(-1.3, 0.4),     # 位置在左侧信息区
             scale=0.05,
@@ -1365,48 +1381,15 @@ class SandboxGame(ShowBase):
         )
         return double_jump_text
 
-    def handle_jump_key_release(self):
-        self.keyMap["up"] = False
-        self.jump_key_released = True  # 标记跳跃键已释放
-
     def create_invincible_halo(self):
-        # 创建光环的顶点数据
-        format = GeomVertexFormat.getV3c4()
-        vdata = GeomVertexData('halo', format, Geom.UHStatic)
-        
-        vertex = GeomVertexWriter(vdata, 'vertex')
-        color = GeomVertexWriter(vdata, 'color')
-        
-        # 创建一个圆形光环
+        # 创建一个圆形光环（黄色半透明，外圈渐变到透明）
         segments = 32  # 圆的分段数
         radius = 2.0   # 光环半径
         thickness = 0.2  # 光环厚度
         
-        # 创建内圈和外圈的顶点
-        for i in range(segments + 1):
-            angle = 2.0 * math.pi * i / segments
-            x = math.cos(angle)
-            y = math.sin(angle)
-            
-            # 内圈顶点
-            vertex.addData3(x * (radius - thickness), y * (radius - thickness), 0.1)
-            # 外圈顶点
-            vertex.addData3(x * radius, y * radius, 0.1)
-            
-            # 添加颜色（黄色半透明）
-            color.addData4(1, 1, 0, 0.5)  # 内圈颜色
-            color.addData4(1, 1, 0, 0)    # 外圈颜色（渐变到透明）
-        
-        # 创建三角形带
-        tris = GeomTristrips(Geom.UHStatic)
-        for i in range(segments * 2 + 2):
-            tris.addVertex(i)
-        
-        geom = Geom(vdata)
-        geom.addPrimitive(tris)
-        
         node = GeomNode('invincible_halo')
-        node.addGeom(geom)
+        node.addGeom(make_ring_geom(radius - thickness, radius, segments, 0.1,
+                                    (1, 1, 0, 0.5), (1, 1, 0, 0), name='halo'))
         
         # 创建光环节点
         self.invincible_halo = self.player.attachNewNode(node)
@@ -1416,9 +1399,10 @@ class SandboxGame(ShowBase):
         self.invincible_halo.hide()  # 初始时隐藏
 
     def update_invincible_state(self):
-        current_time = globalClock.getRealTime()
+        current_time = globalClock.getFrameTime()
+        state = self.state
         
-        if self.is_invincible or self.is_landing_invincible:
+        if state.is_invincible or state.is_landing_invincible:
             # 显示光环并更新效果
             self.invincible_halo.show()
             
@@ -1431,7 +1415,7 @@ class SandboxGame(ShowBase):
             self.invincible_halo.setScale(scale)
             
             # 更新颜色
-            if self.is_invincible:
+            if state.is_invincible:
                 # 出生无敌时为金色
                 self.invincible_halo.setColorScale(1, 0.8, 0, 0.5 + 0.2 * math.sin(current_time * 5))
             else:
@@ -1443,7 +1427,7 @@ class SandboxGame(ShowBase):
 
     def setup_round_display(self):
         # 创建局数显示文本
-        self.round_text = OnscreenText(
+        self.round_text = self.create_text(
             text='Round: 1',
             pos=(-0.25, 0.75),     # 位置在无敌时间显示的下面
             scale=0.05,
@@ -1452,19 +1436,81 @@ class SandboxGame(ShowBase):
             mayChange=True
         )
 
-    def show_victory(self):
-        # 停止游戏运行
-        self.game_running = False
-        
+    def show_victory(self, event):
         # 创建胜利文本
-        self.victory_text = OnscreenText(
+        self.victory_text = self.text_pool.acquire(
             text='Victory!\nPress R to restart',
             pos=(0, 0.2),  # 在屏幕中上方
             scale=self.cfg.game_rules.victory.text_scale,
             fg=tuple(self.cfg.game_rules.victory.text_color),
-            align=TextNode.ACenter,
-            mayChange=True
+            align=TextNode.ACenter
         )
 
-game = SandboxGame()
-game.run() 
\ No newline at end of file
+    def announce_wave(self, wave, count):
+        # 波次提示显示几秒后归还文本（同时只显示最近的一条）
+        if count == 0:
+            return
+        self.hide_wave_announcement()
+        self.wave_text = self.text_pool.acquire(
+            text=f'Wave incoming: +{count} cubes',
+            pos=(0, 0.45),
+            scale=0.08,
+            fg=tuple(self.cfg.waves.color),
+            align=TextNode.ACenter
+        )
+        self.display_events.schedule(globalClock.getFrameTime() + self.cfg.waves.announce_time,
+                                     self.hide_wave_announcement, key='wave_announcement')
+
+    def hide_wave_announcement(self):
+        if self.wave_text:
+            self.text_pool.release(self.wave_text)
+            self.wave_text = None
+
+
+def seed_arg(text):
+    seed = int(text)
+    if not 0 <= seed <= MAX_SEED:
+        raise argparse.ArgumentTypeError(f"seed must be between 0 and {MAX_SEED}, got {seed}")
+    return seed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', action='store_true', help='无窗口固定步长模拟模式')
+    parser.add_argument('--ticks', type=int, default=3600, help='无窗口模式下模拟的步数')
+    parser.add_argument('--seed', type=seed_arg, help='随机种子（默认使用配置或随机生成）')
+    parser.add_argument('--record', metavar='PATH', help='录制输入和随机种子到录像文件')
+    parser.add_argument('--replay', metavar='PATH', help='回放录像文件并校验结束状态')
+    parser.add_argument('--connect', metavar='HOST:PORT', help='作为瘦客户端连接专用服务器（server.py）')
+    parser.add_argument('--load-snapshot', metavar='PATH', help='从世界快照（或检查点）开始')
+    args = parser.parse_args(argv)
+    if args.load_snapshot and (args.record or args.replay or args.connect):
+        parser.error('--load-snapshot cannot be combined with --record, --replay or --connect')
+    
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        game = SandboxGame(remote=RemoteSession(host or '127.0.0.1', int(port)))
+        game.run()
+        return
+    
+    replay = ReplayLog.load(args.replay) if args.replay else None
+    snapshot = Snapshot.open(args.load_snapshot) if args.load_snapshot else None
+    if args.headless:
+        game = SandboxGame(headless=True, input_source=default_script(), seed=args.seed,
+                           record_path=args.record, replay=replay, snapshot=snapshot)
+        if replay:
+            stats = game.run_replay()
+        else:
+            stats = game.run_headless(args.ticks)
+            game.finish_recording()
+        print(f"{stats['ticks']} ticks in {stats['elapsed']:.3f}s "
+              f"({stats['steps_per_second']:.0f} steps/s, dt={stats['dt']:.4f}s)")
+        if replay and not stats['matched']:
+            raise SystemExit(1)
+    else:
+        game = SandboxGame(seed=args.seed, record_path=args.record, replay=replay, snapshot=snapshot)
+        game.run()
+
+
+if __name__ == '__main__':
+    main()
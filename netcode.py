@@ -0,0 +1,128 @@
+"""服务器和客户端共用的消息格式：TCP 上逐行的 JSON 消息
+
+客户端 → 服务器：
+  {"type": "join"}                                         加入，服务器创建一个会话并回复 welcome
+  {"type": "input", "seq": n, "keys": {...}, "actions": []} 按键状态（变化时发送）和一次性动作（只接受 restart，
+                                                           server.debug_actions 打开时还接受调试用的 damage/heal）
+  {"type": "stats"}                                        查询服务器统计（不需要先加入）
+服务器 → 客户端：
+  {"type": "welcome", "session", "seed", "tick_rate", "time", "world_crc", "fields"}
+  {"type": "state", "tick", "time", "ack", "fields", "events"}  每个模拟步一条：变化过的字段和本步的事件
+  {"type": "stats", ...} / {"type": "error", "message"}
+"""
+import json
+import select
+import socket
+import time
+import zlib
+
+from game_state import STATE_FIELDS
+
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+class ProtocolError(ValueError):
+    """对端发来的消息不是合法的 JSON 对象或字段类型不对"""
+
+
+def decode(line):
+    try:
+        message = json.loads(line)
+    except ValueError as e:
+        raise ProtocolError(f"invalid JSON ({e})") from e
+    if not isinstance(message, dict):
+        raise ProtocolError(f"expected a JSON object, got {message!r:.80}")
+    return message
+
+
+def world_crc(cfg):
+    # 决定立方体场的配置的校验值：客户端与服务器一致时，用同一个种子在本地推进出相同的立方体
+    return zlib.crc32(repr((cfg.cube_movement, cfg.reference_cubes.layout, cfg.reference_cubes.appearance)).encode())
+
+
+def state_fields(state):
+    # GameState 的规则状态（列表复制一份，之后原地修改不影响已取出的值）
+    fields = {}
+    for name in STATE_FIELDS:
+        value = getattr(state, name)
+        fields[name] = list(value) if isinstance(value, list) else value
+    return fields
+
+
+def changed_fields(fields, last):
+    # 与上次发送的字段相比变化过的部分（last 为空时就是全部字段）
+    return {name: value for name, value in fields.items() if name not in last or last[name] != value}
+
+
+def apply_fields(state, fields):
+    for name, value in fields.items():
+        setattr(state, name, value)
+
+
+class RemoteSession:
+    """客户端一侧的连接：连接时阻塞等待欢迎消息，之后每帧只收取已经到达的服务器消息（不等待）"""
+
+    def __init__(self, host, port, timeout=5.0):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = b''
+        self.closed = False
+        self.seq = 0
+        self.send({'type': 'join'})
+        self.welcome = self._receive_blocking()
+        if self.welcome['type'] != 'welcome':
+            raise ConnectionError(self.welcome.get('message', 'unexpected reply'))
+        self.sock.settimeout(None)
+
+        # 服务器时间的估计：最近一条状态消息的时间加上它到达后经过的时间（不超过一步）
+        self.step = 1.0 / self.welcome['tick_rate']
+        self.server_time = self.welcome['time']
+        self.received_at = time.perf_counter()
+
+    def _receive_blocking(self):
+        while b'\n' not in self.buffer:
+            data = self.sock.recv(65536)
+            if not data:
+                raise ConnectionError("server closed the connection")
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return decode(line)
+
+    def send(self, message):
+        if not self.closed:
+            try:
+                self.sock.sendall(encode(message))
+            except OSError:
+                self.closed = True
+
+    def send_input(self, keys, actions=()):
+        self.seq += 1
+        self.send({'type': 'input', 'seq': self.seq, 'keys': keys, 'actions': list(actions)})
+
+    def poll(self):
+        # 收取已到达的所有完整消息
+        while not self.closed and select.select([self.sock], [], [], 0)[0]:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                data = b''
+            if not data:
+                self.closed = True
+                break
+            self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        messages = [decode(line) for line in lines if line]
+        for message in messages:
+            if message['type'] == 'state':
+                self.server_time = message['time']
+                self.received_at = time.perf_counter()
+        return messages
+
+    def clock(self):
+        return self.server_time + min(time.perf_counter() - self.received_at, self.step)
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
@@ -0,0 +1,160 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from cube_swarm import integrate
+
+# 工作进程推进时读写的列（换向、随机数等依赖全局顺序的部分始终在主进程中完成）
+WORKER_COLUMNS = ('positions', 'velocities', 'headings', 'prev_positions', 'prev_headings', 'last_update')
+
+
+class SharedArrays:
+    """在共享内存中分配数组（用作 CubeStore 的分配函数），记录每个数组所在的共享内存块"""
+
+    def __init__(self):
+        self.blocks = {}   # id(数组) -> (共享内存块, 数组)
+        self.retired = []  # 已不再使用、但还有视图引用而暂时无法关闭的内存块
+
+    def __call__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        array = np.ndarray(shape, dtype, buffer=block.buf)
+        array.fill(0)
+        self.blocks[id(array)] = (block, array)
+        return array
+
+    def spec(self, array):
+        # 子进程映射同一个数组所需的信息
+        block, _ = self.blocks[id(array)]
+        return block.name, array.shape, array.dtype.str
+
+    def release(self, keep=()):
+        # 释放 keep 以外的所有内存块（立即取消名字，等没有视图引用时再关闭映射）
+        keep = {id(array) for array in keep}
+        for key in [key for key in self.blocks if key not in keep]:
+            block, _ = self.blocks.pop(key)
+            block.unlink()
+            self.retired.append(block)
+        still_used = []
+        for block in self.retired:
+            try:
+                block.close()
+            except BufferError:
+                still_used.append(block)
+        self.retired = still_used
+
+
+def _worker_main(conn):
+    # 工作进程：映射共享内存中的列，每步按主进程给出的范围推进，完成后回复
+    blocks, arrays = [], {}
+    while True:
+        message = conn.recv()
+        command = message[0]
+        if command == 'attach':
+            arrays.clear()
+            for block in blocks:
+                block.close()
+            blocks = []
+            for name, (block_name, shape, dtype) in message[1].items():
+                block = shared_memory.SharedMemory(name=block_name)
+                blocks.append(block)
+                arrays[name] = np.ndarray(shape, dtype, buffer=block.buf)
+        elif command == 'step':
+            _, lo, hi, use_rows, dt, current_time = message
+            rows = arrays['rows'][lo:hi] if use_rows else slice(lo, hi)
+            integrate(arrays, rows, arrays['noise'][lo:hi], dt, current_time)
+        elif command == 'close':
+            arrays.clear()
+            for block in blocks:
+                block.close()
+            conn.send(True)
+            return
+        conn.send(True)
+
+
+class ParallelStepper:
+    """把立方体的逐行推进分给多个工作进程
+
+    立方体的列分配在共享内存中，主进程和工作进程读写同一份数据，渲染时直接读取、不需要拷贝。
+    每步把参与模拟的行平均分成连续的几段（分块加载时行号按块排列），主进程自己也推进最后一段，
+    各工作进程推进完自己的一段后回复，主进程等全部回复后才继续（每步一次屏障）。
+    """
+
+    def __init__(self, swarm, workers):
+        self.swarm = swarm
+        self.workers = workers
+        self.shared = SharedArrays()
+        swarm.set_allocator(self.shared)
+
+        # 主进程已经初始化了图形和音频，工作进程用 spawn 启动而不是 fork
+        context = multiprocessing.get_context('spawn')
+        self.connections = []
+        self.processes = []
+        for i in range(workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child_conn,),
+                                      name=f'CubeWorker-{i}', daemon=True)
+            process.start()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+        self.storage_version = None
+        self.noise = None        # 本步各行的自转角度（主进程生成）
+        self.rows = None         # 参与模拟的行号（分块加载时）
+        self.rows_source = None  # 上次写入 rows 的数组，未变化时不重复拷贝
+
+    def _attach(self):
+        # 列数组重新分配（扩容）后，重新分配辅助数组并让工作进程映射新的内存块
+        capacity = len(self.swarm.storage['positions'])
+        self.noise = self.shared((capacity,), np.float64)
+        self.rows = self.shared((capacity,), np.intp)
+        self.rows_source = None
+        arrays = {name: self.swarm.storage[name] for name in WORKER_COLUMNS}
+        arrays['noise'] = self.noise
+        arrays['rows'] = self.rows
+
+        specs = {name: self.shared.spec(array) for name, array in arrays.items()}
+        for conn in self.connections:
+            conn.send(('attach', specs))
+        for conn in self.connections:
+            conn.recv()
+        self.shared.release(keep=list(self.swarm.storage.values()) + list(arrays.values()))
+        self.storage_version = self.swarm.storage_version
+
+    def step(self, rows, noise, dt, current_time):
+        # rows 为 None 时推进前 len(noise) 行，否则推进 rows 中的行
+        if self.storage_version != self.swarm.storage_version:
+            self._attach()
+        n = len(noise)
+        self.noise[:n] = noise
+        use_rows = rows is not None
+        if use_rows and rows is not self.rows_source:
+            self.rows[:n] = rows
+            self.rows_source = rows
+
+        bounds = np.linspace(0, n, len(self.connections) + 2).astype(int).tolist()
+        for conn, lo, hi in zip(self.connections, bounds[:-2], bounds[1:-1]):
+            conn.send(('step', lo, hi, use_rows, dt, current_time))
+        lo, hi = bounds[-2], bounds[-1]
+        integrate(self.swarm.storage, self.rows[lo:hi] if use_rows else slice(lo, hi),
+                  self.noise[lo:hi], dt, current_time)
+        for conn in self.connections:
+            conn.recv()
+
+    def close(self):
+        # 停止工作进程，把立方体的列移回普通内存后释放共享内存
+        if not self.processes:
+            return
+        for conn in self.connections:
+            conn.send(('close',))
+        for conn, process in zip(self.connections, self.processes):
+            conn.recv()
+            process.join()
+            conn.close()
+        self.connections = []
+        self.processes = []
+        self.noise = self.rows = self.rows_source = None
+        self.swarm.set_allocator(np.zeros)
+        self.shared.release()
@@ -0,0 +1,185 @@
+import csv
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+
+class _NullSection:
+    """不计时的空上下文（所有调用共享同一个实例）"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTimer:
+    """默认的空计时器：任务不包装，分段计时为空操作"""
+
+    _section = _NullSection()
+
+    def section(self, name):
+        return self._section
+
+    def wrap(self, func, name):
+        return func
+
+
+NULL_TIMER = NullTimer()
+
+
+class _Section:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class SectionTimer:
+    """按名称记录每次耗时的计时器，用于基准测试统计均值和分位数"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, name, seconds):
+        self.samples[name].append(seconds)
+
+    def section(self, name):
+        return _Section(self, name)
+
+    def wrap(self, func, name):
+        # 包装任务函数，记录每次调用的耗时
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    def clear(self):
+        self.samples.clear()
+
+    def summary(self):
+        # 每个分段的调用次数以及均值/p50/p99（毫秒）
+        result = {}
+        for name, samples in self.samples.items():
+            ms = np.asarray(samples) * 1000.0
+            result[name] = {
+                'count': len(ms),
+                'mean_ms': float(ms.mean()),
+                'p50_ms': float(np.percentile(ms, 50)),
+                'p99_ms': float(np.percentile(ms, 99)),
+            }
+        return result
+
+
+# 耗时直方图的桶边界（毫秒）
+HISTOGRAM_EDGES_MS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 16.7, 33.3, 50.0, 100.0)
+
+
+class FrameProfiler:
+    """逐帧任务耗时统计：滚动窗口 + 累计直方图，可导出 CSV/JSON 记录"""
+
+    def __init__(self, window=300, max_trace_frames=36000):
+        self.window = window
+        self.max_trace_frames = max_trace_frames
+        self.rolling = {}     # 名称 -> 最近 window 帧的耗时环形缓冲（秒）
+        self.cursor = {}      # 名称 -> 环形缓冲写入位置
+        self.filled = {}      # 名称 -> 环形缓冲中的有效样本数
+        self.histograms = {}  # 名称 -> 各桶的累计计数
+        self.current = {}     # 当前帧内各名称的累计耗时
+        self.trace = []       # [(帧序号, {名称: 毫秒})]
+        self.frame = 0
+        self.last_frame_start = time.perf_counter()
+
+    def record(self, name, seconds):
+        self.current[name] = self.current.get(name, 0.0) + seconds
+
+    def section(self, name):
+        return _Section(self, name)
+
+    def wrap(self, func, name):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    def instrument_task(self, task, name=None):
+        # 包装已注册的任务（例如 ShowBase 自带的 igLoop 渲染任务）
+        task.setFunction(self.wrap(task.getFunction(), name or task.name))
+
+    def end_frame(self, task=None):
+        # 在每帧所有任务之后调用：把本帧数据写入滚动窗口、直方图和记录
+        now = time.perf_counter()
+        self.current['frame'] = now - self.last_frame_start
+        self.last_frame_start = now
+
+        for name, seconds in self.current.items():
+            if name not in self.rolling:
+                self.rolling[name] = np.zeros(self.window)
+                self.cursor[name] = 0
+                self.filled[name] = 0
+                self.histograms[name] = np.zeros(len(HISTOGRAM_EDGES_MS) + 1, dtype=np.int64)
+            self.rolling[name][self.cursor[name]] = seconds
+            self.cursor[name] = (self.cursor[name] + 1) % self.window
+            self.filled[name] = min(self.filled[name] + 1, self.window)
+            self.histograms[name][np.searchsorted(HISTOGRAM_EDGES_MS, seconds * 1000.0)] += 1
+
+        if len(self.trace) < self.max_trace_frames:
+            self.trace.append((self.frame, {k: v * 1000.0 for k, v in self.current.items()}))
+        self.frame += 1
+        self.current = {}
+        return task.cont if task is not None else None
+
+    def summary(self):
+        # 滚动窗口内每个名称的均值/p50/p99/最大值（毫秒），按均值从大到小排列
+        result = {}
+        for name, buffer in self.rolling.items():
+            ms = buffer[:self.filled[name]] * 1000.0
+            result[name] = {
+                'mean_ms': float(ms.mean()),
+                'p50_ms': float(np.percentile(ms, 50)),
+                'p99_ms': float(np.percentile(ms, 99)),
+                'max_ms': float(ms.max()),
+            }
+        return dict(sorted(result.items(), key=lambda item: -item[1]['mean_ms']))
+
+    def format_overlay(self):
+        lines = ['Task            mean    p99  (ms)']
+        for name, stats in self.summary().items():
+            lines.append(f"{name[:14]:<14} {stats['mean_ms']:6.2f} {stats['p99_ms']:6.2f}")
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        path = Path(path)
+        names = sorted({name for _, row in self.trace for name in row})
+        if path.suffix == '.csv':
+            # 每帧一行，每个任务一列（毫秒）
+            with path.open('w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['frame'] + names)
+                for frame, row in self.trace:
+                    writer.writerow([frame] + [f'{row.get(name, 0.0):.4f}' for name in names])
+        else:
+            path.write_text(json.dumps({
+                'frames': self.frame,
+                'summary': self.summary(),
+                'histogram_edges_ms': list(HISTOGRAM_EDGES_MS),
+                'histograms': {name: counts.tolist() for name, counts in self.histograms.items()},
+                'trace': [{'frame': frame, **row} for frame, row in self.trace],
+            }, indent=2))
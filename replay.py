@@ -0,0 +1,131 @@
+import struct
+import zlib
+
+import numpy as np
+
+from sim_input import KEYS
+
+# 一次性动作（调试快捷键和重开），按发生顺序逐个记录（同一 tick 内可以重复）
+ACTIONS = ("damage", "heal", "restart")
+MAX_ACTIONS_PER_TICK = 255
+
+MAGIC = b'MDRP'
+VERSION = 2
+
+# 文件头：魔数、版本、随机种子、初始化时的帧时间、配置校验值
+HEADER = struct.Struct('<4sHQdI')
+# 压缩后的数据长度（tick 记录之后紧跟所有 tick 的动作编号）
+LENGTH = struct.Struct('<I')
+# 文件尾：tick 数、结束状态校验值
+FOOTER = struct.Struct('<I32s')
+
+# 每个 tick 的记录：按键位掩码、本 tick 的动作数、鼠标水平位移、帧时间、帧间隔
+TICK_DTYPE = np.dtype([
+    ('buttons', '<u2'),
+    ('actions', 'u1'),
+    ('mouse_dx', '<f4'),
+    ('frame_time', '<f8'),
+    ('dt', '<f8'),
+])
+
+
+class ReplayError(ValueError):
+    """录像文件损坏或与当前版本不兼容"""
+
+
+def encode_buttons(keys):
+    mask = 0
+    for bit, key in enumerate(KEYS):
+        if keys[key]:
+            mask |= 1 << bit
+    return mask
+
+
+def decode_buttons(mask):
+    return {key: bool(mask >> bit & 1) for bit, key in enumerate(KEYS)}
+
+
+class InputRecorder:
+    """逐 tick 记录输入和时钟，结束时连同结束状态校验值写入紧凑的二进制文件"""
+
+    def __init__(self, path, seed, start_time, settings_crc):
+        self.path = path
+        self.seed = seed
+        self.start_time = start_time
+        self.settings_crc = settings_crc
+        self.records = bytearray()
+        self.actions = bytearray()
+        self.ticks = 0
+        self.closed = False
+
+    def record(self, keys, actions, mouse_dx, frame_time, dt):
+        if len(actions) > MAX_ACTIONS_PER_TICK:
+            raise ReplayError(f"too many actions in one tick ({len(actions)})")
+        self.records += struct.pack('<HBfdd', encode_buttons(keys), len(actions), mouse_dx, frame_time, dt)
+        self.actions += bytes(ACTIONS.index(action) for action in actions)
+        self.ticks += 1
+
+    def close(self, checksum):
+        if self.closed:
+            return
+        self.closed = True
+        payload = zlib.compress(bytes(self.records + self.actions), 9)
+        with open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.seed, self.start_time, self.settings_crc))
+            f.write(LENGTH.pack(len(payload)))
+            f.write(payload)
+            f.write(FOOTER.pack(self.ticks, checksum))
+
+
+class ReplayLog:
+    """读取录像文件，按 tick 提供输入和时钟"""
+
+    def __init__(self, seed, start_time, settings_crc, ticks, actions, checksum):
+        self.seed = seed
+        self.start_time = start_time
+        self.settings_crc = settings_crc
+        self.ticks = ticks
+        self.actions = actions
+        # 每个 tick 的动作在动作编号序列中的起点
+        self.action_starts = np.concatenate(([0], np.cumsum(ticks['actions'], dtype=np.int64)))
+        self.checksum = checksum
+        self.count = len(ticks)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        try:
+            magic, version, seed, start_time, settings_crc = HEADER.unpack_from(data, 0)
+            offset = HEADER.size
+            (length,) = LENGTH.unpack_from(data, offset)
+            offset += LENGTH.size
+            payload = zlib.decompress(data[offset:offset + length])
+            count, checksum = FOOTER.unpack_from(data, offset + length)
+        except (struct.error, zlib.error) as e:
+            raise ReplayError(f"{path}: corrupt replay file ({e})") from e
+
+        if magic != MAGIC:
+            raise ReplayError(f"{path}: not a replay file")
+        if version != VERSION:
+            raise ReplayError(f"{path}: unsupported replay version {version}")
+
+        size = count * TICK_DTYPE.itemsize
+        if len(payload) < size:
+            raise ReplayError(f"{path}: expected {count} ticks, found {len(payload) // TICK_DTYPE.itemsize}")
+        ticks = np.frombuffer(payload, dtype=TICK_DTYPE, count=count)
+        actions = np.frombuffer(payload, dtype=np.uint8, offset=size)
+        if len(actions) != int(ticks['actions'].sum()) or (actions >= len(ACTIONS)).any():
+            raise ReplayError(f"{path}: corrupt action list")
+        return cls(seed, start_time, settings_crc, ticks, actions, checksum)
+
+    def input_at(self, tick):
+        record = self.ticks[tick]
+        start, end = self.action_starts[tick], self.action_starts[tick + 1]
+        actions = [ACTIONS[code] for code in self.actions[start:end]]
+        return decode_buttons(int(record['buttons'])), actions, float(record['mouse_dx'])
+
+    def clock_at(self, tick):
+        record = self.ticks[tick]
+        return float(record['frame_time']), float(record['dt'])
@@ -0,0 +1,148 @@
+import heapq
+import itertools
+
+import numpy as np
+
+
+class TimerWheel:
+    """批量定时器（按时间分槽的时间轮）：条目是 (句柄, 时间)，每步只取出到期的条目
+
+    条目按 floor(时间 / slot) 放进时间槽，槽号放在小根堆里；
+    时间进入某个槽时才把这个槽的条目排序，之后每步用二分查找取出到期的前缀。
+    每个条目只在加入、排序和取出时各处理一次，开销与到期的条目数成正比，与定时器总数无关。
+    同一句柄可以有多个条目（重新调度后旧条目不删除），取出时返回条目的时间供使用方核对。
+    """
+
+    def __init__(self, slot=0.5):
+        self.slot = float(slot)
+        self.slots = {}         # 槽号 -> [(时间数组, 句柄数组)]
+        self.order = []         # 非空槽号的小根堆
+        self.current = None     # 已展开到近期数组的最大槽号
+        self.near_times = np.zeros(0, dtype=np.float64)  # 已展开的条目（按时间排序）
+        self.near_handles = np.zeros(0, dtype=np.int64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def schedule(self, handles, times):
+        handles = np.asarray(handles, dtype=np.int64).ravel()
+        if not len(handles):
+            return
+        times = np.broadcast_to(np.asarray(times, dtype=np.float64), handles.shape).ravel()
+        self.size += len(handles)
+        slots = np.floor(times / self.slot).astype(np.int64)
+
+        # 落在已展开的槽里的条目直接并入近期数组
+        if self.current is not None:
+            soon = slots <= self.current
+            if soon.any():
+                self._merge(times[soon], handles[soon])
+                later = ~soon
+                times, handles, slots = times[later], handles[later], slots[later]
+                if not len(handles):
+                    return
+
+        order = np.argsort(slots, kind='stable')
+        slots, times, handles = slots[order], times[order], handles[order]
+        # 按槽切片（直接切片而不用 np.split，每步只换向几个立方体时固定开销更小）
+        bounds = [0, *(np.flatnonzero(np.diff(slots)) + 1).tolist(), len(slots)]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            slot = int(slots[start])
+            chunk = (times[start:end], handles[start:end])
+            chunks = self.slots.get(slot)
+            if chunks is None:
+                self.slots[slot] = [chunk]
+                heapq.heappush(self.order, slot)
+            else:
+                chunks.append(chunk)
+
+    def pop_due(self, now):
+        # 取出时间不晚于 now 的全部条目，返回 (句柄数组, 时间数组)，按时间排序
+        slot = int(np.floor(now / self.slot))
+        if self.current is None or slot > self.current:
+            self.current = slot
+            chunks = []
+            while self.order and self.order[0] <= slot:
+                chunks.extend(self.slots.pop(heapq.heappop(self.order)))
+            if chunks:
+                self._merge(np.concatenate([t for t, _ in chunks]),
+                            np.concatenate([h for _, h in chunks]))
+        k = int(np.searchsorted(self.near_times, now, side='right'))
+        handles, times = self.near_handles[:k], self.near_times[:k]
+        self.near_handles, self.near_times = self.near_handles[k:], self.near_times[k:]
+        self.size -= k
+        return handles, times
+
+    def _merge(self, times, handles):
+        times = np.concatenate([self.near_times, times])
+        handles = np.concatenate([self.near_handles, handles])
+        order = np.argsort(times)
+        self.near_times, self.near_handles = times[order], handles[order]
+
+    def clear(self):
+        self.slots.clear()
+        self.order.clear()
+        self.current = None
+        self.near_times = self.near_times[:0]
+        self.near_handles = self.near_handles[:0]
+        self.size = 0
+
+
+class EventScheduler:
+    """按时间排序的单个事件队列（小根堆），用于游戏逻辑的定时事件
+
+    每帧只处理到期的事件；同一时刻的事件按添加顺序执行。
+    带 key 的事件同时只保留一个，重新调度会取消之前的同名事件。
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._keys = {}     # key -> 事件序号
+        self._cancelled = set()
+
+    def __len__(self):
+        return len(self._heap) - len(self._cancelled)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def schedule(self, time, callback, *args, key=None):
+        if key is not None:
+            self.cancel(key)
+        seq = next(self._seq)
+        heapq.heappush(self._heap, (time, seq, key, callback, args))
+        if key is not None:
+            self._keys[key] = seq
+        return seq
+
+    def cancel(self, key):
+        seq = self._keys.pop(key, None)
+        if seq is not None:
+            self._cancelled.add(seq)
+
+    def run_due(self, now):
+        # 执行所有到期的事件（回调中新加入且已到期的事件也在本次执行），返回执行的事件数
+        count = 0
+        while self._heap and self._heap[0][0] <= now:
+            time, seq, key, callback, args = heapq.heappop(self._heap)
+            if seq in self._cancelled:
+                self._cancelled.discard(seq)
+                continue
+            if key is not None:
+                del self._keys[key]
+            callback(*args)
+            count += 1
+        return count
+
+    def pending(self):
+        # 未执行的带 key 事件 [(时间, key)]，按执行顺序排列（保存状态时使用，回调由使用方按 key 恢复）
+        live = set(self._keys.values())
+        return [(time, key) for time, seq, key, _, _ in sorted(self._heap, key=lambda e: e[:2])
+                if seq in live]
+
+    def clear(self):
+        self._heap.clear()
+        self._keys.clear()
+        self._cancelled.clear()
@@ -0,0 +1,237 @@
+"""多会话专用服务器：在一个 asyncio 事件循环上运行大量互相独立的游戏会话
+
+用法：python server.py [--port 7777] [--tick-rate 30]
+客户端：python main.py --connect 127.0.0.1:7777；压力测试：python loadtest.py --players 200 --spawn-server
+
+每个加入的连接对应一个会话，服务器权威地运行游戏规则（GameState）、立方体运动（CubeSwarm）和碰撞检测，
+每个会话各自按固定步频推进（落后太多时丢弃时间而不是追赶）。每步给客户端发送一条状态消息：
+GameState 中变化过的字段和本步的事件（消息格式见 netcode.py）。立方体不在网络上传输：它们的运动与角色无关，
+客户端用欢迎消息中的种子和相同的步长在本地推进，得到与服务器完全相同的结果。
+"""
+import argparse
+import asyncio
+import random
+import socket
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from collision import ProximityCollisionBackend
+from cube_swarm import CubeSwarm, layout_positions
+from game_state import GameState
+from netcode import ProtocolError, changed_fields, decode, encode, state_fields, world_crc
+from settings import load_settings
+from sim_input import KEYS
+
+CONFIG_PATH = Path(__file__).parent / "config.yaml"
+
+# 客户端可以发送的一次性动作；调试动作只在 server.debug_actions 打开时接受
+CLIENT_ACTIONS = ("restart",)
+DEBUG_ACTIONS = ("damage", "heal")
+
+
+class GameSession:
+    """一个玩家的完整游戏：规则状态、立方体和碰撞检测，按固定步长推进"""
+
+    def __init__(self, cfg, session_id, seed, tick_rate):
+        self.cfg = cfg
+        self.id = session_id
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.step = 1.0 / tick_rate
+        self.tick = 0
+
+        # 立方体的布局和随机数的使用顺序与 SandboxGame 相同，客户端用同一个种子推进出相同的结果
+        grid = layout_positions(cfg.reference_cubes.layout)
+        self.swarm = CubeSwarm(cfg.cube_movement, seed=seed)
+        self.swarm.add_cubes(np.column_stack([grid, np.full(len(grid), cfg.reference_cubes.appearance.height)]))
+        self.collision = ProximityCollisionBackend(
+            self.swarm,
+            player_radius=cfg.player.width / 2,
+            player_half_height=cfg.player.height / 2,
+            cube_half=cfg.reference_cubes.appearance.scale,
+            continuous=cfg.collision.continuous,
+            toi_iterations=cfg.collision.toi_iterations
+        )
+
+        self.state = GameState(cfg)
+        self.events = []
+        self.state.subscribe(self.events.append)
+        self.keys = dict.fromkeys(KEYS, False)
+        self.actions = []
+        self.allowed_actions = CLIENT_ACTIONS + (DEBUG_ACTIONS if cfg.server.debug_actions else ())
+        self.ack = 0          # 已应用的最后一条输入的序号
+        self.sent_fields = {}
+
+        self.latency = deque(maxlen=cfg.server.latency_window)  # 每步从计划时刻到状态发出的时间
+        self.dropped_ticks = 0
+
+    def on_input(self, message):
+        # 字段类型不对视为协议错误；不允许的动作直接忽略（客户端的调试键在服务器上不起作用）
+        keys = message.get('keys', {})
+        actions = message.get('actions', [])
+        seq = message.get('seq', self.ack)
+        if not isinstance(keys, dict) or not isinstance(actions, list) or type(seq) is not int:
+            raise ProtocolError("malformed input message")
+        self.keys.update((key, bool(value)) for key, value in keys.items() if key in self.keys)
+        self.actions.extend(action for action in actions if action in self.allowed_actions)
+        self.ack = seq
+
+    def advance(self):
+        # 推进一步，顺序与 SandboxGame 的一帧相同；游戏结束后立方体继续运动（客户端按步数同步推进）
+        self.tick += 1
+        now = self.tick * self.step
+        state = self.state
+        state.apply_input(now, self.keys, self.actions)
+        self.actions.clear()
+        running = state.game_running
+        if running:
+            state.begin_frame(now)
+        self.swarm.step(self.step, now)
+        if running:
+            state.physics_step(self.step)
+            if self.collision.detect(state.position, prev_position=state.prev_position):
+                state.hit_cube(now - (1.0 - self.collision.last_toi) * self.step)
+            state.end_frame()
+
+        fields = state_fields(state)
+        message = {
+            'type': 'state',
+            'tick': self.tick,
+            'time': now,
+            'ack': self.ack,
+            'fields': changed_fields(fields, self.sent_fields),
+            'events': [(event.time, event.kind, event.value) for event in self.events],
+        }
+        self.sent_fields = fields
+        self.events.clear()
+        return message
+
+    def welcome(self, world_crc):
+        self.sent_fields = state_fields(self.state)
+        return {
+            'type': 'welcome',
+            'session': self.id,
+            'seed': self.seed,
+            'tick_rate': self.tick_rate,
+            'time': self.state.time,
+            'world_crc': world_crc,
+            'fields': self.sent_fields,
+        }
+
+    async def run(self, writer, max_steps):
+        # 按计划时刻推进；落后时一次最多补 max_steps 步，其余时间丢弃（与 FixedStepClock 相同的策略）
+        loop = asyncio.get_running_loop()
+        due = loop.time() + self.step
+        try:
+            while not writer.is_closing():
+                await asyncio.sleep(due - loop.time())
+                steps = int((loop.time() - due) / self.step) + 1
+                if steps > max_steps:
+                    self.dropped_ticks += steps - max_steps
+                    due += (steps - max_steps) * self.step
+                    steps = max_steps
+                for _ in range(steps):
+                    writer.write(encode(self.advance()))
+                    self.latency.append(loop.time() - due)
+                    due += self.step
+                await writer.drain()
+        except ConnectionError:
+            pass
+
+    def summary(self):
+        latency = np.array(self.latency) * 1000.0
+        p50, p99 = np.percentile(latency, [50, 99]).tolist() if len(latency) else (0.0, 0.0)
+        return {
+            'ticks': self.tick,
+            'dropped_ticks': self.dropped_ticks,
+            'latency_ms': {'p50': p50, 'p99': p99, 'max': float(latency.max()) if len(latency) else 0.0},
+        }
+
+
+class GameServer:
+    """接受连接并为每个加入的客户端运行一个会话"""
+
+    def __init__(self, cfg, tick_rate=None, seed=None):
+        self.cfg = cfg
+        self.tick_rate = tick_rate or cfg.server.tick_rate
+        self.world_crc = world_crc(cfg)
+        self.rng = random.Random(seed)
+        self.sessions = {}
+        self.next_id = 1
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+    async def handle_client(self, reader, writer):
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = task = None
+        try:
+            async for line in reader:
+                message = decode(line)
+                kind = message.get('type')
+                if kind == 'input' and session:
+                    session.on_input(message)
+                elif kind == 'join' and session is None:
+                    if len(self.sessions) >= self.cfg.server.max_sessions:
+                        writer.write(encode({'type': 'error', 'message': 'server full'}))
+                        break
+                    session = GameSession(self.cfg, self.next_id, self.rng.getrandbits(32), self.tick_rate)
+                    self.next_id += 1
+                    self.sessions[session.id] = session
+                    writer.write(encode(session.welcome(self.world_crc)))
+                    task = asyncio.create_task(session.run(writer, self.cfg.simulation.max_steps_per_frame))
+                elif kind == 'stats':
+                    writer.write(encode(self.stats()))
+        except ProtocolError as e:
+            peer = writer.get_extra_info('peername')
+            print(f"Closing connection from {peer}{f' (session {session.id})' if session else ''}: {e}", flush=True)
+        except ConnectionError:
+            pass
+        finally:
+            if task:
+                task.cancel()
+            if session:
+                del self.sessions[session.id]
+            writer.close()
+
+    def stats(self):
+        # 服务器进程的 CPU 时间和每个会话的 tick 延迟
+        return {
+            'type': 'stats',
+            'sessions': len(self.sessions),
+            'tick_rate': self.tick_rate,
+            'wall_seconds': time.perf_counter() - self.started,
+            'cpu_seconds': time.process_time() - self.cpu_started,
+            'per_session': {session_id: session.summary() for session_id, session in self.sessions.items()},
+        }
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Serving on {address[0]}:{address[1]} ({self.tick_rate:g} ticks/s per session)", flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', help='监听地址（默认使用配置）')
+    parser.add_argument('--port', type=int, help='监听端口（默认使用配置）')
+    parser.add_argument('--tick-rate', type=float, help='每个会话的模拟步频（默认使用配置）')
+    parser.add_argument('--seed', type=int, help='生成各会话立方体种子的随机种子')
+    args = parser.parse_args(argv)
+
+    cfg = load_settings(CONFIG_PATH)
+    server = GameServer(cfg, args.tick_rate, args.seed)
+    host = args.host or cfg.server.host
+    port = cfg.server.port if args.port is None else args.port
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
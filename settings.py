@@ -0,0 +1,544 @@
+import os
+import types
+import typing
+from dataclasses import dataclass, field, fields, is_dataclass, MISSING
+from typing import Optional
+
+import yaml
+
+
+class SettingsError(ValueError):
+    """配置文件的类型或取值范围不合法"""
+
+
+# 随机种子的取值范围（numpy 只接受非负种子，录像文件头用 64 位无符号整数保存）
+MAX_SEED = 2 ** 64 - 1
+
+
+def _range(lo=None, hi=None, default=MISSING):
+    # 数值字段的取值范围（闭区间，None 表示不限制；可选字段为 None 时不检查）
+    return field(default=default, metadata={'range': (lo, hi)})
+
+
+def _choice(*options):
+    return field(metadata={'choices': options})
+
+
+Color = tuple[float, float, float, float]
+Vec2 = tuple[float, float]
+Vec3 = tuple[float, float, float]
+
+
+def _check(condition, path, message):
+    if not condition:
+        raise SettingsError(f"{path}: {message}")
+
+
+def _check_interval(interval, path):
+    _check(interval[0] < interval[1], path, f"minimum must be below maximum, got {list(interval)}")
+
+
+@dataclass(frozen=True, slots=True)
+class WindowSettings:
+    title: str
+    width: int = _range(1)
+    height: int = _range(1)
+
+
+@dataclass(frozen=True, slots=True)
+class HeadlessSettings:
+    tick_rate: float = _range(1)
+
+
+@dataclass(frozen=True, slots=True)
+class SimulationSettings:
+    tick_rate: float = _range(1)
+    max_steps_per_frame: int = _range(1)
+    workers: int = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class PlayerSettings:
+    height: float = _range(0.01)
+    width: float = _range(0.01)
+    depth: float = _range(0.01)
+    initial_position: Vec3
+    initial_heading: float
+
+
+@dataclass(frozen=True, slots=True)
+class DoubleJumpSettings:
+    enabled: bool
+    speed: float = _range(0)
+    height: float = _range(0)
+    health_cost: int = _range(0)
+    min_height: float = _range(0)
+    fall_speed_scale: float = _range(0)
+    landing_invincible_time: float = _range(0)
+    landing_cooldown: float = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class PhysicsSettings:
+    acceleration: float = _range(0)
+    max_speed: float = _range(0)
+    deceleration_per_second: float = _range(0, 1)
+    min_speed: float = _range(0)
+    turn_speed: float = _range(0)
+    gravity: float = _range(None, 0)
+    ground_height: float
+    jump_speed: float = _range(0)
+    jump_cooldown: float = _range(0)
+    double_jump: DoubleJumpSettings
+
+
+@dataclass(frozen=True, slots=True)
+class CameraSettings:
+    distance: float = _range(0)
+    height: float
+    pitch: float = _range(-90, 90)
+    smooth: float = _range(0, 1)
+    mouse_sensitivity: float = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class AmbientLightSettings:
+    color: Color
+
+
+@dataclass(frozen=True, slots=True)
+class DirectionalLightSettings:
+    color: Color
+    direction: Vec3
+
+
+@dataclass(frozen=True, slots=True)
+class LightingSettings:
+    ambient: AmbientLightSettings
+    directional: DirectionalLightSettings
+
+
+@dataclass(frozen=True, slots=True)
+class AreaSettings:
+    x: Vec2
+    y: Vec2
+
+    def _validate(self, path):
+        _check_interval(self.x, f"{path}.x")
+        _check_interval(self.y, f"{path}.y")
+
+
+@dataclass(frozen=True, slots=True)
+class TerrainSettings:
+    grid_size: float = _range(0.01)
+    size: AreaSettings
+    color: Color
+
+
+@dataclass(frozen=True, slots=True)
+class WorldSettings:
+    chunked: bool
+    chunk_size: float = _range(1)
+    load_radius: int = _range(0)
+    unload_radius: int = _range(0)
+
+    def _validate(self, path):
+        _check(self.unload_radius >= self.load_radius, f"{path}.unload_radius", "must not be below load_radius")
+
+
+@dataclass(frozen=True, slots=True)
+class LodSettings:
+    enabled: bool
+    near_distance: float = _range(0)
+    far_interval: int = _range(1)
+    view_distance: float = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class DirectionIndicatorSettings:
+    size: float = _range(0)
+    color: Color
+    offset: Vec3
+
+
+@dataclass(frozen=True, slots=True)
+class PlayerCollisionSettings:
+    radius: float = _range(0)
+    height_scale: float = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class CollisionDebugSettings:
+    show_collisions: bool
+
+
+@dataclass(frozen=True, slots=True)
+class CollisionSettings:
+    backend: str = _choice('proximity', 'traverser')
+    continuous: bool
+    toi_iterations: int = _range(1)
+    player: PlayerCollisionSettings
+    debug: CollisionDebugSettings
+
+    def _validate(self, path):
+        _check(not self.continuous or self.backend == 'proximity', f"{path}.continuous",
+               "requires the proximity backend")
+
+
+@dataclass(frozen=True, slots=True)
+class DirectionChangeSettings:
+    min_interval: float = _range(0)
+    max_interval: float = _range(0)
+
+    def _validate(self, path):
+        _check(self.min_interval <= self.max_interval, path, "min_interval must not exceed max_interval")
+
+
+@dataclass(frozen=True, slots=True)
+class CubeMovementSettings:
+    base_speed: float = _range(0)
+    patrol_radius: float = _range(0)
+    direction_change: DirectionChangeSettings
+    rotation_speed: Vec2
+    boundary: float = _range(0)
+    seed: Optional[int] = _range(0, MAX_SEED, default=None)
+
+    def _validate(self, path):
+        _check(self.rotation_speed[0] <= self.rotation_speed[1], f"{path}.rotation_speed",
+               "minimum must not exceed maximum")
+
+
+@dataclass(frozen=True, slots=True)
+class LayoutSettings:
+    x: Vec2
+    y: Vec2
+    spacing: float = _range(0.01)
+    safe_zone: float = _range(0)
+
+    def _validate(self, path):
+        _check_interval(self.x, f"{path}.x")
+        _check_interval(self.y, f"{path}.y")
+
+
+@dataclass(frozen=True, slots=True)
+class CubeAppearanceSettings:
+    scale: float = _range(0.01)
+    height: float
+    color_variation: bool
+
+
+@dataclass(frozen=True, slots=True)
+class CubeRenderingSettings:
+    instanced: bool
+    batch_size: int = _range(1)
+
+
+@dataclass(frozen=True, slots=True)
+class ReferenceCubesSettings:
+    layout: LayoutSettings
+    appearance: CubeAppearanceSettings
+    rendering: CubeRenderingSettings
+
+
+@dataclass(frozen=True, slots=True)
+class HealthRegenSettings:
+    amount: float = _range(0)
+    interval: float = _range(0)
+    still_time: float = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class HealthBarColors:
+    background: Color
+    fill: Color
+    border: Color
+
+
+@dataclass(frozen=True, slots=True)
+class HealthBarSettings:
+    position: Vec2
+    width: float = _range(0)
+    height: float = _range(0)
+    colors: HealthBarColors
+
+
+@dataclass(frozen=True, slots=True)
+class PlayerStatusSettings:
+    max_health: int = _range(1)
+    initial_health: int = _range(1)
+    health_regen: HealthRegenSettings
+    health_bar: HealthBarSettings
+
+    def _validate(self, path):
+        _check(self.initial_health <= self.max_health, f"{path}.initial_health", "must not exceed max_health")
+
+
+@dataclass(frozen=True, slots=True)
+class ViolationSettings:
+    count_time: float = _range(0)
+    max_violations: int = _range(1)
+    safe_return_time: float = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class BoundarySettings:
+    x: Vec2
+    y: Vec2
+    violation: ViolationSettings
+
+    def _validate(self, path):
+        _check_interval(self.x, f"{path}.x")
+        _check_interval(self.y, f"{path}.y")
+
+
+@dataclass(frozen=True, slots=True)
+class DamageSettings:
+    cube_collision: float = _range(0)
+    out_of_bounds: float = _range(0)
+    warning_time: float = _range(0)
+    invincible_time: float = _range(0)
+    damage_cooldown: float = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class WarningSettings:
+    text_scale: float = _range(0)
+    text_color: Color
+
+
+@dataclass(frozen=True, slots=True)
+class GameOverSettings:
+    text_position: Vec2
+    text_scale: float = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class VictorySettings:
+    text_scale: float = _range(0)
+    text_color: Color
+
+
+@dataclass(frozen=True, slots=True)
+class ScoreSettings:
+    position: Vec2
+    scale: float = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class GameRulesSettings:
+    boundaries: BoundarySettings
+    damage: DamageSettings
+    warning: WarningSettings
+    game_over: GameOverSettings
+    victory: VictorySettings
+    score: ScoreSettings
+    round_times: tuple[float, ...]
+
+    def _validate(self, path):
+        _check(len(self.round_times) > 0, f"{path}.round_times", "must not be empty")
+        _check(all(t > 0 for t in self.round_times), f"{path}.round_times",
+               f"must be positive, got {list(self.round_times)}")
+
+
+@dataclass(frozen=True, slots=True)
+class HudSettings:
+    debug_refresh_rate: float = _range(0)
+    text_pool: int = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class LoadingSettings:
+    progressive: bool
+    frame_budget: float = _range(0.001)
+
+
+@dataclass(frozen=True, slots=True)
+class ProfilingSettings:
+    enabled: bool
+    window: int = _range(1)
+    overlay_key: str
+    overlay_interval: float = _range(0.01)
+    trace_path: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class HotReloadSettings:
+    enabled: bool
+    interval: float = _range(0.01)
+
+
+@dataclass(frozen=True, slots=True)
+class ServerSettings:
+    host: str
+    port: int = _range(0, 65535)
+    tick_rate: float = _range(1)
+    max_sessions: int = _range(1)
+    latency_window: int = _range(1)
+    debug_actions: bool
+
+
+@dataclass(frozen=True, slots=True)
+class SnapshotSettings:
+    directory: str
+    quicksave_key: str
+    quickload_key: str
+    checkpoint_interval: float = _range(0)
+    keyframe_interval: int = _range(1)
+
+
+@dataclass(frozen=True, slots=True)
+class WaveSettings:
+    round: int = _range(1)
+    at: float = _range(0)
+    count: int = _range(1)
+    lifetime: float = _range(0)
+
+
+@dataclass(frozen=True, slots=True)
+class WavesSettings:
+    enabled: bool
+    pool_size: int = _range(1)
+    color: Color
+    spawn_distance: Vec2
+    announce_time: float = _range(0)
+    schedule: tuple[WaveSettings, ...] = ()
+
+    def _validate(self, path):
+        _check(self.spawn_distance[0] >= 0, f"{path}.spawn_distance", "must not be negative")
+        _check_interval(self.spawn_distance, f"{path}.spawn_distance")
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """编译后的只读配置（启动时从 config.yaml 校验并生成一次）"""
+    window: WindowSettings
+    headless: HeadlessSettings
+    simulation: SimulationSettings
+    player: PlayerSettings
+    physics: PhysicsSettings
+    camera: CameraSettings
+    lighting: LightingSettings
+    terrain: TerrainSettings
+    world: WorldSettings
+    lod: LodSettings
+    direction_indicator: DirectionIndicatorSettings
+    collision: CollisionSettings
+    cube_movement: CubeMovementSettings
+    reference_cubes: ReferenceCubesSettings
+    player_status: PlayerStatusSettings
+    game_rules: GameRulesSettings
+    hud: HudSettings
+    loading: LoadingSettings
+    profiling: ProfilingSettings
+    hot_reload: HotReloadSettings
+    server: ServerSettings
+    snapshot: SnapshotSettings
+    waves: WavesSettings
+
+
+def _convert(tp, value, path):
+    if is_dataclass(tp):
+        return _build(tp, value, path)
+
+    origin = typing.get_origin(tp)
+    if origin in (typing.Union, types.UnionType):
+        args = typing.get_args(tp)
+        if value is None and type(None) in args:
+            return None
+        (inner,) = [arg for arg in args if arg is not type(None)]
+        return _convert(inner, value, path)
+
+    if origin is tuple:
+        args = typing.get_args(tp)
+        _check(isinstance(value, (list, tuple)), path, f"expected a list, got {value!r}")
+        if len(args) == 2 and args[1] is Ellipsis:
+            args = (args[0],) * len(value)
+        _check(len(value) == len(args), path, f"expected {len(args)} items, got {len(value)}")
+        return tuple(_convert(arg, item, f"{path}[{i}]") for i, (arg, item) in enumerate(zip(args, value)))
+
+    if tp is bool:
+        _check(isinstance(value, bool), path, f"expected a boolean, got {value!r}")
+        return value
+    if tp is int:
+        _check(isinstance(value, int) and not isinstance(value, bool), path, f"expected an integer, got {value!r}")
+        return value
+    if tp is float:
+        _check(isinstance(value, (int, float)) and not isinstance(value, bool), path,
+               f"expected a number, got {value!r}")
+        return float(value)
+    if tp is str:
+        _check(isinstance(value, str), path, f"expected a string, got {value!r}")
+        return value
+    raise TypeError(f"Unsupported settings type {tp!r} at {path}")
+
+
+def _build(cls, data, path):
+    _check(isinstance(data, dict), path or '<root>', f"expected a mapping, got {data!r}")
+    hints = typing.get_type_hints(cls)
+    known = {f.name for f in fields(cls)}
+    unknown = sorted(set(data) - known)
+    _check(not unknown, path or '<root>', f"unknown keys {unknown}")
+
+    values = {}
+    for f in fields(cls):
+        key_path = f"{path}.{f.name}" if path else f.name
+        if f.name not in data:
+            _check(f.default is not MISSING, key_path, "missing required key")
+            values[f.name] = f.default
+            continue
+
+        value = _convert(hints[f.name], data[f.name], key_path)
+        if 'range' in f.metadata and value is not None:
+            lo, hi = f.metadata['range']
+            _check(lo is None or value >= lo, key_path, f"must be >= {lo}, got {value}")
+            _check(hi is None or value <= hi, key_path, f"must be <= {hi}, got {value}")
+        if 'choices' in f.metadata:
+            _check(value in f.metadata['choices'], key_path,
+                   f"must be one of {list(f.metadata['choices'])}, got {value!r}")
+        values[f.name] = value
+
+    settings = cls(**values)
+    validate = getattr(settings, '_validate', None)
+    if validate:
+        validate(path or '<root>')
+    return settings
+
+
+def compile_settings(cfg):
+    # 解析插值并转换为普通容器，再逐字段校验生成只读配置树
+    from omegaconf import OmegaConf
+    return _build(Settings, OmegaConf.to_container(cfg, resolve=True), '')
+
+
+def load_settings(path, overrides=None):
+    # OmegaConf 只在加载配置时导入（只使用配置数据类的模块不需要）
+    from omegaconf import OmegaConf
+    cfg = OmegaConf.load(path)
+    if overrides:
+        cfg = OmegaConf.merge(cfg, OmegaConf.create(overrides))
+    return compile_settings(cfg)
+
+
+class SettingsReloader:
+    """监视配置文件的修改时间，文件变化时重新编译（编译失败则保留旧配置）"""
+
+    def __init__(self, path, overrides=None):
+        self.path = path
+        self.overrides = overrides
+        self.mtime = os.stat(path).st_mtime_ns
+
+    def poll(self):
+        from omegaconf.errors import OmegaConfBaseException
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime == self.mtime:
+            return None
+        self.mtime = mtime
+
+        try:
+            return load_settings(self.path, self.overrides)
+        except (SettingsError, OSError, yaml.YAMLError, OmegaConfBaseException) as e:
+            print(f"Config reload failed, keeping previous settings: {e}")
+            return None
@@ -0,0 +1,42 @@
+from bisect import bisect_right
+from itertools import accumulate
+
+# keyMap 中的所有按键
+KEYS = ("forward", "backward", "turn_left", "turn_right", "up", "down")
+
+
+class ScriptedInput:
+    """按 tick 驱动的脚本化输入源，替代键盘事件更新 keyMap"""
+
+    def __init__(self, segments, loop=True):
+        # segments: [(持续的 tick 数, 按下的键), ...]
+        self.segments = [(int(ticks), frozenset(keys)) for ticks, keys in segments]
+        self.ends = list(accumulate(ticks for ticks, _ in self.segments))
+        self.period = self.ends[-1] if self.ends else 0
+        self.loop = loop
+
+    def keys_at(self, tick):
+        if self.loop and self.period:
+            tick %= self.period
+        index = bisect_right(self.ends, tick)
+        pressed = self.segments[index][1] if index < len(self.segments) else frozenset()
+        return {key: key in pressed for key in KEYS}
+
+
+def default_script():
+    # 沿正方形绕圈（每条边后左转 90 度），第一条边上连续两次起跳（普通跳跃 + 二段跳），
+    # 最后原地静止以触发回血
+    return ScriptedInput([
+        (20, ["forward"]),
+        (5, ["forward", "up"]),
+        (10, ["forward"]),
+        (5, ["forward", "up"]),
+        (45, ["turn_left"]),
+        (40, ["forward"]),
+        (45, ["turn_left"]),
+        (40, ["forward"]),
+        (45, ["turn_left"]),
+        (40, ["forward"]),
+        (45, ["turn_left"]),
+        (240, []),
+    ])
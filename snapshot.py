@@ -0,0 +1,320 @@
+"""世界快照：玩家规则状态、定时事件、立方体的全部状态列和随机数状态的二进制文件
+
+文件由定长的文件头、段表和若干段组成，每段是一块连续的定宽数组（段的起点按 8 字节对齐）：
+  player      规则状态（STATE_FIELDS 中的定长字段和按键状态）的一条记录
+  violations  边界违规记录（时间）
+  timers      未到期的定时事件（时间、key 的编号）
+  handles     每行立方体的句柄；free 为可复用的句柄
+  其余        CUBE_COLUMNS 中的每一列（与内存中的列布局相同）
+写入时在内存中按布局填好一整块缓冲区后一次写出；读取时用 mmap 映射文件，各段直接是指向文件内容的数组，
+不逐个解析实体。
+
+增量快照只保存与上一个快照（同一目录中序号为 base 的文件，文件头记录它的段数据校验值，打开时核对，
+基准文件被覆盖或替换时报错而不是合并到错误的状态上）不同的部分：每段要么不变，要么整段保存，
+要么只保存变化的行（行号数组加这些行的数据），取三者中最小的一种。
+立方体的增删会让行和句柄的对应关系变化，这时总是写完整快照。
+"""
+import itertools
+import math
+import mmap
+import struct
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from cube_store import CUBE_COLUMNS
+from game_state import STATE_FIELDS, TIMER_CALLBACKS
+from replay import decode_buttons, encode_buttons
+
+MAGIC = b'MDSN'
+VERSION = 2
+
+KEYFRAME, DELTA = 0, 1
+
+# 文件头：魔数、版本、类型、序号、增量的基准序号、配置校验值、段数据的校验值、基准快照的段数据校验值、
+# 物理时钟（步数、模拟时间、累加器）、立方体随机数状态（PCG64 的 state 和 inc，has_uint32，uinteger）、段数
+HEADER = struct.Struct('<4sHBxIIIIIqdd32sIIH2x')
+
+# 段表：每段在文件中的起点、行数和保存方式
+SECTION_DTYPE = np.dtype([('offset', '<u8'), ('rows', '<u8'), ('mode', '<u4'), ('pad', '<u4')])
+FULL, SPARSE, SAME = 0, 1, 2
+
+# 规则状态字段的定长类型（未列出的是 float64，None 保存为 NaN）；边界违规记录是变长的，单独成段
+FIELD_TYPES = {
+    'survival_time': '<i8',
+    'current_game': '<i8',
+    'position': ('<f8', (3,)),
+    'prev_position': ('<f8', (3,)),
+    'velocity': ('<f8', (3,)),
+    **dict.fromkeys(('game_running', 'can_jump', 'jump_key_released', 'is_first_jump', 'can_double_jump',
+                     'is_double_jumping', 'is_invincible', 'is_landing_invincible', 'warning_active'), '?'),
+}
+PLAYER_DTYPE = np.dtype([(name, FIELD_TYPES.get(name, '<f8')) for name in STATE_FIELDS
+                         if name != 'boundary_violations'] + [('keys', '<u2')])
+
+TIMER_KEYS = tuple(TIMER_CALLBACKS)
+TIMER_DTYPE = np.dtype([('time', '<f8'), ('key', '<u1')])
+
+# 段名 -> 每行的类型（按文件中的顺序）
+SECTIONS = {
+    'player': PLAYER_DTYPE,
+    'violations': np.dtype('<f8'),
+    'timers': TIMER_DTYPE,
+    'handles': np.dtype('<i8'),
+    'free': np.dtype('<i8'),
+    **{name: np.dtype((dtype, shape)) if shape else np.dtype(dtype)
+       for name, (shape, dtype) in CUBE_COLUMNS.items()},
+}
+
+
+class SnapshotError(ValueError):
+    """快照文件损坏、与当前版本不兼容或缺少增量的基准快照"""
+
+
+def checkpoint_name(sequence):
+    return f'{sequence:06d}.mdsn'
+
+
+def _run_directory(parent):
+    # 新建本次运行的检查点目录（同一秒内启动多次时加后缀区分）
+    parent.mkdir(parents=True, exist_ok=True)
+    name = time.strftime('run-%Y%m%d-%H%M%S')
+    for attempt in itertools.count():
+        directory = parent / (name if attempt == 0 else f'{name}-{attempt}')
+        try:
+            directory.mkdir()
+        except FileExistsError:
+            continue
+        return directory
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _view(buffer, dtype, rows, offset):
+    # 缓冲区中的一段定宽数组（不复制）
+    if rows == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.frombuffer(buffer, dtype=dtype, count=rows, offset=offset)
+
+
+def _row_bytes(array):
+    # 每行的原始字节（逐字节比较，NaN 与 NaN 视为相同）
+    return np.ascontiguousarray(array).reshape(len(array), -1).view(np.uint8)
+
+
+class Snapshot:
+    """一份完整的世界状态：段名到数组的映射，以及物理时钟和随机数状态
+
+    capture 复制当前状态；open 映射文件，各段是指向文件内容的只读数组。
+    """
+
+    def __init__(self, sections, clock, rng, settings_crc=0, sequence=0, checksum=None):
+        self.sections = sections
+        self.clock = clock              # (步数, 模拟时间, 累加器)
+        self.rng = rng                  # PCG64 的状态字典
+        self.settings_crc = settings_crc
+        self.sequence = sequence
+        self.checksum = checksum        # 写入或打开的文件的段数据校验值（还没有写入时为 None）
+
+    @property
+    def time(self):
+        return float(self.sections['player'][0]['time'])
+
+    @property
+    def cube_count(self):
+        return len(self.sections['handles'])
+
+    @classmethod
+    def capture(cls, state, swarm, clock=None, settings_crc=0):
+        player = np.zeros(1, dtype=PLAYER_DTYPE)
+        for name in PLAYER_DTYPE.names:
+            if name == 'keys':
+                player[name] = encode_buttons(state.keys)
+            else:
+                value = getattr(state, name)
+                player[name] = math.nan if value is None else value
+
+        timers = state.pending_timers()
+        timer_rows = np.zeros(len(timers), dtype=TIMER_DTYPE)
+        if timers:
+            timer_rows['time'] = [time for time, _ in timers]
+            timer_rows['key'] = [TIMER_KEYS.index(key) for _, key in timers]
+
+        sections = {
+            'player': player,
+            'violations': np.array(state.boundary_violations, dtype=np.float64),
+            'timers': timer_rows,
+            'handles': swarm.handles.copy(),
+            'free': np.array(swarm.free_handles, dtype=np.int64),
+        }
+        for name in CUBE_COLUMNS:
+            sections[name] = getattr(swarm, name).copy()
+        clock_state = (clock.steps, clock.time, clock.accumulator) if clock else (0, 0.0, 0.0)
+        return cls(sections, clock_state, swarm.rng.bit_generator.state, settings_crc)
+
+    def restore(self, state, swarm, clock=None, now=None):
+        """把快照写回规则状态、立方体群和物理时钟；给出 now 时规则状态的时刻平移到以 now 为当前时间"""
+        record = self.sections['player'][0]
+        for name in PLAYER_DTYPE.names:
+            value = record[name].tolist()
+            if name == 'keys':
+                state.keys = decode_buttons(value)
+            else:
+                setattr(state, name, None if isinstance(value, float) and math.isnan(value) else value)
+        state.boundary_violations = self.sections['violations'].tolist()
+        state.restore_timers([(time, TIMER_KEYS[key]) for time, key in self.sections['timers'].tolist()])
+        if now is not None:
+            state.shift_time(now - state.time)
+
+        swarm.restore(self.sections['handles'], {name: self.sections[name] for name in CUBE_COLUMNS},
+                      self.sections['free'])
+        swarm.rng.bit_generator.state = self.rng
+        if clock:
+            clock.steps, clock.time, clock.accumulator = self.clock
+
+    # ---- 文件格式 ----
+
+    def _changes(self, base):
+        # 相对 base 的每段变化：段名 -> (保存方式, 行号, 数据)；行和句柄的对应关系变化时返回 None
+        if not np.array_equal(self.sections['handles'], base.sections['handles']):
+            return None
+        changes = {}
+        for name, array in self.sections.items():
+            previous = base.sections[name]
+            if array.shape != previous.shape:
+                changes[name] = (FULL, None, array)
+                continue
+            if not len(array):
+                changes[name] = (SAME, None, None)
+                continue
+            rows = np.flatnonzero((_row_bytes(array) != _row_bytes(previous)).any(axis=1))
+            row_size = array.nbytes // len(array)
+            if not len(rows):
+                changes[name] = (SAME, None, None)
+            elif len(rows) * (8 + row_size) < len(array) * row_size:
+                changes[name] = (SPARSE, rows.astype(np.uint64), array[rows])
+            else:
+                changes[name] = (FULL, None, array)
+        return changes
+
+    def write(self, path, base=None):
+        """写入文件（给出已写入文件的 base 时尽量写成相对 base 的增量），返回是否写成了增量"""
+        changes = self._changes(base) if base is not None and base.checksum is not None else None
+        kind = KEYFRAME if changes is None else DELTA
+        if changes is None:
+            changes = {name: (FULL, None, array) for name, array in self.sections.items()}
+
+        # 先排好每段的位置，再把所有段填进同一块缓冲区
+        table = np.zeros(len(SECTIONS), dtype=SECTION_DTYPE)
+        offset = HEADER.size + table.nbytes
+        for i, (mode, rows, data) in enumerate(changes.values()):
+            offset = _align(offset)
+            table[i] = (offset, 0, mode, 0)
+            if mode == SPARSE:
+                table['rows'][i] = len(rows)
+                offset = _align(offset + rows.nbytes) + data.nbytes
+            elif mode == FULL:
+                table['rows'][i] = len(data)
+                offset += data.nbytes
+        buffer = bytearray(_align(offset))
+        _view(buffer, SECTION_DTYPE, len(table), HEADER.size)[:] = table
+        for (name, (mode, rows, data)), start in zip(changes.items(), table['offset'].tolist()):
+            if mode == SPARSE:
+                _view(buffer, np.uint64, len(rows), start)[:] = rows
+                start = _align(start + rows.nbytes)
+            if mode != SAME and len(data):
+                _view(buffer, SECTIONS[name], len(data), start)[:] = data
+
+        rng = self.rng
+        generator = rng['state']
+        steps, sim_time, accumulator = self.clock
+        self.checksum = zlib.crc32(memoryview(buffer)[HEADER.size:])
+        HEADER.pack_into(
+            buffer, 0, MAGIC, VERSION, kind, self.sequence, base.sequence if kind == DELTA else 0,
+            self.settings_crc, self.checksum, base.checksum if kind == DELTA else 0, steps, sim_time, accumulator,
+            generator['state'].to_bytes(16, 'little') + generator['inc'].to_bytes(16, 'little'),
+            rng['has_uint32'], rng['uinteger'], len(SECTIONS)
+        )
+        with open(path, 'wb') as f:
+            f.write(buffer)
+        return kind == DELTA
+
+    @classmethod
+    def open(cls, path, base=None):
+        """映射快照文件；增量快照按文件头中的基准序号从同一目录依次打开基准快照（也可以直接给出 base）"""
+        path = Path(path)
+        with open(path, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise SnapshotError(f"{path}: empty snapshot file") from e
+        try:
+            (magic, version, kind, sequence, base_sequence, settings_crc, checksum, base_checksum,
+             steps, sim_time, accumulator, generator, has_uint32, uinteger, count) = HEADER.unpack_from(data, 0)
+        except struct.error as e:
+            raise SnapshotError(f"{path}: corrupt snapshot file ({e})") from e
+        if magic != MAGIC:
+            raise SnapshotError(f"{path}: not a snapshot file")
+        if version != VERSION:
+            raise SnapshotError(f"{path}: unsupported snapshot version {version}")
+        if count != len(SECTIONS) or zlib.crc32(memoryview(data)[HEADER.size:]) != checksum:
+            raise SnapshotError(f"{path}: corrupt snapshot file (checksum mismatch)")
+
+        if kind == DELTA:
+            if base is None:
+                base = cls.open(path.with_name(checkpoint_name(base_sequence)))
+            if base.sequence != base_sequence:
+                raise SnapshotError(f"{path}: delta expects base snapshot {base_sequence}, got {base.sequence}")
+            if base.checksum != base_checksum:
+                raise SnapshotError(f"{path}: base snapshot {base_sequence} was overwritten or belongs to another run")
+
+        sections = {}
+        table = _view(data, SECTION_DTYPE, count, HEADER.size)
+        for (name, dtype), (offset, rows, mode, _) in zip(SECTIONS.items(), table.tolist()):
+            if mode == FULL:
+                sections[name] = _view(data, dtype, rows, offset)
+            elif mode == SAME:
+                sections[name] = base.sections[name]
+            else:
+                changed = _view(data, np.uint64, rows, offset).astype(np.intp)
+                merged = base.sections[name].copy()
+                merged[changed] = _view(data, dtype, rows, _align(offset + 8 * rows))
+                sections[name] = merged
+
+        rng = {
+            'bit_generator': 'PCG64',
+            'state': {'state': int.from_bytes(generator[:16], 'little'),
+                      'inc': int.from_bytes(generator[16:], 'little')},
+            'has_uint32': has_uint32,
+            'uinteger': uinteger,
+        }
+        return cls(sections, (steps, sim_time, accumulator), rng, settings_crc, sequence, checksum)
+
+
+class Checkpointer:
+    """定期检查点：每 keyframe_interval 个写一次完整快照，其余只写相对上一个检查点的增量
+
+    每次运行写到 directory 下按启动时间命名的新子目录，序号从 1 开始也不会覆盖之前运行的检查点。
+    """
+
+    def __init__(self, directory, keyframe_interval):
+        self.directory = _run_directory(Path(directory))
+        self.keyframe_interval = keyframe_interval
+        self.sequence = 0
+        self.last = None
+        self.bytes_written = 0
+
+    def save(self, snapshot):
+        # 返回写入的文件路径
+        self.sequence += 1
+        snapshot.sequence = self.sequence
+        base = self.last if (self.sequence - 1) % self.keyframe_interval else None
+        path = self.directory / checkpoint_name(self.sequence)
+        snapshot.write(path, base)
+        self.last = snapshot
+        self.bytes_written += path.stat().st_size
+        return path
@@ -0,0 +1,310 @@
+"""长时间运行测试：用机器人策略自动连续玩大量局，按局统计内存、场景节点、状态缓存、任务数和每步耗时，检查是否随局数上涨
+
+用法：python soak.py --rounds 2000 --round-time 10 --policy bot runaway --output soak.json
+
+每局结束（进入下一局或重开）时先回收垃圾（Python 的循环引用和 Panda3D 未使用的 RenderState/TransformState），
+再记录 tracemalloc 统计的 Python 堆、场景图的节点数、状态缓存数、任务数、各定时器中的条目数和本局每步占用的 CPU 时间的中位数。
+游戏结束或胜利后等待 --restart-delay 步再重开，每场游戏轮换一个策略（默认在躲避立方体的 bot 和
+跑出边界的 runaway 之间轮换，覆盖进入下一局、胜利、边界警告和游戏结束）。前 --warmup-rounds 局不参与判断（缓存和对象池在这段时间内填满），
+之后每个指标按局号做最小二乘直线拟合，拟合出的总增长超过限度时判定失败，报告中列出失败的指标和 Python 堆增长最多的代码行，
+进程以退出码 1 结束。
+
+默认无窗口运行（HUD 文本是空实现）；--window 打开真实窗口，同时检查 DirectGUI 文本节点的创建和回收。
+"""
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from batch_runner import POLICIES, parse_sweep
+from settings import load_settings
+from sim_input import KEYS
+
+CONFIG_PATH = Path(__file__).parent / "config.yaml"
+
+# 每局记录的指标（记录在预先分配的数组中，测试本身不会随局数占用更多 Python 堆）
+SAMPLE_FIELDS = ('ticks', 'tick_p50_ms', 'tick_max_ms', 'python_heap_bytes', 'python_objects', 'scene_nodes',
+                 'gui_nodes', 'render_states', 'transform_states', 'tasks', 'messenger_events',
+                 'rule_timers', 'display_timers', 'cube_timers')
+# 一局的结束方式：round 进入下一局，game_over 游戏结束，victory 胜利
+OUTCOMES = ('round', 'game_over', 'victory')
+
+# 按相对增长判断的计数类指标（总增长不超过中位数的 --max-count-growth 比例，且至少允许 COUNT_SLACK 的波动）
+COUNT_METRICS = ('python_objects', 'scene_nodes', 'gui_nodes', 'render_states', 'transform_states',
+                 'tasks', 'messenger_events', 'rule_timers', 'display_timers', 'cube_timers')
+COUNT_SLACK = 2.0
+
+# 报告中列出的 Python 堆增长最多的代码行数
+TOP_ALLOCATIONS = 10
+
+
+class RunawayPolicy:
+    """跑出边界，退回边界内后立即再跑出去：触发边界警告，然后因过早离开边界而游戏结束"""
+
+    def __init__(self, rng, cfg):
+        self.bounds = cfg.game_rules.boundaries
+
+    def __call__(self, state, cubes, tick):
+        x, y, _ = state.position
+        inside = (self.bounds.x[0] <= x <= self.bounds.x[1]) and (self.bounds.y[0] <= y <= self.bounds.y[1])
+        keys = dict.fromkeys(KEYS, False)
+        keys['forward' if inside else 'backward'] = True
+        return keys
+
+
+SOAK_POLICIES = {**POLICIES, 'runaway': RunawayPolicy}
+
+
+class PolicyInput:
+    """把玩家策略包装成 SandboxGame 的输入源：每个 tick 按当前规则状态和立方体位置选择按键，每场游戏轮换一个策略"""
+
+    def __init__(self, policies):
+        self.policies = policies
+        self.index = 0
+        self.game = None  # 游戏创建后设置
+
+    def next_policy(self):
+        self.index = (self.index + 1) % len(self.policies)
+
+    def keys_at(self, tick):
+        return self.policies[self.index](self.game.state, self.game.cube_swarm.positions, tick)
+
+
+class SoakRunner:
+    """驱动一个 SandboxGame 连续玩多局，每局结束时记录一次指标"""
+
+    def __init__(self, game, rounds, restart_delay):
+        from panda3d.core import RenderState, TransformState
+        self.render_state = RenderState
+        self.transform_state = TransformState
+        self.game = game
+        self.restart_delay = restart_delay
+        self.table = np.zeros(rounds, dtype=[(name, np.float64 if name.startswith('tick_') else np.int64)
+                                             for name in SAMPLE_FIELDS] + [('outcome', np.uint8)])
+        self.count = 0          # 已记录的局数
+        self.round_ticks = []   # 本局每步占用的 CPU 时间（秒，不受同一台机器上其他进程的影响）
+        self.round_ended = False
+        self.outcome = 0        # 本局的结束方式（OUTCOMES 中的序号）
+        self.stopped_ticks = 0  # 游戏结束后经过的步数
+        game.state.subscribe(self.on_game_event)
+
+    def on_game_event(self, event):
+        if event.kind == 'restart':
+            self.round_ended = True
+        elif event.kind in ('game_over', 'victory'):
+            self.outcome = OUTCOMES.index(event.kind)
+
+    @property
+    def samples(self):
+        return self.table[:self.count]
+
+    def run(self, warmup_rounds=0, progress=100):
+        # 玩满预先分配的局数，返回预热结束时的 tracemalloc 快照（没有启用 tracemalloc 时为 None）
+        baseline = None
+        while self.count < len(self.table):
+            self.step()
+            if not self.round_ended:
+                continue
+            self.round_ended = False
+            self.sample()
+            if self.count == warmup_rounds and tracemalloc.is_tracing():
+                baseline = tracemalloc.take_snapshot()
+            if progress and self.count % progress == 0:
+                sample = self.table[self.count - 1]
+                print(f"round {self.count}: heap {sample['python_heap_bytes'] / 2**20:.2f} MiB, "
+                      f"tick p50 {sample['tick_p50_ms']:.3f} ms, nodes {sample['scene_nodes']:.0f}, "
+                      f"tasks {sample['tasks']:.0f}", file=sys.stderr)
+        return baseline
+
+    def step(self):
+        game = self.game
+        if not game.state.game_running:
+            # 游戏结束或胜利：结束文本显示一段时间后重开
+            self.stopped_ticks += 1
+            if self.stopped_ticks >= self.restart_delay:
+                game.pending_actions.append('restart')
+                game.input_source.next_policy()
+                self.stopped_ticks = 0
+        start = time.process_time()
+        game.taskMgr.step()
+        self.round_ticks.append(time.process_time() - start)
+
+    def sample(self):
+        game = self.game
+        ticks = np.asarray(self.round_ticks) * 1000.0
+        self.round_ticks = []
+        outcome, self.outcome = self.outcome, 0
+
+        # 只统计仍被引用的对象：先回收循环引用和没有被引用的状态缓存
+        gc.collect()
+        self.render_state.garbageCollect()
+        self.transform_state.garbageCollect()
+        values = {
+            'ticks': len(ticks),
+            'tick_p50_ms': float(np.median(ticks)),
+            'tick_max_ms': float(ticks.max()),
+            'python_heap_bytes': tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0,
+            'python_objects': len(gc.get_objects()),
+            'scene_nodes': game.render.countNumDescendants(),
+            'gui_nodes': game.render2d.countNumDescendants(),
+            'render_states': self.render_state.getNumStates(),
+            'transform_states': self.transform_state.getNumStates(),
+            'tasks': len(game.taskMgr.getTasks()) + len(game.taskMgr.getDoLaters()),
+            'messenger_events': len(game.messenger.getEvents()),
+            'rule_timers': len(game.state.timers),
+            'display_timers': len(game.display_events),
+            'cube_timers': len(game.cube_swarm.direction_timers),
+        }
+        self.table[self.count] = (*(values[name] for name in SAMPLE_FIELDS), outcome)
+        self.count += 1
+
+
+def trend(values, limit):
+    # 按局号拟合直线，返回拟合的总增长及是否超过限度
+    values = np.asarray(values, dtype=np.float64)
+    rounds = np.arange(len(values))
+    slope, intercept = np.polyfit(rounds, values, 1)
+    growth = slope * (len(values) - 1)
+    return {
+        'first': values[0].item(),
+        'last': values[-1].item(),
+        'min': values.min().item(),
+        'max': values.max().item(),
+        'slope_per_round': slope.item(),
+        'growth': growth.item(),
+        'limit': limit,
+        'passed': bool(growth <= limit),
+    }
+
+
+def analyze(samples, max_memory_growth, max_tick_growth, max_count_growth):
+    # 对预热之后的样本逐个指标判断是否在上涨
+    metrics = {}
+    if samples['python_heap_bytes'][0]:
+        metrics['python_heap_bytes'] = trend(samples['python_heap_bytes'], max_memory_growth)
+    ticks = samples['tick_p50_ms']
+    metrics['tick_p50_ms'] = trend(ticks, max_tick_growth * float(np.median(ticks)))
+    for name in COUNT_METRICS:
+        values = samples[name]
+        metrics[name] = trend(values, max(max_count_growth * float(np.median(values)), COUNT_SLACK))
+    return metrics
+
+
+def top_allocations(baseline, limit=TOP_ALLOCATIONS):
+    # 预热结束到测试结束之间 Python 堆增长最多的代码行
+    if baseline is None:
+        return []
+    stats = tracemalloc.take_snapshot().compare_to(baseline, 'lineno')
+    return [{'location': str(stat.traceback), 'size_diff_bytes': stat.size_diff, 'count_diff': stat.count_diff}
+            for stat in stats[:limit] if stat.size_diff > 0]
+
+
+def create_game(args, overrides):
+    # 在 main 之前导入的 Panda3D 配置决定窗口类型，所以 SandboxGame 在这里才导入
+    from panda3d.core import ClockObject, loadPrcFileData
+    if args.window:
+        loadPrcFileData('', 'sync-video false')
+    from main import SandboxGame
+
+    cfg = load_settings(CONFIG_PATH, overrides)
+    rng = random.Random(args.seed)
+    source = PolicyInput([SOAK_POLICIES[name](rng, cfg) for name in args.policy])
+    game = SandboxGame(headless=not args.window, input_source=source, config_overrides=overrides,
+                       seed=args.seed)
+    source.game = game
+    if args.window:
+        # 窗口模式也按固定步长推进（每帧一步），不等待真实时间
+        clock = ClockObject.getGlobalClock()
+        clock.setMode(ClockObject.MNonRealTime)
+        clock.setFrameRate(game.cfg.headless.tick_rate)
+    while game.loading:
+        game.taskMgr.step()
+    return game
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=1000, help='统计的局数（包括预热）')
+    parser.add_argument('--warmup-rounds', type=int, default=20, help='不参与判断的前几局')
+    parser.add_argument('--policy', nargs='+', choices=sorted(SOAK_POLICIES), default=['bot', 'runaway'],
+                        help='玩家策略（指定多个时每场游戏轮换）')
+    parser.add_argument('--round-time', type=float, help='每局需要存活的时间（秒，默认使用配置；调短可以更快地跑完多局）')
+    parser.add_argument('--restart-delay', type=int, default=30, help='游戏结束或胜利后等待多少步再重开')
+    parser.add_argument('--set', nargs=2, action='append', metavar=('PATH', 'VALUE'),
+                        help='覆盖配置项（可多次指定，值按 YAML 解析），例如 --set waves.enabled true')
+    parser.add_argument('--seed', type=int, default=0, help='立方体和玩家策略的随机种子')
+    parser.add_argument('--window', action='store_true', help='打开窗口运行（检查 DirectGUI 文本节点）')
+    parser.add_argument('--no-tracemalloc', action='store_true', help='不跟踪 Python 堆（运行更快，不检查内存增长）')
+    parser.add_argument('--max-memory-growth', type=float, default=512.0,
+                        help='预热之后允许的 Python 堆总增长（KiB，按拟合直线计算）')
+    parser.add_argument('--max-tick-growth', type=float, default=0.25,
+                        help='预热之后允许的每步耗时中位数总增长（占中位数的比例）')
+    parser.add_argument('--max-count-growth', type=float, default=0.05,
+                        help='预热之后允许的节点、状态缓存、任务和定时器数量的总增长（占中位数的比例）')
+    parser.add_argument('--progress', type=int, default=100, help='每多少局输出一次进度（0 表示不输出）')
+    parser.add_argument('--raw', action='store_true', help='在结果中包含每一局的记录')
+    parser.add_argument('--output', help='JSON 结果输出路径（默认输出到标准输出）')
+    args = parser.parse_args(argv)
+    if args.rounds - args.warmup_rounds < 3:
+        raise SystemExit("--rounds must exceed --warmup-rounds by at least 3")
+
+    ((_, overrides),) = parse_sweep([[path, value] for path, value in args.set or ()])
+    if args.round_time is not None:
+        rounds = len(load_settings(CONFIG_PATH, overrides).game_rules.round_times)
+        overrides.setdefault('game_rules', {})['round_times'] = [args.round_time] * rounds
+
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    game = create_game(args, overrides)
+    runner = SoakRunner(game, args.rounds, args.restart_delay)
+    start = time.perf_counter()
+    baseline = runner.run(args.warmup_rounds, args.progress)
+    elapsed = time.perf_counter() - start
+
+    metrics = analyze(runner.samples[args.warmup_rounds:], args.max_memory_growth * 1024,
+                      args.max_tick_growth, args.max_count_growth)
+    failures = [name for name, metric in metrics.items() if not metric['passed']]
+    ticks = int(runner.samples['ticks'].sum())
+    print(f"{args.rounds} rounds ({ticks} ticks) in {elapsed:.1f}s: "
+          + (f"FAILED, growing: {', '.join(failures)}" if failures else "no growth detected"), file=sys.stderr)
+    for name in failures:
+        metric = metrics[name]
+        print(f"  {name}: {metric['first']:g} -> {metric['last']:g} "
+              f"(fitted growth {metric['growth']:g}, limit {metric['limit']:g})", file=sys.stderr)
+
+    report = {
+        'rounds': args.rounds,
+        'warmup_rounds': args.warmup_rounds,
+        'policy': args.policy,
+        'seed': args.seed,
+        'window': args.window,
+        'overrides': overrides,
+        'ticks': ticks,
+        'elapsed_seconds': elapsed,
+        'outcomes': dict(zip(OUTCOMES, np.bincount(runner.samples['outcome'], minlength=len(OUTCOMES)).tolist())),
+        'passed': not failures,
+        'failures': failures,
+        'metrics': metrics,
+        'top_allocations': top_allocations(baseline),
+    }
+    if args.raw:
+        report['samples'] = [{'round': i + 1, 'outcome': OUTCOMES[sample['outcome']],
+                               **{name: sample[name].item() for name in SAMPLE_FIELDS}}
+                              for i, sample in enumerate(runner.samples)]
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
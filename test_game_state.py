@@ -0,0 +1,191 @@
+"""GameState 和立方体模拟的单元测试（不需要 Panda3D，直接用 python -m pytest 运行）"""
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from collision import swept_capsule_box_toi
+from cube_swarm import CubeSwarm, layout_positions
+from game_state import GameState, TickInput
+from settings import load_settings
+from sim_input import KEYS
+
+CONFIG_PATH = Path(__file__).parent / "config.yaml"
+STEP = 1.0 / 60
+
+
+def make_state(overrides=None):
+    # 返回状态和它发出的事件列表
+    state = GameState(load_settings(CONFIG_PATH, overrides))
+    events = []
+    state.subscribe(events.append)
+    return state, events
+
+
+def tick(state, *pressed, actions=(), hit=False):
+    state.step(STEP, TickInput({key: key in pressed for key in KEYS}, tuple(actions), hit))
+
+
+def run(state, seconds, *pressed, hit=False):
+    for _ in range(round(seconds / STEP)):
+        tick(state, *pressed, hit=hit)
+
+
+def kinds(events):
+    return [event.kind for event in events]
+
+
+def times(events, kind):
+    return [event.time for event in events if event.kind == kind]
+
+
+# ---- 跳跃、冷却和无敌 ----
+
+def test_spawn_invincibility_blocks_jump_and_damage():
+    state, events = make_state()
+    run(state, 4.9, "up", hit=True)
+    assert state.health == 100
+    assert 'jump' not in kinds(events) and 'hit' not in kinds(events)
+
+    run(state, 0.2, "up", hit=True)
+    assert times(events, 'invincible_end') == [pytest.approx(5.0, abs=STEP)]
+    assert kinds(events).count('jump') == 1
+
+
+def test_double_jump_state_machine():
+    state, events = make_state({'game_rules': {'damage': {'invincible_time': 0.0}}})
+    double_jump = state.cfg.physics.double_jump
+    tick(state)
+
+    for _ in range(6):
+        tick(state, "up")
+    assert kinds(events).count('jump') == 1
+    assert state.is_first_jump and state.can_double_jump and not state.can_jump
+    assert 'double_jump' not in kinds(events)  # 跳跃键一直按着，不会触发二段跳
+
+    for _ in range(2):
+        tick(state)
+    tick(state, "up")
+    assert kinds(events).count('double_jump') == 1
+    assert state.is_double_jumping and not state.can_double_jump
+    assert state.health == 100 - double_jump.health_cost
+
+    # 落地后短暂无敌，跳跃冷却换成二段跳落地的冷却时间
+    while not state.is_landing_invincible:
+        tick(state)
+    landed = state.time
+    assert state.position[2] == state.floor and not state.is_double_jumping
+    run(state, double_jump.landing_invincible_time + 0.1)
+    assert times(events, 'landing_invincible_end') == [
+        pytest.approx(landed + double_jump.landing_invincible_time, abs=STEP)]
+
+    run(state, double_jump.landing_cooldown)
+    (jump_time,) = times(events, 'jump')
+    assert times(events, 'jump_ready') == [pytest.approx(landed + double_jump.landing_cooldown, abs=STEP)]
+    assert state.can_jump and jump_time < landed
+
+
+def test_jump_cooldown_spaces_repeated_jumps():
+    state, events = make_state({'game_rules': {'damage': {'invincible_time': 0.0}}})
+    run(state, 1.0)  # 开局一秒内起跳按二段跳落地的冷却计算（landing_invincible_start 从 0 开始）
+    run(state, 5.0, "up")
+    first, second, third = times(events, 'jump')
+    assert second - first == pytest.approx(state.cfg.physics.jump_cooldown, abs=STEP)
+    assert third - second == pytest.approx(state.cfg.physics.jump_cooldown, abs=STEP)
+    assert 'double_jump' not in kinds(events)
+
+
+def test_damage_cooldown_limits_cube_hits():
+    state, events = make_state({'game_rules': {'damage': {'invincible_time': 0.0}},
+                                'player_status': {'health_regen': {'amount': 0.0}}})
+    run(state, 3.5, hit=True)
+    hits = times(events, 'hit')
+    assert len(hits) == 3  # 受伤冷却从 last_damage_time = 0 开始计算，第一次在 1 秒时
+    assert np.diff(hits) == pytest.approx([state.cfg.game_rules.damage.damage_cooldown] * 2, abs=STEP)
+    assert state.health == 100 - 3 * state.cfg.game_rules.damage.cube_collision
+
+
+# ---- 边界违规 ----
+
+def test_boundary_violations_escalate():
+    state, events = make_state({'game_rules': {'damage': {'out_of_bounds': 10}},
+                                'player_status': {'health_regen': {'amount': 0.0}}})
+    damage = state.cfg.game_rules.damage
+    outside = [state.cfg.game_rules.boundaries.x[1] + 5.0, 0.0, state.floor]
+    state.position = list(outside)
+
+    run(state, damage.warning_time + 0.1)
+    assert kinds(events).count('boundary_damage') == 1
+    assert state.health == 90
+
+    # 计数窗口内第二次期满：双倍伤害并清空记录
+    run(state, damage.warning_time + 0.1)
+    assert kinds(events).count('boundary_double_damage') == 1
+    assert state.health == 70 and state.boundary_violations == []
+
+    # 回到边界内后在安全返回时间内再次离开，直接游戏结束
+    state.position = [0.0, 0.0, state.floor]
+    tick(state)
+    assert state.last_boundary_return_time == state.time
+    state.position = list(outside)
+    tick(state)
+    assert 'left_too_soon' in kinds(events)
+    assert state.health == 0 and not state.game_running
+    assert kinds(events)[-1] == 'game_over'
+
+
+# ---- 局数 ----
+
+def test_rounds_follow_round_times():
+    state, events = make_state({'game_rules': {'round_times': [2, 3]}})
+    run(state, 2.1)
+    assert state.current_game == 2 and state.game_running
+    assert [event.value for event in events if event.kind == 'restart'] == [2]
+
+    run(state, 3.1)
+    assert not state.game_running and kinds(events)[-1] == 'victory'
+    run(state, 1.0)
+    assert state.current_game == 2  # 胜利后不再推进
+
+    tick(state, actions=["restart"])
+    assert state.game_running and state.current_game == 1
+    assert state.health == state.cfg.player_status.initial_health
+
+
+# ---- 连续碰撞检测 ----
+
+def test_swept_capsule_box_toi():
+    # 半径 0.5 的胶囊从 x=-5 平移到 x=5，经过原点处边长 2 的立方体：中心到 x=-1.5 时接触，t = 3.5 / 10
+    boxes = np.array([[0.0, 0.0, 0.0], [0.0, 20.0, 0.0], [-5.0, 0.0, 0.0]])
+    headings = np.zeros(len(boxes))
+    toi = swept_capsule_box_toi([-5.0, 0.0, 0.0], [5.0, 0.0, 0.0], 0.5, 0.5, boxes, boxes,
+                                headings, headings, 1.0, max_step=0.5, iterations=20)
+    assert toi[0] == pytest.approx(0.35, abs=1e-5)
+    assert toi[1] == np.inf  # 路径外的立方体
+    assert toi[2] == 0.0     # 起点就已经重叠
+
+
+# ---- 并行推进 ----
+
+def test_parallel_swarm_matches_serial():
+    from parallel_swarm import ParallelStepper
+
+    cfg = load_settings(CONFIG_PATH)
+    grid = layout_positions(cfg.reference_cubes.layout)
+    positions = np.column_stack([grid, np.full(len(grid), cfg.reference_cubes.appearance.height)])
+    serial = CubeSwarm(cfg.cube_movement, seed=11)
+    parallel = CubeSwarm(cfg.cube_movement, seed=11)
+    for swarm in (serial, parallel):
+        swarm.add_cubes(positions)
+
+    parallel.stepper = ParallelStepper(parallel, 2)
+    try:
+        for i in range(1, 301):
+            serial.step(STEP, i * STEP)
+            parallel.step(STEP, i * STEP)
+    finally:
+        parallel.stepper.close()
+        parallel.stepper = None
+
+    for name, column in serial.storage.items():
+        assert np.array_equal(column[:serial.count], parallel.storage[name][:parallel.count]), name
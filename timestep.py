@@ -0,0 +1,34 @@
+class FixedStepClock:
+    """固定步长累加器：把可变的帧间隔换算成整数个模拟步，剩余时间用于渲染插值"""
+
+    def __init__(self, tick_rate, max_steps=5):
+        self.configure(tick_rate, max_steps)
+        self.accumulator = 0.0
+        self.time = 0.0    # 模拟时间（已推进的步数 × 步长）
+        self.steps = 0     # 已推进的总步数
+        self.dropped = 0.0 # 因单帧步数上限而丢弃的时间（卡顿时不追赶，避免越追越慢）
+
+    def configure(self, tick_rate, max_steps=5):
+        self.step = 1.0 / tick_rate
+        self.max_steps = max_steps
+
+    def advance(self, dt):
+        # 累加本帧时间，返回需要推进的步数（容差避免浮点误差导致某帧少走一步）
+        self.accumulator += dt
+        steps = int((self.accumulator + 1e-9) / self.step)
+        if steps > self.max_steps:
+            self.dropped += (steps - self.max_steps) * self.step
+            self.accumulator -= (steps - self.max_steps) * self.step
+            steps = self.max_steps
+        self.accumulator = max(self.accumulator - steps * self.step, 0.0)
+        return steps
+
+    def tick(self):
+        # 每推进一步调用一次
+        self.steps += 1
+        self.time += self.step
+
+    @property
+    def alpha(self):
+        # 渲染插值系数：上一步状态与当前状态之间的位置（0~1）
+        return min(self.accumulator / self.step, 1.0)
@@ -0,0 +1,150 @@
+"""立方体波次：预先加入立方体群的立方体池，以及按配置在每局的指定时间生成、到期或换局时回收立方体的调度
+
+不依赖 Panda3D；场景层在每个物理步推进立方体之前调用 WaveDirector.update。
+"""
+import heapq
+import math
+
+import numpy as np
+
+# 停放位置：远离地形（不会进入角色附近的碰撞格子，也在相机的远裁剪面之外）
+PARKED_POSITION = (1e6, 1e6, -1e3)
+# 停放的立方体的换向时间（不会到达）
+PARKED_TIME = 1e15
+
+
+class CubePool:
+    """预先加入立方体群的一组立方体，不用时停放在场外，取用和归还都是 O(1)
+
+    取用和归还只改写这些行的状态列，不增删行：行号和句柄不变，地形块不需要重新分组，
+    场景节点在加载时就已创建，生成立方体不会造成卡顿。
+    """
+
+    def __init__(self, swarm, size, color):
+        self.swarm = swarm
+        parked = np.broadcast_to(np.asarray(PARKED_POSITION, dtype=np.float64), (size, 3))
+        self.handles = swarm.add(size, positions=parked, initial_positions=parked, prev_positions=parked,
+                                 next_change=PARKED_TIME, colors=color)
+        self.free = self.handles[::-1].tolist()  # 栈：最后归还的最先取用
+
+    def __len__(self):
+        return len(self.handles)
+
+    @property
+    def in_use(self):
+        return len(self.handles) - len(self.free)
+
+    def acquire(self, n):
+        # 取出最多 n 个立方体的句柄（池用完时少于 n 个），由调用方放到场内
+        n = min(n, len(self.free))
+        if n == 0:
+            return []
+        taken = self.free[-n:]
+        del self.free[-n:]
+        return taken
+
+    def release(self, handles, current_time):
+        # 归还的立方体停放到场外，不再运动和换向
+        if not handles:
+            return
+        n = len(handles)
+        self.swarm.place(handles, np.broadcast_to(PARKED_POSITION, (n, 3)), np.zeros((n, 2)),
+                         PARKED_TIME, current_time, schedule=False)
+        self.free.extend(handles)
+
+    def parked(self):
+        # 每个句柄当前是否停放在场外（恢复快照后据此重建使用状态）
+        return self.swarm.positions[self.swarm.rows_of(self.handles), 2] == PARKED_POSITION[2]
+
+
+class WaveDirector:
+    """按配置的波次表在每局的指定时间从立方体池生成立方体，到期或换局时回收
+
+    波次的时间是局内时间（帧时间减去本局开始时间）；立方体的换向时间使用物理时钟的模拟时间。
+    """
+
+    def __init__(self, cfg, pool, seed=None):
+        self.pool = pool
+        self.rng = np.random.default_rng(seed)
+        self.configure(cfg)
+        self.round = None   # 当前局（局数, 开始时间），变化时回收所有立方体
+        self.pending = []   # 本局尚未生成的波次（按开始时间倒序，末尾的最先到）
+        self.expiry = []    # 小根堆 [(到期时间, 句柄)]，存在时间为 0 的立方体不在其中
+        self.live = set()   # 场内的句柄
+        self.spawned = 0    # 累计生成的立方体数
+        self.shortfall = 0  # 池用完而没有生成的立方体数
+
+    def configure(self, cfg):
+        self.schedule = cfg.waves.schedule
+        self.spawn_distance = cfg.waves.spawn_distance
+        self.bounds = cfg.game_rules.boundaries
+        self.height = cfg.reference_cubes.appearance.height
+        self.speed = float(cfg.cube_movement.base_speed)
+        direction_change = cfg.cube_movement.direction_change
+        self.change_interval = (float(direction_change.min_interval), float(direction_change.max_interval))
+
+    def update(self, state, sim_time):
+        """按规则状态推进波次，返回本次生成的波次 [(波次配置, 实际生成数)]"""
+        round_key = (state.current_game, state.start_time)
+        if round_key != self.round:
+            self.round = round_key
+            self.release(list(self.live), sim_time)
+            self.expiry.clear()
+            self.pending = sorted((wave for wave in self.schedule if wave.round == state.current_game),
+                                  key=lambda wave: wave.at, reverse=True)
+
+        expired = []
+        while self.expiry and self.expiry[0][0] <= state.time:
+            expired.append(heapq.heappop(self.expiry)[1])
+        self.release(expired, sim_time)
+
+        spawned = []
+        elapsed = state.time - state.start_time
+        while self.pending and self.pending[-1].at <= elapsed:
+            wave = self.pending.pop()
+            spawned.append((wave, self.spawn(wave, state, sim_time)))
+        return spawned
+
+    def spawn(self, wave, state, sim_time):
+        # 在角色周围的环形区域内（裁剪到边界之内）生成一波立方体，返回实际生成数
+        handles = self.pool.acquire(wave.count)
+        self.shortfall += wave.count - len(handles)
+        n = len(handles)
+        if n == 0:
+            return 0
+        rng = self.rng
+        angles = rng.uniform(0, 2 * math.pi, n)
+        distances = rng.uniform(self.spawn_distance[0], self.spawn_distance[1], n)
+        x = np.clip(state.position[0] + np.cos(angles) * distances, *self.bounds.x)
+        y = np.clip(state.position[1] + np.sin(angles) * distances, *self.bounds.y)
+        positions = np.column_stack([x, y, np.full(n, self.height)])
+
+        directions = rng.uniform(0, 2 * math.pi, n)
+        velocities = np.column_stack([np.cos(directions), np.sin(directions)]) * self.speed
+        next_change = sim_time + rng.uniform(self.change_interval[0], self.change_interval[1], n)
+        self.pool.swarm.place(handles, positions, velocities, next_change, sim_time)
+
+        self.live.update(handles)
+        if wave.lifetime > 0:
+            expires = state.time + wave.lifetime
+            for handle in handles:
+                heapq.heappush(self.expiry, (expires, handle))
+        self.spawned += n
+        return n
+
+    def release(self, handles, sim_time):
+        handles = [handle for handle in handles if handle in self.live]
+        self.live.difference_update(handles)
+        self.pool.release(handles, sim_time)
+
+    def resync(self, state):
+        # 恢复快照后按立方体池的实际状态重建：场内的立方体留到本局结束，本局已经过的波次不再生成
+        self.round = (state.current_game, state.start_time)
+        parked = self.pool.parked()
+        self.live = set(self.pool.handles[~parked].tolist())
+        self.pool.free = self.pool.handles[parked][::-1].tolist()
+        self.expiry.clear()
+        elapsed = state.time - state.start_time
+        self.pending = sorted((wave for wave in self.schedule
+                               if wave.round == state.current_game and wave.at > elapsed),
+                              key=lambda wave: wave.at, reverse=True)
@@ -0,0 +1,314 @@
+import math
+
+import numpy as np
+from panda3d.core import GeomNode, NodePath
+
+from cube_render import InstancedCubeRenderer
+from geometry import make_box_geom, make_quad_geom, make_grid_geom, flatten_static
+
+
+class Chunk:
+    """一个地形块：压平后的地面和网格线，以及块内参考立方体的节点或实例化渲染器"""
+    __slots__ = ('key', 'root', 'rows', 'cube_nodes', 'cube_renderer', 'visible')
+
+    def __init__(self, key, root, rows):
+        self.key = key
+        self.root = root
+        self.rows = rows           # 块内立方体在 CubeSwarm 中的行号（None 表示全部）
+        self.cube_nodes = []       # 与 rows 一一对应
+        self.cube_renderer = None
+        self.visible = None        # 超出视距时隐藏的立方体（None 表示全部显示）
+
+
+class ChunkedWorld:
+    """按块坐标管理地形、网格线和参考立方体，只保留玩家附近的块
+
+    立方体的状态始终保存在 CubeSwarm 的数组中，卸载块只释放场景图节点，
+    并把块内立方体移出模拟（冻结），重新加载时从原来的状态继续。
+    不分块时整个地形和所有立方体作为一个常驻的块；分块时 resident 中的立方体（立方体池）单独作为一个常驻的块。
+    立方体增删后（行号变化）重新分组并重建已加载的块。
+    创建时不加载任何块，由 update 一次加载完，或由 load_steps 分多次加载。
+    """
+
+    # 分步加载时每次创建的立方体节点数
+    LOAD_BATCH = 256
+    # 常驻块（立方体池）的块坐标
+    RESIDENT = 'resident'
+
+    def __init__(self, parent, cfg, swarm, make_cube, instanced, with_geometry, need_nodes, resident=()):
+        self.parent = parent
+        self.terrain_cfg = cfg.terrain
+        self.world_cfg = cfg.world
+        self.appearance = cfg.reference_cubes.appearance
+        self.batch_size = cfg.reference_cubes.rendering.batch_size
+        self.swarm = swarm
+        self.make_cube = make_cube
+        self.instanced = instanced
+        self.with_geometry = with_geometry
+        self.need_nodes = need_nodes
+        # 常驻的立方体（句柄）：不按位置分块，始终加载并参与模拟（立方体池在场内外移动，所属的块会变）
+        self.resident = np.asarray(resident, dtype=np.int64)
+
+        self.chunks = {}        # 已加载的块：块坐标 -> Chunk
+        self.center = None      # 上次更新时玩家所在的块
+        self.hidden_count = 0   # 超出视距而隐藏的立方体数
+
+        (x_min, x_max), (y_min, y_max) = self.terrain_cfg.size.x, self.terrain_cfg.size.y
+        self.origin = (x_min, y_min)
+
+        if not self.world_cfg.chunked:
+            # 整个世界只有一个块，常驻不卸载
+            self.size = None
+            self._group_cubes()
+            return
+
+        self.size = float(self.world_cfg.chunk_size)
+        self.load_radius = self.world_cfg.load_radius
+        self.unload_radius = self.world_cfg.unload_radius
+
+        # 地形覆盖的块坐标范围
+        self.terrain_keys = (
+            (0, math.ceil((x_max - x_min) / self.size) - 1),
+            (0, math.ceil((y_max - y_min) / self.size) - 1),
+        )
+
+        # 开始时只模拟已加载块内的立方体
+        self._group_cubes()
+        swarm.set_active(np.zeros(0, dtype=np.intp))
+
+    def _group_cubes(self):
+        # 立方体按巡逻中心（初始位置）分组到块（只在初始化和立方体增删后计算）
+        self.cubes_version = (self.swarm.version, self.swarm.count)
+        if self.size is None:
+            return
+        self.resident_rows = np.sort(self.swarm.rows_of(self.resident)) if len(self.resident) else None
+        grouped = np.arange(self.swarm.count)
+        if self.resident_rows is not None:
+            grouped = np.delete(grouped, self.resident_rows)
+        keys = self.key_of(self.swarm.initial_positions[grouped, :2])
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        order = grouped[np.argsort(inverse.ravel(), kind='stable')]
+        bounds = np.cumsum(np.bincount(inverse.ravel(), minlength=len(unique)))
+        self.cube_rows = {
+            (int(kx), int(ky)): rows
+            for (kx, ky), rows in zip(unique, np.split(order, bounds[:-1]))
+        }
+
+    def _check_cubes(self):
+        # 块内缓存的行号在立方体增删后失效，使用前先检查
+        if self.cubes_version != (self.swarm.version, self.swarm.count):
+            self.refresh()
+
+    def refresh(self):
+        # 立方体增删后重新分组，重建已加载的块（节点列表和实例缓冲按行号对应）
+        keys = list(self.chunks)
+        for key in keys:
+            self._unload(key)
+        self._group_cubes()
+        for key in keys:
+            if self.size is None or self._exists(key):
+                for _ in self._load_key(key):
+                    pass
+        self._update_active()
+
+    def key_of(self, xy):
+        return np.floor((np.asarray(xy) - self.origin) / self.size).astype(np.int64)
+
+    def update(self, x, y):
+        # 玩家进入新的块时加载周围的块、卸载过远的块；返回是否有变化
+        changed = False
+        for _ in self.load_steps(x, y):
+            changed = True
+        return changed
+
+    def load_steps(self, x, y):
+        """按玩家位置加载和卸载块的生成器：每创建一批立方体节点 yield 一次完成比例（0~1）
+
+        没有变化时不 yield。全部完成后才更新参与模拟的行。
+        """
+        self._check_cubes()
+        if self.size is None:
+            keys = [] if self.chunks else [(0, 0)]
+            unload = []
+        else:
+            center = tuple(int(k) for k in self.key_of((x, y)))
+            if center == self.center:
+                return
+            self.center = center
+            cx, cy = center
+            unload = [key for key in self.chunks if key != self.RESIDENT
+                      and max(abs(key[0] - cx), abs(key[1] - cy)) > self.unload_radius]
+            r = self.load_radius
+            keys = [(kx, ky)
+                    for kx in range(cx - r, cx + r + 1)
+                    for ky in range(cy - r, cy + r + 1)
+                    if (kx, ky) not in self.chunks and self._exists((kx, ky))]
+            if self.resident_rows is not None and self.RESIDENT not in self.chunks:
+                keys.append(self.RESIDENT)
+        if not unload and not keys:
+            return
+
+        for key in unload:
+            self._unload(key)
+        yield 0.0
+
+        # 工作量按块数加上需要创建节点的立方体数估计
+        sizes = [self._cube_count(key) if self.need_nodes else 0 for key in keys]
+        total = len(keys) + sum(sizes)
+        done = 0
+        for key, size in zip(keys, sizes):
+            for created in self._load_key(key):
+                yield (done + created) / total
+            done += size + 1
+            yield done / total
+        self._update_active()
+
+    def _update_active(self):
+        if self.size is None:
+            return
+        rows = [chunk.rows for chunk in self.chunks.values()]
+        self.swarm.set_active(np.sort(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.intp))
+
+    def _exists(self, key):
+        if key == self.RESIDENT:
+            return self.resident_rows is not None
+        (kx0, kx1), (ky0, ky1) = self.terrain_keys
+        return (kx0 <= key[0] <= kx1 and ky0 <= key[1] <= ky1) or key in self.cube_rows
+
+    def _cube_count(self, key):
+        if self.size is None:
+            return self.swarm.count
+        if key == self.RESIDENT:
+            return len(self.resident_rows)
+        return len(self.cube_rows.get(key, ()))
+
+    def _load_key(self, key):
+        # 加载一个块的生成器：每创建一批立方体节点 yield 一次已创建的数量
+        (x_min, x_max), (y_min, y_max) = self.terrain_cfg.size.x, self.terrain_cfg.size.y
+        if self.size is None:
+            return self._load(key, (x_min, x_max), (y_min, y_max), None)
+        if key == self.RESIDENT:
+            # 常驻块没有地面
+            return self._load(key, (0, 0), (0, 0), self.resident_rows)
+        # 块的地面范围裁剪到地形范围之内（地形外只有立方体）
+        x0 = self.origin[0] + key[0] * self.size
+        y0 = self.origin[1] + key[1] * self.size
+        x_range = (max(x0, x_min), min(x0 + self.size, x_max))
+        y_range = (max(y0, y_min), min(y0 + self.size, y_max))
+        rows = self.cube_rows.get(key, np.zeros(0, dtype=np.intp))
+        return self._load(key, x_range, y_range, rows)
+
+    def _load(self, key, x_range, y_range, rows):
+        # 块在全部创建完后才加入 chunks（未完成的块不参与同步）
+        root = self.parent.attachNewNode('chunk_resident' if key == self.RESIDENT else f'chunk_{key[0]}_{key[1]}')
+        chunk = Chunk(key, root, rows)
+
+        if x_range[0] < x_range[1] and y_range[0] < y_range[1]:
+            # 地面和网格线使用块内局部坐标，所有完整的块共享同一份缓存网格
+            x0, y0 = x_range[0], y_range[0]
+            local_x = (0.0, x_range[1] - x0)
+            local_y = (0.0, y_range[1] - y0)
+            terrain = GeomNode('terrain')
+            terrain.addGeom(make_quad_geom(local_x, local_y, -1, self.terrain_cfg.color, name='terrain'))
+            # 网格线略高于地面，半透明白色
+            grid = NodePath(GeomNode('grid'))
+            grid.node().addGeom(make_grid_geom(local_x, local_y, self.terrain_cfg.grid_size, -0.9, (1, 1, 1, 0.2)))
+            grid.setTransparency(True)
+
+            # 静态部分合并压平后再移到块的位置（不把变换烘焙进顶点，保持网格共享）
+            tile = flatten_static(root, [NodePath(terrain), grid], name='tile')
+            tile.setPos(x0, y0, 0)
+
+        colors = self.swarm.colors if rows is None else self.swarm.colors[rows]
+        if self.need_nodes:
+            # 实例化模式下每个立方体只保留碰撞节点，几何体统一由渲染器绘制
+            for i, color in enumerate(colors.tolist(), 1):
+                cube = self.make_cube(with_geometry=self.with_geometry)
+                cube.setScale(self.appearance.scale)
+                cube.setColor(*color)
+                cube.reparentTo(root)
+                chunk.cube_nodes.append(cube)
+                if i % self.LOAD_BATCH == 0:
+                    yield i
+        if self.instanced and len(colors):
+            chunk.cube_renderer = InstancedCubeRenderer(
+                root, make_box_geom(), colors,
+                scale=self.appearance.scale,
+                batch_size=self.batch_size
+            )
+
+        self.chunks[key] = chunk
+        self._sync_nodes(chunk, 1.0)
+
+    def _unload(self, key):
+        # 只释放场景图节点，立方体状态保留在 CubeSwarm 中
+        chunk = self.chunks.pop(key)
+        if chunk.cube_renderer:
+            chunk.cube_renderer.destroy()
+        chunk.root.removeNode()
+
+    @property
+    def cube_node_count(self):
+        return sum(len(chunk.cube_nodes) for chunk in self.chunks.values())
+
+    def sync_collision(self):
+        # 碰撞检测前把所有已加载的节点同步到当前物理步的状态（包括隐藏的节点）
+        self._check_cubes()
+        for chunk in self.chunks.values():
+            self._sync_nodes(chunk, 1.0)
+
+    def sync(self, alpha=1.0, center=None, view_distance=None):
+        # 把插值后的立方体状态写回已加载块的节点或实例缓冲；给出视距时隐藏超出视距的立方体
+        self._check_cubes()
+        self.hidden_count = 0
+        for chunk in self.chunks.values():
+            if not chunk.cube_nodes and not chunk.cube_renderer:
+                continue
+            positions, headings = self.swarm.interpolated(alpha, chunk.rows)
+            visible = None
+            if view_distance is not None:
+                offset = positions[:, :2] - center
+                visible = np.einsum('ij,ij->i', offset, offset) <= view_distance * view_distance
+                self.hidden_count += len(visible) - int(np.count_nonzero(visible))
+            self._set_visible(chunk, visible)
+
+            if chunk.cube_nodes:
+                if visible is None:
+                    self.swarm.sync_nodes(chunk.cube_nodes, positions, headings)
+                else:
+                    # 隐藏的节点不写回变换（逐个节点设置变换是同步的主要开销）
+                    shown = np.flatnonzero(visible)
+                    self.swarm.sync_nodes([chunk.cube_nodes[i] for i in shown.tolist()],
+                                          positions[shown], headings[shown])
+            if chunk.cube_renderer:
+                chunk.cube_renderer.update(positions, headings)
+
+    def _sync_nodes(self, chunk, alpha):
+        if not chunk.cube_nodes and not chunk.cube_renderer:
+            return
+        positions, headings = self.swarm.interpolated(alpha, chunk.rows)
+        self.swarm.sync_nodes(chunk.cube_nodes, positions, headings)
+        if chunk.cube_renderer:
+            chunk.cube_renderer.update(positions, headings)
+
+    @staticmethod
+    def _set_visible(chunk, visible):
+        # 只对显示状态发生变化的立方体调用 show/hide
+        before = chunk.visible
+        if before is None and visible is None:
+            return
+        n = len(chunk.cube_nodes) or chunk.cube_renderer.count
+        old = np.ones(n, dtype=bool) if before is None else before
+        new = np.ones(n, dtype=bool) if visible is None else visible
+        changed = np.flatnonzero(old != new)
+        chunk.visible = visible
+        if not len(changed):
+            return
+        if chunk.cube_nodes:
+            for i in changed.tolist():
+                if new[i]:
+                    chunk.cube_nodes[i].show()
+                else:
+                    chunk.cube_nodes[i].hide()
+        if chunk.cube_renderer:
+            chunk.cube_renderer.set_hidden(~new)